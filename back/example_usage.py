@@ -32,12 +32,13 @@ async def example_text_only():
     async with aiohttp.ClientSession() as session:
         async with session.post("http://localhost:8000/api/chat", json=request_data) as response:
             result = await response.json()
+            data = result.get('data') or {}
             print(f"请求 ID: {result.get('requestId')}")
             print(f"状态: {result.get('message')}")
-            print(f"步骤数: {len(result.get('data', {}).get('steps', []))}")
+            print(f"步骤数: {len(data.get('steps', []))}")
 
             # 打印所有步骤
-            for i, step in enumerate(result.get('data', {}).get('steps', []), 1):
+            for i, step in enumerate(data.get('steps', []), 1):
                 print(f"\n步骤 {i}:")
                 print(f"  内容: {step.get('present_content')}")
                 print(f"  工具: {step.get('tool_type')}")
@@ -69,11 +70,12 @@ async def example_text_and_image():
     async with aiohttp.ClientSession() as session:
         async with session.post("http://localhost:8000/api/chat", json=request_data) as response:
             result = await response.json()
+            data = result.get('data') or {}
             print(f"请求 ID: {result.get('requestId')}")
             print(f"状态: {result.get('message')}")
 
             # 打印关键步骤
-            steps = result.get('data', {}).get('steps', [])
+            steps = data.get('steps', [])
             for step in steps:
                 if step.get('tool_type') == 'AzureOpenAI':
                     print(f"\nAI 响应:")
@@ -113,13 +115,14 @@ async def example_conversation():
     async with aiohttp.ClientSession() as session:
         async with session.post("http://localhost:8000/api/chat", json=request_data) as response:
             result = await response.json()
+            data = result.get('data') or {}
             print(f"请求 ID: {result.get('requestId')}")
-            print(f"总步骤数: {len(result.get('data', {}).get('steps', []))}")
+            print(f"总步骤数: {len(data.get('steps', []))}")
 
             # 计算总耗时
             total_duration = sum(
                 step.get('execution_duration', 0)
-                for step in result.get('data', {}).get('steps', [])
+                for step in data.get('steps', [])
             )
             print(f"总耗时: {total_duration}ms")
 
@@ -181,11 +184,12 @@ async def example_error_handling():
             async with session.post("http://localhost:8000/api/chat", json=request_data) as response:
                 if response.status == 500:
                     result = await response.json()
+                    data = result.get('data') or {}
                     print("✅ 正确捕获了错误")
                     print(f"错误信息: {result.get('message')}")
 
                     # 查找错误步骤
-                    for step in result.get('data', {}).get('steps', []):
+                    for step in data.get('steps', []):
                         if step.get('tool_status') == 'Error':
                             print(f"错误详情: {step.get('observation')}")
                 else:
@@ -226,12 +230,13 @@ async def example_react_mode():
     async with aiohttp.ClientSession() as session:
         async with session.post("http://localhost:8000/api/chat", json=request_data) as response:
             result = await response.json()
+            data = result.get('data') or {}
             print(f"请求 ID: {result.get('requestId')}")
-            print(f"ReAct模式: {result.get('data', {}).get('react_mode')}")
-            print(f"迭代次数: {result.get('data', {}).get('iterations')}")
+            print(f"ReAct模式: {data.get('react_mode')}")
+            print(f"迭代次数: {data.get('iterations')}")
 
             # 打印推理轨迹
-            trace = result.get('data', {}).get('reasoning_trace', [])
+            trace = data.get('reasoning_trace', [])
             print(f"\n推理轨迹 ({len(trace)} 步):")
             for i, step in enumerate(trace[:6], 1):  # 只显示前6步
                 print(f"\n  步骤 {i}:")
@@ -239,7 +244,7 @@ async def example_react_mode():
                 print(f"    内容: {step.get('content', '')[:100]}...")
 
             # 打印最终答案
-            answer = result.get('data', {}).get('answer', '')
+            answer = data.get('answer', '')
             print(f"\n最终答案:")
             print(f"  {answer[:200]}...")
 
@@ -265,9 +270,10 @@ async def example_react_with_image():
     async with aiohttp.ClientSession() as session:
         async with session.post("http://localhost:8000/api/chat", json=request_data) as response:
             result = await response.json()
+            data = result.get('data') or {}
             print(f"请求 ID: {result.get('requestId')}")
 
-            trace = result.get('data', {}).get('reasoning_trace', [])
+            trace = data.get('reasoning_trace', [])
             print(f"\n推理过程 ({len(trace)} 步):")
 
             # 按类型分组显示轨迹
@@ -291,7 +297,7 @@ async def example_react_with_image():
                     print(f"    {i}. {str(obs.get('content', ''))[:80]}...")
 
             print(f"\n  最终答案:")
-            answer = result.get('data', {}).get('answer', '')
+            answer = data.get('answer', '')
             print(f"    {answer[:200]}...")
 
 async def run_all_examples():
@@ -26,6 +26,8 @@ class Settings:
 
     # MCP 配置
     mcp_server_url: str = os.getenv("MCP_SERVER_URL", "https://mcp.api-inference.modelscope.net/af62266fafca44/mcp")
+    # MCP HTTP 请求总超时（秒），默认与 aiohttp 默认值一致（300 秒），长耗时工具不会被提前中断
+    mcp_http_timeout: float = float(os.getenv("MCP_HTTP_TIMEOUT", "300"))
 
     # OpenWeatherMap API 配置
     openweathermap_api_key: str = os.getenv("OPENWEATHERMAP_API_KEY", "")
@@ -37,9 +39,57 @@ class Settings:
     # Chat API 配置（用于获取聊天历史）
     chat_api_base_url: str = os.getenv("CHAT_API_BASE_URL", "http://192.168.106.108:8000")
 
+    # 同时进行中的 LLM 上游请求上限（超出的请求排队等待）
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    # 429 / 5xx 的最大重试次数与指数退避基数（秒）
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    llm_retry_backoff: float = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+    # 是否通过 HTTP/2（httpx[http2]）调用 LLM，并发流复用同一连接；未安装时自动回退 aiohttp
+    llm_http2: bool = os.getenv("LLM_HTTP2", "false").lower() == "true"
+    # 是否统计并记录流式首个片段耗时（TTFT）
+    llm_timing_enabled: bool = os.getenv("LLM_TIMING_ENABLED", "false").lower() == "true"
+    # ReAct 智能体 LLM 请求合批窗口（毫秒，0（默认）表示直接调用，不为每次调用增加等待）与单个窗口的最大请求数；
+    # 窗口只用于合并内容完全相同的并发请求，高并发且重复请求多时再开启
+    llm_batch_window_ms: float = float(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+    llm_batch_max_size: int = int(os.getenv("LLM_BATCH_MAX_SIZE", "16"))
+
+    # MCP 工具结果持久化缓存（跨进程 / 重启共享）："none" 关闭，"disk" 本地目录，"s3" 对象存储（需要 aioboto3）
+    tool_cache_backend: str = os.getenv("TOOL_CACHE_BACKEND", "none").lower()
+    tool_cache_dir: str = os.getenv("TOOL_CACHE_DIR", ".tool_cache")
+    tool_cache_s3_bucket: str = os.getenv("TOOL_CACHE_S3_BUCKET", "")
+    tool_cache_s3_prefix: str = os.getenv("TOOL_CACHE_S3_PREFIX", "mcp-tool-cache/")
+    # 超过该大小（字节）的工具结果转存到上述缓存后端，只返回引用（含预览，需要全文时用
+    # tool_result_cache.resolve_ref 取回）；0（默认）表示不转存。只启用缓存后端不会改变工具返回值
+    tool_result_offload_bytes: int = int(os.getenv("TOOL_RESULT_OFFLOAD_BYTES", "0"))
+
+    # ReAct 历史压缩配置：工具观察结果累计超过预算（估算 token 数）时，
+    # 保留最近 N 次观察原文，其余压缩为摘要
+    react_history_token_budget: int = int(os.getenv("REACT_HISTORY_TOKEN_BUDGET", "8000"))
+    react_history_keep_recent: int = int(os.getenv("REACT_HISTORY_KEEP_RECENT", "2"))
+    # ReAct 工具确认超时（秒）：工具在该时间内未完成时先返回任务凭据（task_id），
+    # 后续可通过 check_task 查询结果；0 表示始终等待工具完成
+    react_tool_ack_timeout: float = float(os.getenv("REACT_TOOL_ACK_TIMEOUT", "0"))
+    # ReAct 技能缓存文件（查询模式 → 工具路由，命中时跳过 LLM 推理）；为空时只保存在内存中
+    react_skill_cache_path: str = os.getenv("REACT_SKILL_CACHE_PATH", "")
+    # ReAct 单轮内并发执行的工具调用上限（模型一次给出多个互不依赖的调用时生效）
+    react_max_concurrent_tools: int = int(os.getenv("REACT_MAX_CONCURRENT_TOOLS", "4"))
+    # ReAct 答案缓存 TTL（秒）：同一用户在相同聊天历史下重复提出的相同问题（规范化后）直接返回缓存的答案与步骤，
+    # 跳过模型与工具调用；未调用工具（答案可能依赖提示词中的当前时间）或调用过非只读工具（见
+    # REACT_READ_ONLY_TOOLS）的运行不缓存，缓存键包含当天日期。0 表示不启用
+    react_answer_cache_ttl: float = float(os.getenv("REACT_ANSWER_CACHE_TTL", "0"))
+    # ReAct 工具预测执行：按历史中"上一个工具调用 → 下一个工具调用"的频率，在等待模型输出时
+    # 提前发起最可能的下一个只读工具调用，模型给出相同调用时直接使用其结果
+    react_speculative_tools: bool = os.getenv("REACT_SPECULATIVE_TOOLS", "false").lower() == "true"
+    # ReAct 只读工具白名单（逗号分隔的工具名）：与 MCP 工具注解 readOnlyHint 为 true 的工具一起，
+    # 是唯一允许预测 / 提前执行、且调用后仍可写入答案缓存的工具；未列出也未声明只读的工具一律视为有副作用
+    react_read_only_tools: str = os.getenv("REACT_READ_ONLY_TOOLS", "")
+    # ReAct 流式读取模型输出：输出中的 action 一完整就提前发起（只读）工具调用，不等待生成结束
+    react_stream_actions: bool = os.getenv("REACT_STREAM_ACTIONS", "false").lower() == "true"
+
     # 应用配置
     app_host: str = os.getenv("APP_HOST", "0.0.0.0")
     app_port: int = int(os.getenv("APP_PORT", "8000"))
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
 
     # 模型选择配置
     use_model: str = os.getenv("USE_MODEL", "doubao")  # "gemini"、"gpt4.1" 或 "doubao"
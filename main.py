@@ -8,15 +8,41 @@ import asyncio
 from datetime import datetime
 import time
 import base64
+import hashlib
 import os
-
-from services.azure_openai_service import AzureOpenAIService
+import sys
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+from services.azure_openai_service import AzureOpenAIService, close_shared_connector
+from services.mcp_client import shutdown_session as shutdown_mcp_session
+from services.tool_result_cache import close_persistent_cache
 from services.streaming_service import StreamingService
-from services.true_react_agent import true_react_agent
+from services.true_react_agent import true_react_agent, create_llm_service
 from config import settings
 
 app = FastAPI(title="Chat API with Gemini-3-Flash-Preview", version="1.0.0")
 
+logger = logging.getLogger(__name__)
+
+
+def setup_logging() -> QueueListener:
+    """
+    配置日志：事件循环内只把日志记录放入队列，
+    实际的格式化和 stdout 写入由后台线程（QueueListener）完成，避免阻塞事件循环
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root_logger = logging.getLogger()
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.setLevel(settings.log_level.upper())
+    listener.start()
+    return listener
+
 # Note: CORS middleware removed due to compatibility issues
 # For production, consider using a reverse proxy for CORS
 
@@ -24,12 +50,16 @@ app = FastAPI(title="Chat API with Gemini-3-Flash-Preview", version="1.0.0")
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化 ReAct Agent 和 MCP 工具"""
+    app.state.log_listener = setup_logging()
     print("\n" + "=" * 80)
     print("🚀 应用启动中...")
     print("=" * 80 + "\n")
     print("📋 正在初始化 ReAct Agent...")
     try:
-        await true_react_agent.initialize()
+        # 进程内共享一个模型服务（复用连接池），后台预热 DNS + TLS，与 MCP 初始化并行
+        app.state.llm_service = create_llm_service()
+        app.state.llm_service.start_warmup()
+        await true_react_agent.initialize(llm_service=app.state.llm_service)
         print("✅ ReAct Agent 初始化成功")
         print(f"✅ 已注册 {len(true_react_agent.tools)} 个工具")
         print("\n📦 可用工具列表:")
@@ -53,11 +83,25 @@ async def shutdown_event():
     try:
         # 清理 MultiMCP 客户端资源
         if true_react_agent.multi_mcp_client:
+            await true_react_agent.multi_mcp_client.aclose()
             print("✅ MCP 客户端资源清理完成")
+        # 关闭共享的模型服务连接池
+        llm_service = getattr(app.state, "llm_service", None)
+        if llm_service is not None:
+            await llm_service.aclose()
+            print("✅ 模型服务连接池已关闭")
+        await true_react_agent.aclose()
+        await close_shared_connector()
+        await shutdown_mcp_session()
+        await close_persistent_cache()
         print("✅ 应用关闭完成")
     except Exception as e:
         print(f"⚠️  关闭时发生错误: {e}")
     print("=" * 80 + "\n")
+    # 停止日志后台线程（会先刷出队列中剩余的日志）
+    log_listener = getattr(app.state, "log_listener", None)
+    if log_listener is not None:
+        log_listener.stop()
 
 class ContentItem(BaseModel):
     type: str
@@ -108,6 +152,49 @@ class ChatResponse(BaseModel):
     data: Dict[str, Any]
 
 
+def _identity_display(tool_name: str, tool_args: Any) -> str:
+    """普通工具直接使用工具名称展示"""
+    return tool_name
+
+
+def _mcp_display(tool_name: str, tool_args: Any) -> str:
+    """mcp_call_tool 显示具体的 MCP 工具名称，如 mcp_call_tool(get_weather)"""
+    if not isinstance(tool_args, dict):
+        return tool_name
+    # 从 arguments 中提取实际的 MCP 工具名称，也可能嵌套在 arguments.arguments 中
+    actual_tool_name = tool_args.get('tool_name', '')
+    if not actual_tool_name:
+        nested_args = tool_args.get('arguments')
+        if isinstance(nested_args, dict):
+            actual_tool_name = nested_args.get('tool_name', '')
+    return f"{tool_name}({actual_tool_name})" if actual_tool_name else tool_name
+
+
+# 工具名称 -> 展示名称计算函数；返回 None 表示该步骤不对外输出
+_DISPLAY = {
+    'finish': lambda tool_name, tool_args: None,
+    'mcp_call_tool': _mcp_display,
+}
+
+
+def _dedupe_image_urls(image_urls: List[str]) -> List[str]:
+    """
+    按内容哈希去除同一请求中重复的图像，保持原有顺序
+
+    base64 data URL 只对逗号后的负载做哈希，
+    这样仅 MIME 前缀不同（如 image/png 与 image/jpeg）的同一张图也会被合并
+    """
+    seen = set()
+    unique_urls = []
+    for url in image_urls:
+        payload = url.partition(',')[2] if url.startswith('data:') else url
+        digest = hashlib.blake2b(payload.encode(), digest_size=16).digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique_urls.append(url)
+    return unique_urls
+
+
 async def handle_react_chat(request: ChatRequest, request_id: str):
     """
     处理ReAct模式聊天请求（真正的流式输出）
@@ -144,6 +231,8 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
                         has_image = True
 
             query_text = " ".join(query_parts)
+            # 去掉重复粘贴的相同图像，避免模型重复分析同一张图
+            image_urls = _dedupe_image_urls(image_urls)
 
             # 验证输入
             if not has_text and not has_image:
@@ -161,12 +250,10 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
             if request.metadata and 'user' in request.metadata:
                 user_metadata = request.metadata['user']
 
-            print(f"\n{'='*60}")
-            print(f"处理请求 (模式: {'文本' if has_text else ''}{' + ' if has_text and has_image else ''}{'图像' if has_image else ''})")
-            print(f"输入: {', '.join(input_desc)}")
-            if user_metadata:
-                print(f"用户: {user_metadata.get('username', 'N/A')} ({user_metadata.get('city', 'N/A')})")
-            print(f"{'='*60}\n")
+            if logger.isEnabledFor(logging.INFO):
+                mode = " + ".join(m for m, on in (("文本", has_text), ("图像", has_image)) if on)
+                user_desc = f"{user_metadata.get('username', 'N/A')} ({user_metadata.get('city', 'N/A')})" if user_metadata else "N/A"
+                logger.info("处理请求 %s 模式=%s 输入=%s 用户=%s", request_id, mode, ", ".join(input_desc), user_desc)
 
             # 发送初始响应头（timestamp）
             # 已注释：去掉最开始的空steps响应
@@ -207,19 +294,9 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
                         present_text = f"{str(content)}"
 
                     # 对于 mcp_call_tool，显示具体的 MCP 工具名称
-                    display_tool_name = tool_name
-                    if tool_name == 'mcp_call_tool' and isinstance(tool_args, dict):
-                        # 从 arguments 中提取实际的 MCP 工具名称
-                        actual_tool_name = tool_args.get('tool_name', '')
-                        if actual_tool_name:
-                            display_tool_name = f"{tool_name}({actual_tool_name})"
-                        else:
-                            # 也可能是嵌套在 arguments.arguments 中
-                            nested_args = tool_args.get('arguments', {})
-                            if isinstance(nested_args, dict) and 'tool_name' in nested_args:
-                                actual_tool_name = nested_args.get('tool_name', '')
-                                if actual_tool_name:
-                                    display_tool_name = f"{tool_name}({actual_tool_name})"
+                    display_tool_name = _DISPLAY.get(tool_name, _identity_display)(tool_name, tool_args)
+                    if display_tool_name is None:
+                        continue
 
                     # Start 步骤
                     start_step = ProcessingStep(
@@ -258,19 +335,9 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
                     tool_args = action.get('tool_args', {})
 
                     # 对于 mcp_call_tool，显示具体的 MCP 工具名称
-                    display_tool_name = tool_name
-                    if tool_name == 'mcp_call_tool' and isinstance(tool_args, dict):
-                        # 从 arguments 中提取实际的 MCP 工具名称
-                        actual_tool_name = tool_args.get('tool_name', '')
-                        if actual_tool_name:
-                            display_tool_name = f"{tool_name}({actual_tool_name})"
-                        else:
-                            # 也可能是嵌套在 arguments.arguments 中
-                            nested_args = tool_args.get('arguments', {})
-                            if isinstance(nested_args, dict) and 'tool_name' in nested_args:
-                                actual_tool_name = nested_args.get('tool_name', '')
-                                if actual_tool_name:
-                                    display_tool_name = f"{tool_name}({actual_tool_name})"
+                    display_tool_name = _DISPLAY.get(tool_name, _identity_display)(tool_name, tool_args)
+                    if display_tool_name is None:
+                        continue
 
                     # 格式化observation以提高可读性
                     tool_result = action.get('tool_result')
@@ -318,39 +385,10 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
                 elif output_type == 'final_answer':
                     # 处理最终答案
                     final_answer = react_output.get('answer', '')
-                    reasoning_trace = react_output.get('steps', [])
                     iterations = react_output.get('iterations', 0)
 
-                    # 记录模型输出和推理轨迹
-                    print(f"\n{'='*80}")
-                    print(f"[MODEL FINAL OUTPUT]")
-                    print(f"{'='*80}")
-                    print(f"最终答案: {final_answer}")
-                    print(f"推理轨迹 ({iterations} 次迭代):")
-                    for step in reasoning_trace:
-                        step_type = step.get('type', 'unknown')
-                        iteration = step.get('iteration', 0)
-                        tool_name = step.get('tool_name', '')
-                        if step_type == 'action':
-                            content = step.get('content', {})
-                            thought = content.get('thought', '') if isinstance(content, dict) else str(content)
-                            print(f"\n  [迭代 {iteration}] 思考: {thought[:200]}{'...' if len(str(thought)) > 200 else ''}")
-                            print(f"  [迭代 {iteration}] 行动: {tool_name}")
-                        elif step_type == 'observation':
-                            tool_result = step.get('tool_result', {})
-                            print(f"  [迭代 {iteration}] 观察: {json.dumps(tool_result, ensure_ascii=False)[:200]}{'...' if len(str(tool_result)) > 200 else ''}")
-                    print(f"{'='*80}\n")
-
-                    # 记录 finish 工具信息（包含present_content）
-                    print(f"\n{'='*80}")
-                    print(f"[FINISH TOOL]")
-                    print(f"{'='*80}")
-                    print(f"工具名称: Finish")
-                    print(f"present_content: {final_answer}")
-                    print(f"工具参数: {{'answer': '{final_answer[:100]}{'...' if len(final_answer) > 100 else ''}'}}")
-                    print(f"执行状态: 成功")
-                    print(f"总迭代次数: {iterations}")
-                    print(f"{'='*80}\n")
+                    logger.info("请求 %s 完成，共 %s 次迭代", request_id, iterations)
+                    logger.debug("请求 %s 最终答案: %s", request_id, final_answer)
 
                     finish_step = {
                         "message_id": str(uuid.uuid4()),
@@ -370,15 +408,10 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
                     }
                     yield json.dumps(response_with_finish, ensure_ascii=False, separators=(',', ':')) + '\n'
 
-                    # 显示推理轨迹
-                    print(f"\n{'='*60}")
-                    print(f"执行完成")
-                    print(f"{'='*60}\n")
-
                     break  # 完成，退出循环
 
         except Exception as e:
-            print(f"\n❌ 错误: {str(e)}\n")
+            logger.error("请求 %s 处理失败: %s", request_id, e)
 
             # 错误步骤
             error_steps = [
@@ -403,10 +436,15 @@ async def handle_react_chat(request: ChatRequest, request_id: str):
             }
             yield json.dumps(error_response, ensure_ascii=False, separators=(',', ':')) + '\n'
 
-    # 返回StreamingResponse，使用异步生成器
+    # 返回StreamingResponse，使用异步生成器（每行一个 JSON，即 NDJSON）
+    # 关闭代理层缓冲，保证每个步骤产生后立即送达客户端
     return StreamingResponse(
         stream_steps(),
-        media_type="application/json"
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
     )
 
 
@@ -0,0 +1,361 @@
+"""
+MCP 测试脚本共用的工具函数（test_mcp_client.py / test_mcp_users.py）
+包括 FastMCP 客户端的建立与探测、工具调用结果的格式化和工具描述的生成
+需要安装: pip install fastmcp>=2.8.0,<2.12.0
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache, singledispatch
+from typing import Any, Dict
+
+try:
+    # 尝试使用新的 API
+    try:
+        from fastmcp import streamable_http_client
+        USE_NEW_API = True
+    except ImportError:
+        USE_NEW_API = False
+        from fastmcp import Client
+        from fastmcp.client.transports import StreamableHttpTransport
+except ImportError:
+    print("❌ 错误: 未安装 fastmcp")
+    print("   请运行: pip install fastmcp>=2.8.0,<2.12.0")
+    exit(1)
+
+try:
+    from .fast_json import json_loads, json_dumps_pretty, JSONDecodeError
+except ImportError:
+    # 直接运行脚本时的备选方案
+    from fast_json import json_loads, json_dumps_pretty, JSONDecodeError
+
+# 尝试导入 mcp.types（按类型直接分派 CallToolResult / TextContent）
+try:
+    from mcp.types import CallToolResult, TextContent
+    HAS_MCP_TYPES = True
+except ImportError:
+    HAS_MCP_TYPES = False
+
+# 尝试导入 msgspec（未注册类型的通用转换）
+try:
+    import msgspec
+    HAS_MSGSPEC = True
+except ImportError:
+    HAS_MSGSPEC = False
+
+log = logging.getLogger("mcp_test")
+
+
+class _Pretty:
+    """延迟格式化：只有日志实际输出时才序列化为缩进 JSON"""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json_dumps_pretty(self.obj)
+
+
+# 已是 JSON 原生类型、无需转换的值（按精确类型比较，用 frozenset 做成员测试）
+_NATIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+# 嵌套超过该深度的值不再展开（防止自引用结构无限展开）
+_MAX_DEPTH = 256
+
+
+def format_result(result):
+    """格式化结果，将 CallToolResult、TextContent 等对象转换为可序列化的格式"""
+    # 用显式栈代替递归：遇到 dict / list 先创建输出容器，子节点入栈后原地填充，
+    # 深层嵌套的响应不会触发 RecursionError
+    root = [None]
+    stack = [(root, 0, result, 0)]
+    while stack:
+        parent, key, value, depth = stack.pop()
+        # 工具响应绝大多数已是 JSON 原生结构：按精确类型直接处理，跳过分派与属性探测
+        value_type = type(value)
+        if value_type in _NATIVE_TYPES:
+            parent[key] = value
+        elif isinstance(value, (dict, list)):
+            children = value.values() if isinstance(value, dict) else value
+            # 元素都是基本类型时无需逐个转换
+            if all(type(item) in _NATIVE_TYPES for item in children):
+                parent[key] = value
+            elif depth >= _MAX_DEPTH:
+                parent[key] = "..."
+            elif isinstance(value, dict):
+                # 预先放入所有键，保持原有顺序
+                out = parent[key] = dict.fromkeys(value)
+                stack.extend((out, k, v, depth + 1) for k, v in value.items())
+            else:
+                out = parent[key] = [None] * len(value)
+                stack.extend((out, i, v, depth + 1) for i, v in enumerate(value))
+        else:
+            parent[key] = _format_other(value)
+    return root[0]
+
+
+@singledispatch
+def _format_other(result):
+    """非原生类型（及原生类型的子类）按类型分派"""
+    # 未注册的类型：优先用 msgspec 转换（dataclass / __slots__ 等），不支持时再按属性探测
+    if HAS_MSGSPEC:
+        try:
+            return msgspec.to_builtins(result, str_keys=True)
+        except TypeError:
+            pass
+    return _format_object(result)
+
+
+def _format_native(result):
+    # 基本类型的子类（如 IntEnum）原样返回
+    return result
+
+
+for _native_type in _NATIVE_TYPES:
+    _format_other.register(_native_type, _format_native)
+
+
+if HAS_MCP_TYPES:
+    @_format_other.register(CallToolResult)
+    def _format_call_tool_result(result):
+        return {
+            "content": format_result(result.content),
+            "isError": result.isError,
+        }
+
+    @_format_other.register(TextContent)
+    def _format_text_content(result):
+        return {
+            "type": "text",
+            "text": result.text,
+        }
+
+
+if HAS_MSGSPEC:
+    class _CallToolResultShim(msgspec.Struct):
+        """按属性读取 CallToolResult 形状的对象"""
+        content: Any = None
+        isError: bool = False
+
+    class _TextContentShim(msgspec.Struct):
+        """按属性读取 TextContent 形状的对象"""
+        text: str = ""
+
+# 对象类型 → 对应的 shim（None 表示不适用），每个类只做一次属性探测
+_SHIM_BY_TYPE: Dict[type, Any] = {}
+
+
+def _shim_for(result):
+    result_type = type(result)
+    try:
+        return _SHIM_BY_TYPE[result_type]
+    except KeyError:
+        pass
+    if hasattr(result, 'content'):
+        shim = _CallToolResultShim
+    elif hasattr(result, 'text'):
+        shim = _TextContentShim
+    else:
+        shim = None
+    _SHIM_BY_TYPE[result_type] = shim
+    return shim
+
+
+def _format_object(result):
+    """其他对象：按属性探测转换"""
+    # 有 msgspec 时按类型缓存的 shim 一次性读取属性；字段类型不符时退回逐个探测
+    if HAS_MSGSPEC:
+        shim = _shim_for(result)
+        if shim is not None:
+            try:
+                converted = msgspec.convert(result, shim, from_attributes=True)
+            except msgspec.ValidationError:
+                converted = None
+            if type(converted) is _CallToolResultShim:
+                return {
+                    "content": format_result(converted.content),
+                    "isError": converted.isError,
+                }
+            if type(converted) is _TextContentShim:
+                return {
+                    "type": "text",
+                    "text": converted.text,
+                }
+
+    # 处理 CallToolResult 对象
+    if hasattr(result, 'content'):
+        formatted_content = format_result(result.content)
+        return {
+            "content": formatted_content,
+            "isError": getattr(result, 'isError', False),
+        }
+    
+    # 处理 TextContent 对象
+    if hasattr(result, 'text'):
+        return {
+            "type": "text",
+            "text": getattr(result, 'text', str(result)),
+        }
+    
+    # 处理其他有 __dict__ 的对象
+    if hasattr(result, '__dict__'):
+        return {key: format_result(value) for key, value in result.__dict__.items()}
+    
+    # 处理其他对象，尝试获取常见属性
+    if hasattr(result, '__class__'):
+        # 尝试获取对象的常见属性
+        obj_dict = {}
+        for attr in ['text', 'content', 'data', 'value', 'message', 'error']:
+            if hasattr(result, attr):
+                obj_dict[attr] = format_result(getattr(result, attr))
+        if obj_dict:
+            return obj_dict
+    
+    # 最后尝试转换为字符串
+    return str(result)
+
+
+_NL = "\n"
+# FastMCP 工具对象可能使用 inputSchema 或 input_schema
+_SCHEMA_ATTRS = ("inputSchema", "input_schema", "schema", "parameters")
+
+
+@lru_cache(maxsize=32)
+def _schema_attr_for(cls: type):
+    """工具类上定义的 schema 属性名（含 pydantic 字段），每个类只探测一次；没有时返回 None"""
+    fields = getattr(cls, 'model_fields', None) or getattr(cls, '__fields__', None) or {}
+    for attr_name in _SCHEMA_ATTRS:
+        if attr_name in fields or hasattr(cls, attr_name):
+            return attr_name
+    return None
+
+
+def format_tools_for_llm(tool) -> str:
+    args_desc = []
+    
+    attr_name = _schema_attr_for(type(tool))
+    schema = getattr(tool, attr_name, None) if attr_name else None
+    if schema is None:
+        # 类上未声明（如实例属性）：逐个探测
+        for attr_name in _SCHEMA_ATTRS:
+            schema = getattr(tool, attr_name, None)
+            if schema is not None:
+                break
+    
+    # 如果 schema 是对象而非字典，尝试转换
+    if schema is not None and hasattr(schema, '__dict__'):
+        schema = vars(schema) if not isinstance(schema, dict) else schema
+    
+    # 如果 schema 有 model_dump 方法（Pydantic 模型）
+    if schema is not None and hasattr(schema, 'model_dump'):
+        schema = schema.model_dump()
+    
+    if isinstance(schema, dict) and "properties" in schema:
+        properties = schema["properties"]
+        required = schema.get("required", [])
+        for param_name, param_info in properties.items():
+            if not isinstance(param_info, dict):
+                param_info = getattr(param_info, '__dict__', {})
+            desc = param_info.get('description', 'No description')
+            arg_desc = f"- {param_name}: {desc}"
+            if param_name in required:
+                arg_desc += " (required)"
+            args_desc.append(arg_desc)
+    
+    tool_name = getattr(tool, 'name', 'unknown')
+    tool_desc = getattr(tool, 'description', '')
+    return f"Tool: {tool_name}\nDescription: {tool_desc}\nArguments:\n{_NL.join(args_desc)}"
+
+
+_STATUS = "status"
+
+
+def extract_response_data(formatted_result):
+    """从 FastMCP 返回的格式化结果中提取实际的响应数据"""
+    if not isinstance(formatted_result, dict):
+        return formatted_result
+    
+    # 如果直接包含 status，说明已经是解析后的数据
+    if _STATUS in formatted_result:
+        return formatted_result
+    
+    # 尝试从 content[0].text 中解析 JSON 字符串
+    content = formatted_result.get("content")
+    if isinstance(content, list):
+        try:
+            return json_loads(content[0]["text"])
+        except (IndexError, KeyError, TypeError, JSONDecodeError):
+            pass
+    
+    # 如果无法提取，返回原始格式
+    return formatted_result
+
+
+# list_tools 结果按客户端缓存：{id(client): {工具名: 工具}}
+_TOOLS_CACHE: Dict[int, Dict[str, Any]] = {}
+
+
+def _tool_name(tool) -> str:
+    return tool.get('name', 'unknown') if isinstance(tool, dict) else getattr(tool, 'name', 'unknown')
+
+
+async def _tools(client) -> Dict[str, Any]:
+    """同一客户端只调用一次 list_tools，返回 工具名 → 工具 的索引"""
+    cache = _TOOLS_CACHE.get(id(client))
+    if cache is None:
+        tools = await client.list_tools() or []
+        cache = _TOOLS_CACHE[id(client)] = {_tool_name(tool): tool for tool in tools}
+    return cache
+
+
+def _http2_client_factory(headers=None, timeout=None, auth=None):
+    """MCP 传输使用的 httpx 客户端：安装了 h2 时启用 HTTP/2，并发的工具调用复用同一连接上的多个流"""
+    import httpx
+    try:
+        import h2  # noqa: F401  httpx 的 http2=True 依赖 h2（pip install "httpx[http2]"）
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.AsyncClient(
+        headers=headers,
+        # 与 mcp 默认客户端一致：连接 30 秒，SSE 读取 5 分钟
+        timeout=timeout if timeout is not None else httpx.Timeout(30.0, read=300.0),
+        auth=auth,
+        follow_redirects=True,
+        http2=http2
+    )
+
+
+@asynccontextmanager
+async def open_client(url: str):
+    """建立 MCP 客户端会话（一次 TCP/TLS 握手 + 一次 MCP initialize），探测与测试共用"""
+    # 使用新的 API 或旧的 API
+    # 注意：service_token 需已包含在 url 中
+    if USE_NEW_API:
+        # 使用新的 streamable_http_client API
+        print("使用新的 streamable_http_client API")
+        async with streamable_http_client(url) as client:
+            yield client
+    else:
+        # 使用旧的 API
+        print("使用 StreamableHttpTransport API")
+        transport = StreamableHttpTransport(url=url, httpx_client_factory=_http2_client_factory)
+        async with Client(transport) as client:
+            yield client
+
+
+async def check_mcp_server(client):
+    """通过已建立的 MCP 会话检查服务器是否可用（ping，客户端不支持时用 list_tools）"""
+    try:
+        if hasattr(client, "ping"):
+            await asyncio.wait_for(client.ping(), 5.0)
+        else:
+            # list_tools 的结果会被缓存，测试中不会再请求一次
+            await asyncio.wait_for(_tools(client), 5.0)
+        return True
+    except Exception as e:
+        print(f"   连接错误: {str(e)}")
+        return False
@@ -1,97 +1,564 @@
 import asyncio
+import logging
+import random
+import re
+import socket
+import time
 import aiohttp
-import json
-from typing import List, Dict, Any, Optional, AsyncGenerator
-
-class OpenAIService:
-    """OpenAI 服务类"""
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator
+
+from config import settings
+from services.fast_json import json_loads, json_dumps, json_dumps_bytes, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# 尝试导入 httpx + h2（HTTP/2 多路复用传输，可选）
+try:
+    import httpx
+    import h2  # noqa: F401  httpx 的 http2=True 依赖 h2
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+# 视为网络错误的异常类型
+_NETWORK_ERRORS = (aiohttp.ClientError, httpx.TransportError) if HAS_HTTP2 else (aiohttp.ClientError,)
+
+
+# 新建连接上设置的套接字选项：禁用 Nagle（SSE 小包立即发送），开启 TCP keepalive
+_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+if hasattr(socket, "TCP_KEEPIDLE"):
+    # 空闲 60s 后开始探测，尽早发现被中间设备静默断开的长连接（Linux）
+    _SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+
+
+class _TunedTCPConnector(aiohttp.TCPConnector):
+    """在每个新建连接的套接字上应用 _SOCKET_OPTIONS"""
+
+    async def _wrap_create_connection(self, *args, **kwargs):
+        transport, protocol = await super()._wrap_create_connection(*args, **kwargs)
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            for level, option, value in _SOCKET_OPTIONS:
+                try:
+                    sock.setsockopt(level, option, value)
+                except OSError:
+                    pass
+        return transport, protocol
+
+
+# 进程内共享的连接器：所有服务实例共用连接池和 DNS 缓存，全局限制连接（文件描述符）数量
+_shared_connector: Optional[aiohttp.TCPConnector] = None
+
+
+def _get_shared_connector() -> aiohttp.TCPConnector:
+    """获取共享连接器，首次使用或已关闭时创建（需在事件循环内调用）"""
+    global _shared_connector
+    if _shared_connector is None or _shared_connector.closed:
+        _shared_connector = _TunedTCPConnector(
+            limit=200,
+            limit_per_host=64,
+            keepalive_timeout=75,
+            ttl_dns_cache=300,
+            use_dns_cache=True,
+            enable_cleanup_closed=True
+        )
+    return _shared_connector
+
+
+# 进程内共享的 HTTP/2 客户端（LLM_HTTP2=true 且安装了 httpx[http2] 时使用）
+_shared_http2_client = None
+
+
+def _get_shared_http2_client() -> "httpx.AsyncClient":
+    """获取共享 HTTP/2 客户端，首次使用或已关闭时创建：同一主机的并发流复用一条连接"""
+    global _shared_http2_client
+    if _shared_http2_client is None or _shared_http2_client.is_closed:
+        _shared_http2_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=75),
+            # 每次读 / 写 / 等待连接池各 60 秒、建立连接 10 秒（按操作计时，不是整个请求的总时长）
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+    return _shared_http2_client
+
+
+async def close_shared_connector():
+    """关闭共享连接器及 HTTP/2 客户端（应用关闭时调用，需在各会话关闭之后）"""
+    global _shared_connector, _shared_http2_client
+    if _shared_connector is not None and not _shared_connector.closed:
+        await _shared_connector.close()
+    _shared_connector = None
+    if _shared_http2_client is not None and not _shared_http2_client.is_closed:
+        await _shared_http2_client.aclose()
+    _shared_http2_client = None
+
+
+@lru_cache(maxsize=64)
+def _encode_system_message(content: str) -> bytes:
+    """
+    序列化 system 消息并缓存
+
+    同一请求的多轮 ReAct 迭代使用相同的长系统提示词，只需序列化一次
+    """
+    return json_dumps_bytes({"role": "system", "content": content})
+
+
+def _encode_messages(messages: List[Dict[str, Any]]) -> bytes:
+    """序列化消息列表，开头的 system 消息使用缓存的字节"""
+    if messages:
+        first = messages[0]
+        content = first.get("content")
+        if len(first) == 2 and first.get("role") == "system" and isinstance(content, str):
+            rest = messages[1:]
+            if not rest:
+                return b'[' + _encode_system_message(content) + b']'
+            # json_dumps_bytes(rest) 形如 b'[...]'，去掉开头的 '[' 后拼接
+            return b'[' + _encode_system_message(content) + b',' + json_dumps_bytes(rest)[1:]
+    return json_dumps_bytes(messages)
+
+
+class LLMUpstreamError(Exception):
+    """上游 LLM 接口返回错误状态（或网络错误时 status 为 None）"""
+
+    def __init__(self, provider: str, status: Optional[int], body: str):
+        self.provider = provider
+        self.status = status
+        self.body = body
+        if status is None:
+            message = f"请求 {provider} API 时发生网络错误: {body}"
+        else:
+            message = f"{provider} API 错误: {status} - {body}"
+        super().__init__(message)
+
+
+async def _raise_upstream_error(response: aiohttp.ClientResponse, provider: str):
+    """读取一次错误响应体、释放连接并抛出 LLMUpstreamError"""
+    try:
+        body = await response.text()
+    finally:
+        response.release()
+    raise LLMUpstreamError(provider, response.status, body)
+
+
+class _AdmissionController:
+    """
+    上游并发准入控制：同时进行中的请求数不超过 limit，超出的调用排队等待
+
+    用 Condition + 计数实现（而非 Semaphore），上限可在运行时通过 set_limit 调整
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(int(limit), 1)
+        self.active = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while self.active >= self.limit:
+                await self._cond.wait()
+            self.active += 1
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify(1)
+
+    async def set_limit(self, limit: int):
+        """调整并发上限，调大时唤醒所有等待者重新检查"""
+        async with self._cond:
+            self.limit = max(int(limit), 1)
+            self._cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+
+# 限流 / 上游临时故障时可重试的状态码（其余 4xx 直接报错）
+_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+# 单次重试等待上限（秒）
+_MAX_RETRY_DELAY = 30.0
+# OpenAI 风格的重置时长，如 "1s"、"6m0s"、"250ms"
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After / x-ratelimit-reset-* 头的秒数，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _retry_delay(headers, attempt: int) -> float:
+    """
+    计算第 attempt 次重试前的等待时间
+
+    优先遵循服务端给出的 Retry-After / 限流重置时间，否则使用带抖动的指数退避
+    """
+    for name in ('Retry-After', 'x-ratelimit-reset-requests', 'x-ratelimit-reset'):
+        retry_after = _parse_retry_after(headers.get(name))
+        if retry_after is not None:
+            return min(retry_after, _MAX_RETRY_DELAY)
+    backoff = settings.llm_retry_backoff * (2 ** attempt) + random.random()
+    return min(backoff, _MAX_RETRY_DELAY)
+
+
+# 所有 LLM 服务共享的准入控制（流式请求在整个流期间占用名额）
+_admission = _AdmissionController(settings.llm_max_concurrency)
+
+
+async def _iter_sse_json(chunks: AsyncIterator[bytes]) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    解析 SSE 流，逐个产出 data 字段中的 JSON 对象
+
+    网络块追加到同一个 bytearray 缓冲区，按空行切出事件后从头部删除
+    （缓冲区增长到最大事件长度后反复复用），只对 data 负载做 JSON 解析；
+    遇到 [DONE] 结束，无法解析的事件跳过
+    """
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        if b'\r' in buf:
+            # 兼容 CRLF 换行（末尾孤立的 \r 留在缓冲区，等下一块拼上 \n 后再替换）
+            buf = buf.replace(b'\r\n', b'\n')
+
+        while True:
+            end = buf.find(b'\n\n')
+            if end < 0:
+                break
+            data = _sse_event_data(bytes(buf[:end]))
+            del buf[:end + 2]
+            if data is None:
+                continue
+            if data == b'[DONE]':
+                return
+            try:
+                yield json_loads(data)
+            except JSONDecodeError:
+                continue
+
+    # 流结束：剩余部分可能是没有以空行结尾的最后一个事件
+    for data in _sse_split_events(bytes(buf)):
+        if data == b'[DONE]':
+            return
+        try:
+            yield json_loads(data)
+        except JSONDecodeError:
+            continue
+
+
+def _sse_split_events(buffer: bytes) -> List[bytes]:
+    """把一段包含若干事件的字节切分为 data 负载列表（兼容 CRLF 换行）"""
+    if b'\r' in buffer:
+        buffer = buffer.replace(b'\r\n', b'\n')
+    payloads = []
+    for event in buffer.split(b'\n\n'):
+        data = _sse_event_data(event.strip())
+        if data is not None:
+            payloads.append(data)
+    return payloads
+
+
+def _sse_event_data(event: bytes) -> Optional[bytes]:
+    """提取单个 SSE 事件中的 data 负载（多行 data 以换行拼接），无 data 时返回 None"""
+    if event.startswith(b'data:') and b'\n' not in event:
+        # 常见情况：整个事件只有一行 data
+        return event[5:].strip()
+    parts = [line[5:].strip() for line in event.split(b'\n') if line.startswith(b'data:')]
+    if not parts:
+        return None
+    return b'\n'.join(parts)
+
+
+class _BaseLLMService:
+    """LLM 服务基类：持有进程内复用的 aiohttp 会话（keep-alive 连接池）"""
+
+    _session: Optional[aiohttp.ClientSession] = None
+    _warmup_task: Optional[asyncio.Task] = None
+
+    # 子类覆盖：错误信息与耗时统计中显示的服务名，以及默认的最大令牌数
+    _api_name = "LLM"
+    _default_max_tokens = 1000
+    # 每次请求附加的 session.post 参数（如超时），初始化时构造一次
+    _post_kwargs: Dict[str, Any] = {}
+    # 是否统计流式首个片段耗时（关闭时流式循环中不做任何计时）
+    timing_enabled: bool = settings.llm_timing_enabled
+    # 是否走 HTTP/2（httpx）传输；未安装 httpx[http2] 时始终使用 aiohttp
+    use_http2: bool = settings.llm_http2 and HAS_HTTP2
+
+    def _session_kwargs(self) -> Dict[str, Any]:
+        """创建会话时的额外参数，子类可覆盖以定制超时等参数"""
+        return {}
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        """创建底层会话：公共请求头放在会话上，连接池使用进程内共享的连接器"""
+        return aiohttp.ClientSession(
+            headers=self.headers,
+            connector=_get_shared_connector(),
+            connector_owner=False,
+            json_serialize=json_dumps,
+            **self._session_kwargs()
+        )
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取复用的会话，首次使用或已关闭时重新创建"""
+        if self._session is None or self._session.closed:
+            self._session = self._new_session()
+        return self._session
+
+    def _static_payload(self, stream: bool) -> Dict[str, Any]:
+        """请求体中与单次调用无关的字段（模型名、stream 及厂商特定参数），子类覆盖"""
+        return {"stream": stream}
+
+    def _init_payload_templates(self):
+        """
+        预先序列化请求体中的固定字段：去掉末尾的 '}' 并接上 messages 键作为前缀，
+        调用时只序列化 messages/max_tokens/temperature 并拼接
+        """
+        self._payload_prefixes = {
+            stream: json_dumps_bytes(self._static_payload(stream))[:-1] + b',"messages":'
+            for stream in (False, True)
+        }
 
-    def __init__(
+    def _encode_payload(
         self,
-        api_key: str,
-        base_url: str = "https://llm.onerouter.pro/v1",
-        model: str = "gemini-3-flash-preview"
-    ):
-        self.api_key = api_key
-        self.base_url = base_url.rstrip('/')
-        self.model = model
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: float,
+        stream: bool
+    ) -> bytes:
+        """生成请求体字节：固定前缀 + messages + 其余可变字段（去掉开头的 '{'）"""
+        variable = json_dumps_bytes({
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        })
+        return self._payload_prefixes[bool(stream)] + _encode_messages(messages) + b',' + variable[1:]
+
+    async def _request(self, payload: bytes) -> aiohttp.ClientResponse:
+        """
+        发送请求并返回状态码为 200 的响应（调用方负责 release）
+
+        429 / 5xx 按 Retry-After 或指数退避重试，最多 llm_max_retries 次；
+        其他错误状态直接抛出 LLMUpstreamError
+        """
+        session = await self._get_session()
+        attempt = 0
+        while True:
+            response = await session.post(self._chat_url, data=payload, **self._post_kwargs)
+            if response.status == 200:
+                return response
+
+            if response.status not in _RETRYABLE_STATUS or attempt >= settings.llm_max_retries:
+                await _raise_upstream_error(response, self._api_name)
+
+            delay = _retry_delay(response.headers, attempt)
+            response.release()
+            attempt += 1
+            logger.warning("%s API 返回 %s，%.2fs 后第 %s 次重试", self._api_name, response.status, delay, attempt)
+            await asyncio.sleep(delay)
+
+    async def _request_http2(self, payload: bytes) -> "httpx.Response":
+        """HTTP/2 版本的 _request：返回状态码为 200 的流式响应（调用方负责 aclose）"""
+        client = _get_shared_http2_client()
+        attempt = 0
+        while True:
+            request = client.build_request("POST", self._chat_url, content=payload, headers=self.headers)
+            response = await client.send(request, stream=True)
+            if response.status_code == 200:
+                return response
+
+            if response.status_code not in _RETRYABLE_STATUS or attempt >= settings.llm_max_retries:
+                try:
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                finally:
+                    await response.aclose()
+                raise LLMUpstreamError(self._api_name, response.status_code, body)
+
+            delay = _retry_delay(response.headers, attempt)
+            await response.aclose()
+            attempt += 1
+            logger.warning("%s API 返回 %s，%.2fs 后第 %s 次重试", self._api_name, response.status_code, delay, attempt)
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def _open_stream(self, payload: bytes):
+        """发送请求，产出（已解压的）响应体字节块迭代器（按 use_http2 选择传输）"""
+        if self.use_http2:
+            response = await self._request_http2(payload)
+            try:
+                # aiter_bytes 按 Content-Encoding 解压（httpx 默认请求 gzip / deflate），与 aiohttp 的 iter_any 一致
+                yield response.aiter_bytes()
+            finally:
+                await response.aclose()
+        else:
+            response = await self._request(payload)
+            try:
+                yield response.content.iter_any()
+            finally:
+                response.release()
+
+    async def _post_json(self, payload: bytes) -> Dict[str, Any]:
+        """发送非流式请求并解析 JSON 响应"""
+        try:
+            async with _admission, self._open_stream(payload) as chunks:
+                return json_loads(b''.join([chunk async for chunk in chunks]))
+
+        except _NETWORK_ERRORS as e:
+            raise LLMUpstreamError(self._api_name, None, str(e)) from e
+
+    async def _stream_sse(self, payload: bytes) -> AsyncGenerator[Dict[str, Any], None]:
+        """发送流式请求，逐个产出 SSE 事件中的 JSON 片段"""
+        try:
+            # 仅在开启计时时记录请求开始时间；first_chunk_pending 为 False 时循环内不再计时
+            first_chunk_pending = self.timing_enabled
+            request_start_time = time.monotonic() if first_chunk_pending else 0.0
+
+            async with _admission, self._open_stream(payload) as chunks:
+                async for chunk in _iter_sse_json(chunks):
+                    if first_chunk_pending:
+                        first_chunk_pending = False
+                        time_to_first_output = (time.monotonic() - request_start_time) * 1000
+                        logger.info("ttft_ms=%.2f api=%s model=%s", time_to_first_output, self._api_name, self.model)
+                    yield chunk
+
+        except _NETWORK_ERRORS as e:
+            raise LLMUpstreamError(self._api_name, None, str(e)) from e
 
     async def chat_completion(
         self,
         messages: List[Dict[str, Any]],
-        max_tokens: int = 1000,
+        max_tokens: Optional[int] = None,
         temperature: float = 0.7,
         stream: bool = False
     ) -> Dict[str, Any]:
         """
-        调用 OpenAI Chat Completion API
+        调用 Chat Completion API
 
         Args:
             messages: 消息列表
-            max_tokens: 最大令牌数
+            max_tokens: 最大令牌数（默认取 _default_max_tokens）
             temperature: 温度参数
             stream: 是否流式返回
 
         Returns:
             API 响应
         """
-        url = f"{self.base_url}/chat/completions"
-
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": stream,
-            "extra_body": {
-                "reasoning": {
-                    "max_tokens": 1
-                }
-            }
-        }
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"OpenAI API 错误: {response.status} - {error_text}")
-
-            except aiohttp.ClientError as e:
-                raise Exception(f"请求 OpenAI API 时发生网络错误: {str(e)}")
+        if max_tokens is None:
+            max_tokens = self._default_max_tokens
+        return await self._post_json(self._encode_payload(messages, max_tokens, temperature, stream))
 
     async def chat_completion_stream(
         self,
         messages: List[Dict[str, Any]],
-        max_tokens: int = 1000,
+        max_tokens: Optional[int] = None,
         temperature: float = 0.7
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[Dict[str, Any], None]:
         """
-        流式调用 OpenAI Chat Completion API
+        流式调用 Chat Completion API
 
         Args:
             messages: 消息列表
-            max_tokens: 最大令牌数
+            max_tokens: 最大令牌数（默认取 _default_max_tokens）
             temperature: 温度参数
 
         Yields:
             流式响应片段
         """
-        url = f"{self.base_url}/chat/completions"
+        if max_tokens is None:
+            max_tokens = self._default_max_tokens
+        async for chunk in self._stream_sse(self._encode_payload(messages, max_tokens, temperature, True)):
+            yield chunk
+
+    def _warmup_url(self) -> str:
+        """预热请求的 URL（列出模型接口，开销最小）"""
+        return f"{self.base_url}/models"
+
+    async def warmup(self):
+        """
+        预热连接：提前完成 DNS 解析和 TCP+TLS 握手，
+        让首个真实请求直接复用连接池中的连接
+        """
+        session = await self._get_session()
+        try:
+            async with session.get(
+                self._warmup_url(),
+                timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                # 读完响应体，连接才会归还到连接池
+                await response.read()
+        except Exception as e:
+            logger.warning("LLM 连接预热失败（不影响正常请求）: %s", e)
+
+    def start_warmup(self) -> asyncio.Task:
+        """
+        在后台发起预热（需在事件循环内调用），不阻塞调用方；
+        握手与其他初始化工作并行完成，连接随后停放在连接池中等待复用
+        """
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self.warmup())
+        return self._warmup_task
+
+    async def close(self):
+        """关闭复用的会话（共享连接器不随会话关闭）"""
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        self._warmup_task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
-        payload = {
+    aclose = close
+
+    async def __aenter__(self):
+        self.start_warmup()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class OpenAIService(_BaseLLMService):
+    """OpenAI 服务类"""
+
+    _api_name = "OpenAI"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://llm.onerouter.pro/v1",
+        model: str = "gemini-3-flash-preview"
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        # 请求 URL 与实例绑定，初始化时拼接一次
+        self._chat_url = f"{self.base_url}/chat/completions"
+        self._init_payload_templates()
+
+    def _static_payload(self, stream: bool) -> Dict[str, Any]:
+        return {
             "model": self.model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": True,
+            "stream": stream,
             "extra_body": {
                 "reasoning": {
                     "max_tokens": 1
@@ -99,48 +566,12 @@ class OpenAIService:
             }
         }
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                # 记录请求开始时间
-                request_start_time = asyncio.get_event_loop().time()
-                first_chunk_time = None
-                chunk_count = 0
-
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        async for line in response.content:
-                            line = line.decode('utf-8').strip()
-                            if line.startswith('data: '):
-                                data = line[6:]  # 移除 'data: ' 前缀
-                                if data == '[DONE]':
-                                    break
-                                try:
-                                    chunk = json.loads(data)
-
-                                    # 记录第一个chunk的时间
-                                    if first_chunk_time is None:
-                                        first_chunk_time = asyncio.get_event_loop().time()
-                                        time_to_first_output = (first_chunk_time - request_start_time) * 1000
-                                        print(f"\n{'='*80}")
-                                        print(f"⏱️  Gemini API 时间统计")
-                                        print(f"📥 请求 Gemini → 📤 首个输出: {time_to_first_output:.2f}ms")
-                                        print(f"{'='*80}\n")
-
-                                    chunk_count += 1
-                                    yield chunk
-                                except json.JSONDecodeError:
-                                    continue
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"OpenAI API 错误: {response.status} - {error_text}")
-
-            except aiohttp.ClientError as e:
-                raise Exception(f"请求 OpenAI API 时发生网络错误: {str(e)}")
-
-
-class AzureOpenAIService:
+
+class AzureOpenAIService(_BaseLLMService):
     """Azure OpenAI 服务类"""
 
+    _api_name = "Azure OpenAI"
+
     def __init__(
         self,
         endpoint: str,
@@ -152,111 +583,26 @@ class AzureOpenAIService:
         self.api_key = api_key
         self.api_version = api_version
         self.deployment_name = deployment_name
+        self.model = deployment_name  # 仅用于日志，请求体中不携带 model
         self.base_url = f"{self.endpoint}/openai/deployments/{self.deployment_name}"
-
-    async def chat_completion(
-        self,
-        messages: List[Dict[str, Any]],
-        max_tokens: int = 1000,
-        temperature: float = 0.7,
-        stream: bool = False
-    ) -> Dict[str, Any]:
-        """
-        调用 Azure OpenAI Chat Completion API
-
-        Args:
-            messages: 消息列表
-            max_tokens: 最大令牌数
-            temperature: 温度参数
-            stream: 是否流式返回
-
-        Returns:
-            API 响应
-        """
-        url = f"{self.base_url}/chat/completions?api-version={self.api_version}"
-
-        headers = {
+        self.headers = {
             "Content-Type": "application/json",
             "api-key": self.api_key
         }
+        # 请求 URL 与实例绑定，初始化时拼接一次
+        self._chat_url = f"{self.base_url}/chat/completions?api-version={self.api_version}"
+        self._init_payload_templates()
 
-        payload = {
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": stream
-        }
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Azure OpenAI API 错误: {response.status} - {error_text}")
+    def _warmup_url(self) -> str:
+        return f"{self.endpoint}/openai/models?api-version={self.api_version}"
 
-            except aiohttp.ClientError as e:
-                raise Exception(f"请求 Azure OpenAI API 时发生网络错误: {str(e)}")
-
-    async def chat_completion_stream(
-        self,
-        messages: List[Dict[str, Any]],
-        max_tokens: int = 1000,
-        temperature: float = 0.7
-    ) -> AsyncGenerator[str, None]:
-        """
-        流式调用 Azure OpenAI Chat Completion API
 
-        Args:
-            messages: 消息列表
-            max_tokens: 最大令牌数
-            temperature: 温度参数
-
-        Yields:
-            流式响应片段
-        """
-        url = f"{self.base_url}/chat/completions?api-version={self.api_version}"
-
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": self.api_key
-        }
-
-        payload = {
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": True
-        }
-
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        async for line in response.content:
-                            line = line.decode('utf-8').strip()
-                            if line.startswith('data: '):
-                                data = line[6:]  # 移除 'data: ' 前缀
-                                if data == '[DONE]':
-                                    break
-                                try:
-                                    chunk = json.loads(data)
-                                    yield chunk
-                                except json.JSONDecodeError:
-                                    continue
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Azure OpenAI API 错误: {response.status} - {error_text}")
-
-            except aiohttp.ClientError as e:
-                raise Exception(f"请求 Azure OpenAI API 时发生网络错误: {str(e)}")
-
-
-class DoubaoService:
+class DoubaoService(_BaseLLMService):
     """豆包服务类 - 字节跳动 AI 助手"""
 
+    _api_name = "豆包"
+    _default_max_tokens = 4000
+
     def __init__(
         self,
         api_key: str,
@@ -268,120 +614,20 @@ class DoubaoService:
         self.base_url = base_url.rstrip('/')
         self.model = model
         self.timeout = timeout
+        # 超时对象不可变，只构造一次；按请求传入，共享会话本身不带默认超时
+        self._timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=10, sock_read=timeout)
+        self._post_kwargs = {"timeout": self._timeout}
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        # 请求 URL 与实例绑定，初始化时拼接一次
+        self._chat_url = f"{self.base_url}/chat/completions"
+        self._init_payload_templates()
 
-    async def chat_completion(
-        self,
-        messages: List[Dict[str, Any]],
-        max_tokens: int = 4000,
-        temperature: float = 0.7,
-        stream: bool = False
-    ) -> Dict[str, Any]:
-        """
-        调用豆包 Chat Completion API
-
-        Args:
-            messages: 消息列表
-            max_tokens: 最大令牌数
-            temperature: 温度参数
-            stream: 是否流式返回
-
-        Returns:
-            API 响应
-        """
-        url = f"{self.base_url}/chat/completions"
-
-        payload = {
+    def _static_payload(self, stream: bool) -> Dict[str, Any]:
+        return {
             "model": self.model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
             "stream": stream,
             "reasoning_effort": "minimal"
         }
-
-        timeout = aiohttp.ClientTimeout(total=self.timeout)
-
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            try:
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"豆包 API 错误: {response.status} - {error_text}")
-
-            except aiohttp.ClientError as e:
-                raise Exception(f"请求豆包 API 时发生网络错误: {str(e)}")
-
-    async def chat_completion_stream(
-        self,
-        messages: List[Dict[str, Any]],
-        max_tokens: int = 4000,
-        temperature: float = 0.7
-    ) -> AsyncGenerator[Dict[str, Any], None]:
-        """
-        流式调用豆包 Chat Completion API
-
-        Args:
-            messages: 消息列表
-            max_tokens: 最大令牌数
-            temperature: 温度参数
-
-        Yields:
-            流式响应片段
-        """
-        url = f"{self.base_url}/chat/completions"
-
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": True,
-            "reasoning_effort": "minimal"
-        }
-
-        timeout = aiohttp.ClientTimeout(total=self.timeout)
-
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            try:
-                # 记录请求开始时间
-                request_start_time = asyncio.get_event_loop().time()
-                first_chunk_time = None
-                chunk_count = 0
-
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        async for line in response.content:
-                            line = line.decode('utf-8').strip()
-                            if line.startswith('data: '):
-                                data = line[6:]  # 移除 'data: ' 前缀
-                                if data == '[DONE]':
-                                    break
-                                try:
-                                    chunk = json.loads(data)
-
-                                    # 记录第一个chunk的时间
-                                    if first_chunk_time is None:
-                                        first_chunk_time = asyncio.get_event_loop().time()
-                                        time_to_first_output = (first_chunk_time - request_start_time) * 1000
-                                        print(f"\n{'='*80}")
-                                        print(f"⏱️ 豆包 API 时间统计")
-                                        print(f"📥 请求豆包 → 📤 首个输出: {time_to_first_output:.2f}ms")
-                                        print(f"{'='*80}\n")
-
-                                    chunk_count += 1
-                                    yield chunk
-                                except json.JSONDecodeError:
-                                    continue
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"豆包 API 错误: {response.status} - {error_text}")
-
-            except aiohttp.ClientError as e:
-                raise Exception(f"请求豆包 API 时发生网络错误: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,56 @@
+import json
+from typing import Any
+
+# 尝试导入 orjson（C 实现，解析/序列化速度远快于标准库），未安装时回退到 json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方统一捕获这一个即可
+JSONDecodeError = json.JSONDecodeError
+
+
+if HAS_ORJSON:
+    def json_loads(data) -> Any:
+        """解析 JSON（接受 str / bytes）"""
+        return orjson.loads(data)
+
+    def json_dumps_bytes(obj: Any) -> bytes:
+        """序列化为 UTF-8 字节（可直接作为请求体发送）"""
+        return orjson.dumps(obj)
+
+    def json_dumps_canonical(obj: Any) -> bytes:
+        """规范化序列化（键排序、非字符串键转为字符串、无法序列化的值用 str），用于生成缓存键"""
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+    def json_dumps(obj: Any) -> str:
+        """序列化为紧凑的 str（非 ASCII 字符不转义，非字符串键转为字符串，与标准库一致）"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def json_dumps_pretty(obj: Any) -> str:
+        """序列化为缩进 2 空格的 str（用于打印展示，非 ASCII 字符不转义）"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+else:
+    def json_loads(data) -> Any:
+        """解析 JSON（接受 str / bytes）"""
+        return json.loads(data)
+
+    def json_dumps_bytes(obj: Any) -> bytes:
+        """序列化为 UTF-8 字节（可直接作为请求体发送）"""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def json_dumps_canonical(obj: Any) -> bytes:
+        """规范化序列化（键排序、无法序列化的值用 str），用于生成缓存键"""
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(',', ':'), sort_keys=True, default=str
+        ).encode('utf-8')
+
+    def json_dumps(obj: Any) -> str:
+        """序列化为紧凑的 str（非 ASCII 字符不转义）"""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+    def json_dumps_pretty(obj: Any) -> str:
+        """序列化为缩进 2 空格的 str（用于打印展示，非 ASCII 字符不转义）"""
+        return json.dumps(obj, indent=2, ensure_ascii=False)
@@ -0,0 +1,128 @@
+"""
+LLM 请求窗口合批调度
+在 batch_window_ms 时间窗口内（或凑满 batch_max_size 条）收集并发提交的 Chat Completion 请求，
+按窗口统一下发：内容完全相同的请求只调用一次上游，结果通过 Future 分发给所有等待的调用方。
+Chat Completions 接口不支持单次请求携带多个独立对话（Batch API 是以小时计的离线任务），
+因此同一窗口内的不同请求仍会各自发出，但并发复用同一服务实例的会话与连接池
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from .fast_json import json_dumps_canonical
+except ImportError:
+    # 直接运行时的备选方案
+    from fast_json import json_dumps_canonical
+
+logger = logging.getLogger(__name__)
+
+
+class LLMDispatcher:
+    """
+    Chat Completion 请求合批调度器
+
+    service_getter 返回提供 chat_completion(messages, **kwargs) 的服务实例，
+    在每个窗口下发时调用，服务可以延迟创建
+    """
+
+    def __init__(
+        self,
+        service_getter: Callable[[], Any],
+        batch_window_ms: float = 0,
+        batch_max_size: int = 16
+    ):
+        self._service_getter = service_getter
+        self.batch_window = max(batch_window_ms, 0) / 1000
+        self.batch_max_size = max(int(batch_max_size), 1)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, messages: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        """提交一次 Chat Completion 请求，等待所在窗口下发后返回 API 响应"""
+        if self.batch_window <= 0:
+            # 未启用窗口：直接调用
+            return await self._service_getter().chat_completion(messages, **kwargs)
+
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((messages, kwargs, future))
+        return await future
+
+    async def _collect(self):
+        """收集窗口内的请求；窗口到期或凑满后交给后台任务下发，不阻塞下一个窗口"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.batch_window
+                while len(batch) < self.batch_max_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                task = asyncio.create_task(self._flush(batch))
+                self._flushes.add(task)
+                task.add_done_callback(self._flushes.discard)
+                batch = []
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("LLM 调度器已关闭"))
+            raise
+
+    async def _flush(self, batch: List[Tuple[List[Dict[str, Any]], Dict[str, Any], asyncio.Future]]):
+        """下发一个窗口：相同请求合并为一次调用，结果（或异常）分发给对应的 Future"""
+        groups: Dict[bytes, Tuple[List[Dict[str, Any]], Dict[str, Any], List[asyncio.Future]]] = {}
+        for messages, kwargs, future in batch:
+            key = json_dumps_canonical([messages, kwargs])
+            if key in groups:
+                groups[key][2].append(future)
+            else:
+                groups[key] = (messages, kwargs, [future])
+
+        logger.debug("LLM 调度窗口下发: %d 个请求，去重后 %d 次调用", len(batch), len(groups))
+
+        try:
+            service = self._service_getter()
+            results = await asyncio.gather(
+                *(service.chat_completion(messages, **kwargs) for messages, kwargs, _ in groups.values()),
+                return_exceptions=True
+            )
+        except Exception as e:
+            results = [e] * len(groups)
+
+        for (_, _, futures), result in zip(groups.values(), results):
+            for future in futures:
+                # 调用方可能已取消等待
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        """停止收集任务，等待已下发的窗口完成"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        # 尚未进入窗口的请求直接失败，避免调用方一直等待
+        while self._queue is not None and not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("LLM 调度器已关闭"))
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
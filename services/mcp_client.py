@@ -1,8 +1,52 @@
 import asyncio
 import aiohttp
-import json
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import copy
+import dataclasses
+import functools
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack
+from typing import Dict, Any, Optional, List, AsyncIterator, Set
+
+from config import settings
+
+try:
+    from .fast_json import json_loads, json_dumps_bytes, JSONDecodeError
+    from .tool_result_cache import (
+        TOOL_TTL, tool_cache_key, get_persistent_cache, is_result_ref, offload_large_result
+    )
+except ImportError:
+    # 直接运行时的备选方案
+    from fast_json import json_loads, json_dumps_bytes, JSONDecodeError
+    from tool_result_cache import (
+        TOOL_TTL, tool_cache_key, get_persistent_cache, is_result_ref, offload_large_result
+    )
+
+logger = logging.getLogger(__name__)
+
+# 尝试导入 ijson（流式解析大响应，不在内存中保留完整响应体）
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+# 响应体超过该大小（字节）时改为边读边解析
+_STREAM_DECODE_THRESHOLD = 1_000_000
+
+# 尝试导入 msgspec（服务器支持时用 MessagePack 代替 JSON 传输）
+try:
+    import msgspec
+    _MSGPACK_ENCODER = msgspec.msgpack.Encoder()
+    _MSGPACK_DECODER = msgspec.msgpack.Decoder()
+    HAS_MSGSPEC = True
+except ImportError:
+    HAS_MSGSPEC = False
+
+_JSON_CONTENT_TYPE = "application/json"
+_MSGPACK_CONTENT_TYPE = "application/vnd.msgpack"
 
 # 尝试导入 fastmcp
 try:
@@ -16,20 +60,365 @@ except ImportError:
     except ImportError:
         HAS_FASTMCP = False
 
+# fastmcp 的 ToolError：工具返回 isError 时抛出，与 fastmcp Client.call_tool 的行为一致
+try:
+    from fastmcp.exceptions import ToolError
+except ImportError:
+    class ToolError(Exception):
+        """工具执行返回错误（isError）"""
+
+# 尝试导入 MCP SDK 的 Pydantic 类型：已知类型直接走 Pydantic 的 C 实现序列化，跳过逐个属性探测
+try:
+    from mcp.types import Tool as MCPTool, CallToolResult
+    from pydantic import TypeAdapter
+    _CALL_RESULT_ADAPTER = TypeAdapter(CallToolResult)
+    HAS_MCP_TYPES = True
+except ImportError:
+    MCPTool = CallToolResult = None
+    HAS_MCP_TYPES = False
+
+# CallToolResult 中保留的字段（与属性探测路径输出的结构一致，_meta 供缓存层读取 cache_hint）
+_CALL_RESULT_FIELDS = {'content', 'isError', 'meta'}
+
+# 确定性工具的结果缓存 TTL（秒）；未列出的工具（增删改、搜索等）不缓存
+DETERMINISTIC_TOOLS = {
+    "modelscope.get_model_info": 3600,
+    "modelscope.search_model": 300,
+}
+_TOOL_CACHE_MAXSIZE = 1024
+
+# 工具结果缓存：key -> (写入时间, 结果)，按最近使用排序（LRU）
+_TOOL_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# _format_result 中直接原样返回的基本类型
+_PRIM = (str, int, float, bool, type(None))
+# 兜底时探测的常见属性
+_RESULT_ATTRS = ('text', 'content', 'data', 'value', 'message', 'error')
+# 结果对象的类型 -> (处理方式, 属性列表)，每个类只探测一次
+_FORMAT_DISPATCH: Dict[type, tuple] = {list: ("list", ()), dict: ("dict", ())}
+
+# 工具对象上可能存放参数模式的属性名（FastMCP 不同版本命名不同）
+_SCHEMA_ATTRS = ('inputSchema', 'input_schema', 'schema', 'parameters')
+
+
+def _classify_result_type(value) -> tuple:
+    """确定某类结果对象在 _format_result 中的处理方式，并按类型缓存"""
+    cls = type(value)
+    entry = _FORMAT_DISPATCH.get(cls)
+    if entry is not None:
+        return entry
+
+    if isinstance(value, list):
+        entry = ("list", ())
+    elif isinstance(value, dict):
+        entry = ("dict", ())
+    elif hasattr(value, 'content'):
+        # CallToolResult 等
+        entry = ("content", ())
+    elif hasattr(value, 'text'):
+        # TextContent 等
+        entry = ("text", ())
+    elif hasattr(cls, 'model_fields') and hasattr(cls, 'model_dump'):
+        # Pydantic 模型：直接 model_dump，跳过逐个属性处理
+        entry = ("model", ())
+    elif dataclasses.is_dataclass(value):
+        # dataclass：只取声明的字段（与 dataclasses.asdict 相同的字段集），字段名按类缓存
+        entry = ("attrs", tuple(field.name for field in dataclasses.fields(value)))
+    elif hasattr(value, '__dict__'):
+        entry = ("vars", ())
+    else:
+        attrs = tuple(attr for attr in _RESULT_ATTRS if hasattr(value, attr))
+        entry = ("attrs", attrs) if attrs else ("str", ())
+
+    _FORMAT_DISPATCH[cls] = entry
+    return entry
+
+
+def _pop_cache_hint(result) -> bool:
+    """
+    去掉结果中仅供客户端使用的 _meta 字段（不传给 LLM），
+    返回服务器是否通过 _meta.cache_hint == "no-cache" 要求不缓存该结果
+    """
+    if not isinstance(result, dict):
+        return False
+    meta = result.pop("_meta", None)
+    return isinstance(meta, dict) and meta.get("cache_hint") == "no-cache"
+
+
+def _is_error_result(result) -> bool:
+    """工具结果是否表示失败（isError 或顶层 error 字段），失败结果不写入缓存"""
+    return isinstance(result, dict) and (result.get("isError") is True or "error" in result)
+
+
+def cached_tool(func):
+    """
+    call_tool 结果缓存装饰器（进程内 LRU + TTL，外加可选的持久化缓存）
+
+    进程内只缓存 DETERMINISTIC_TOOLS 中的工具，持久化缓存只缓存 TOOL_TTL 中的工具。
+    以下情况不缓存：
+      - 调用方传 cache=False：既不读也不写缓存
+      - 服务器在结果中返回 _meta: {"cache_hint": "no-cache"}：本次结果不写入缓存
+      - 失败的结果（isError 或顶层 error 字段）
+    进程内缓存保存结果的副本，命中时也返回副本，调用方修改返回值不会影响缓存。
+    进程内缓存的读写之间没有 await，单事件循环内无需加锁
+    """
+    @functools.wraps(func)
+    async def wrapper(self, name: str, arguments: Dict[str, Any], cache: Optional[bool] = None):
+        ttl = DETERMINISTIC_TOOLS.get(name)
+        persistent_ttl = TOOL_TTL.get(name, 0)
+        persistent_cache = get_persistent_cache() if persistent_ttl else None
+        if cache is False or (not ttl and persistent_cache is None):
+            result = await func(self, name, arguments)
+            _pop_cache_hint(result)
+            return result
+
+        if ttl:
+            key = tool_cache_key(name, arguments, self.server_url)
+            entry = _TOOL_CACHE.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at <= ttl:
+                    _TOOL_CACHE.move_to_end(key)
+                    _CACHE_STATS["hits"] += 1
+                    return copy.deepcopy(value)
+                del _TOOL_CACHE[key]
+                _CACHE_STATS["evictions"] += 1
+            _CACHE_STATS["misses"] += 1
+
+        result = None
+        if persistent_cache is not None:
+            persistent_key = tool_cache_key(name, arguments)
+            result = await persistent_cache.get(persistent_key)
+        from_persistent = result is not None
+
+        if not from_persistent:
+            result = await func(self, name, arguments)
+            if _pop_cache_hint(result) or _is_error_result(result):
+                return result
+
+        if ttl:
+            _TOOL_CACHE[key] = (time.monotonic(), copy.deepcopy(result))
+            _TOOL_CACHE.move_to_end(key)
+            while len(_TOOL_CACHE) > _TOOL_CACHE_MAXSIZE:
+                _TOOL_CACHE.popitem(last=False)
+                _CACHE_STATS["evictions"] += 1
+        if persistent_cache is not None and not from_persistent:
+            await persistent_cache.set(persistent_key, result, ttl=persistent_ttl)
+        return result
+
+    return wrapper
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """工具结果缓存统计"""
+    lookups = _CACHE_STATS["hits"] + _CACHE_STATS["misses"]
+    return {
+        **_CACHE_STATS,
+        "size": len(_TOOL_CACHE),
+        "hit_rate": _CACHE_STATS["hits"] / lookups if lookups else 0.0,
+    }
+
+
+def clear_tool_cache():
+    """清空工具结果缓存"""
+    _TOOL_CACHE.clear()
+
+
+# 所有 MCPClient 实例共享的会话（keep-alive 连接池），首次使用时创建
+_SESSION: Optional[aiohttp.ClientSession] = None
+_SESSION_LOCK: Optional[asyncio.Lock] = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """获取共享会话，首次使用或已关闭时创建"""
+    global _SESSION, _SESSION_LOCK
+    if _SESSION is not None and not _SESSION.closed:
+        return _SESSION
+    if _SESSION_LOCK is None:
+        _SESSION_LOCK = asyncio.Lock()
+    async with _SESSION_LOCK:
+        if _SESSION is None or _SESSION.closed:
+            connector = aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=32,
+                keepalive_timeout=75,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True
+            )
+            _SESSION = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.mcp_http_timeout)
+            )
+    return _SESSION
+
+
+async def shutdown_session():
+    """关闭共享会话（应用关闭时调用）"""
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
+
+
+class _BatchQueue:
+    """
+    JSON-RPC 批量请求队列
+
+    在 batch_window_ms 时间窗口内排队的请求（最多 max_batch 个）合并为一次 POST（JSON 数组），
+    再按 id 把响应分发给各自的调用方。服务器不支持批量（返回非数组或报错）时，
+    记住这一点并退回逐个发送
+    """
+
+    def __init__(self, client: "MCPClient", batch_window_ms: float, max_batch: int):
+        self.client = client
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.supports_batch: Optional[bool] = None  # None 表示尚未探测
+        self._task: Optional[asyncio.Task] = None
+        # 已派发、尚未完成的批次（保留引用，避免任务被回收；关闭时等待它们完成）
+        self._dispatches: Set[asyncio.Task] = set()
+
+    async def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """提交单个请求，等待其响应"""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((payload, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+        return await future
+
+    async def _flush_loop(self):
+        """收集一个时间窗口内的请求并派发，队列清空后退出（下次提交时重新启动）"""
+        loop = asyncio.get_running_loop()
+        items = []
+        try:
+            while not self.queue.empty():
+                items = [self.queue.get_nowait()]
+                deadline = loop.time() + self.batch_window
+                while len(items) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                # 派发不阻塞下一批的收集
+                task = asyncio.create_task(self._dispatch(items))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+                items = []
+        except asyncio.CancelledError:
+            self._fail(items)
+            raise
+
+    @staticmethod
+    def _fail(items):
+        for _, future in items:
+            if not future.done():
+                future.set_exception(Exception("MCP 客户端已关闭"))
+
+    async def close(self):
+        """停止收集任务，等待已派发的批次完成；尚未派发的请求直接失败"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        while not self.queue.empty():
+            self._fail([self.queue.get_nowait()])
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def _send_each(self, items):
+        """逐个发送（单个请求或服务器不支持批量时）"""
+        async def send_one(payload, future):
+            try:
+                result = await self.client._post(payload)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+        await asyncio.gather(*[send_one(payload, future) for payload, future in items])
+
+    async def _dispatch(self, items):
+        if len(items) == 1 or self.supports_batch is False:
+            await self._send_each(items)
+            return
+
+        try:
+            responses = await self.client._post([payload for payload, _ in items])
+        except Exception as e:
+            if self.supports_batch is None:
+                # 首次批量请求即失败，视为不支持批量
+                self.supports_batch = False
+                await self._send_each(items)
+                return
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if not isinstance(responses, list):
+            self.supports_batch = False
+            await self._send_each(items)
+            return
+
+        self.supports_batch = True
+        by_id = {response.get("id"): response for response in responses if isinstance(response, dict)}
+        for payload, future in items:
+            if future.done():
+                continue
+            response = by_id.get(payload["id"])
+            if response is None:
+                future.set_exception(Exception(f"MCP 批量响应中缺少 id={payload['id']} 的结果"))
+            else:
+                future.set_result(response)
+
+
 class MCPClient:
     """MCP (Model Context Protocol) 客户端"""
 
-    def __init__(self, server_url: str = "http://localhost:3000"):
+    def __init__(
+        self,
+        server_url: str = "http://localhost:3000",
+        batch_window_ms: float = 0,
+        max_batch: int = 16
+    ):
+        """
+        Args:
+            server_url: MCP 服务器地址
+            batch_window_ms: 合并 JSON-RPC 批量请求的时间窗口（毫秒），<= 0（默认）时每个请求单独发送，
+                不为单个请求增加等待时间
+            max_batch: 单个批量请求最多包含的请求数
+        """
         self.server_url = server_url.rstrip('/')
         self.session: Optional[aiohttp.ClientSession] = None
+        self.batch_window_ms = batch_window_ms
+        self.max_batch = max_batch
+        self._batch_queue: Optional[_BatchQueue] = None
+        # JSON-RPC 请求 id：同一批次内必须唯一，才能按 id 分发响应
+        self._request_ids = itertools.count(1)
+        # 传输格式：None 表示尚未协商，首个请求通过 Accept 头探测服务器是否支持 MessagePack
+        self._wire: Optional[str] = None if HAS_MSGSPEC else "json"
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # 复用进程内共享会话，退出上下文时不关闭（由 shutdown_session 统一关闭）
+        self.session = await get_session()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        if self._batch_queue is not None:
+            await self._batch_queue.close()
+            self._batch_queue = None
+        self.session = None
 
     async def send_request(
         self,
@@ -49,19 +438,62 @@ class MCPClient:
         if not self.session:
             raise Exception("MCP 客户端未初始化")
 
-        url = f"{self.server_url}/mcp/rpc"
         payload = {
             "jsonrpc": "2.0",
-            "id": int(datetime.now().timestamp() * 1000),
+            "id": next(self._request_ids),
             "method": method,
             "params": params
         }
 
+        if not logger.isEnabledFor(logging.DEBUG):
+            return await self._dispatch_request(payload)
+
+        # 仅在调试日志中记录耗时：monotonic_ns 不受系统时钟调整影响，且不构造 datetime 对象
+        started_ns = time.monotonic_ns()
+        result = await self._dispatch_request(payload)
+        logger.debug(
+            "[MCP] %s id=%s 耗时 %.2fms", method, payload["id"], (time.monotonic_ns() - started_ns) / 1e6
+        )
+        return result
+
+    async def _dispatch_request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """单独发送，或交给批量队列合并发送"""
+        if self.batch_window_ms <= 0:
+            return await self._post(payload)
+
+        if self._batch_queue is None:
+            self._batch_queue = _BatchQueue(self, self.batch_window_ms, self.max_batch)
+        return await self._batch_queue.submit(payload)
+
+    async def _post(self, payload):
+        """POST 单个请求或批量请求数组到 /mcp/rpc，返回解析后的响应"""
+        if not self.session:
+            raise Exception("MCP 客户端未初始化")
+
+        url = f"{self.server_url}/mcp/rpc"
+        if self._wire == "msgpack":
+            data = _MSGPACK_ENCODER.encode(payload)
+            headers = {"Content-Type": _MSGPACK_CONTENT_TYPE, "Accept": _MSGPACK_CONTENT_TYPE}
+        else:
+            data = json_dumps_bytes(payload)
+            headers = {"Content-Type": _JSON_CONTENT_TYPE}
+            if self._wire is None:
+                headers["Accept"] = f"{_MSGPACK_CONTENT_TYPE}, {_JSON_CONTENT_TYPE}"
+
         try:
-            async with self.session.post(url, json=payload) as response:
+            async with self.session.post(url, data=data, headers=headers) as response:
                 if response.status == 200:
-                    result = await response.json()
-                    return result
+                    if response.content_type == _MSGPACK_CONTENT_TYPE:
+                        # 服务器以 MessagePack 响应，之后的请求也用 MessagePack 发送
+                        self._wire = "msgpack"
+                        return _MSGPACK_DECODER.decode(await response.read())
+                    if self._wire is None:
+                        self._wire = "json"
+                    if HAS_IJSON and (response.content_length or 0) > _STREAM_DECODE_THRESHOLD:
+                        # 大响应边读边解析，避免响应体原文和解析结果同时占用内存
+                        async for document in ijson.items_async(response.content, '', use_float=True):
+                            return document
+                    return json_loads(await response.read())
                 else:
                     error_text = await response.text()
                     raise Exception(f"MCP 请求失败: {response.status} - {error_text}")
@@ -69,19 +501,67 @@ class MCPClient:
         except aiohttp.ClientError as e:
             raise Exception(f"MCP 客户端错误: {str(e)}")
 
+    async def send_request_stream(
+        self,
+        method: str,
+        params: Dict[str, Any],
+        path_expr: str
+    ) -> AsyncIterator[Any]:
+        """
+        发送 MCP 请求，并流式解析响应，逐个产出 path_expr 匹配的元素
+
+        不经过批量队列；内存占用与单个元素大小相关，而不是整个响应
+
+        Args:
+            method: MCP 方法名
+            params: 请求参数
+            path_expr: ijson 路径表达式，例如 "result.tools.item"
+
+        Yields:
+            匹配的元素
+        """
+        if not HAS_IJSON:
+            raise ImportError("流式解析需要 ijson，请运行: pip install ijson")
+        if not self.session:
+            raise Exception("MCP 客户端未初始化")
+
+        payload = {
+            "jsonrpc": "2.0",
+            "id": next(self._request_ids),
+            "method": method,
+            "params": params
+        }
+        url = f"{self.server_url}/mcp/rpc"
+        try:
+            async with self.session.post(
+                url,
+                data=json_dumps_bytes(payload),
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"MCP 请求失败: {response.status} - {error_text}")
+                async for item in ijson.items_async(response.content, path_expr, use_float=True):
+                    yield item
+
+        except aiohttp.ClientError as e:
+            raise Exception(f"MCP 客户端错误: {str(e)}")
+
+    async def iter_tools(self) -> AsyncIterator[Dict[str, Any]]:
+        """逐个产出服务器上的工具（工具列表很大时使用，不一次性载入整个 tools/list 响应）"""
+        async for tool in self.send_request_stream("tools/list", {}, "result.tools.item"):
+            yield tool
+
     async def list_tools(self) -> List[Dict[str, Any]]:
         """列出可用的工具"""
         result = await self.send_request("tools/list", {})
         tools = result.get("result", {}).get("tools", [])
 
-        # Print MCP tools
-        print(f"\n=== MCP Server Tools ({len(tools)} total) ===")
-        for tool in tools:
-            print(f"  - {tool.get('name', 'unknown')}: {tool.get('description', 'no description')}")
-        print("==================================\n")
+        logger.info("MCP Server Tools (%d): %s", len(tools), [tool.get('name', 'unknown') for tool in tools])
 
         return tools
 
+    @cached_tool
     async def call_tool(
         self,
         name: str,
@@ -97,19 +577,31 @@ class MCPClient:
         Returns:
             工具执行结果
         """
-        # Print tool call
-        print(f"\n[MCP] Calling tool: {name}")
-        print(f"[MCP] Arguments: {arguments}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[MCP] Calling tool: %s arguments: %s", name, json_dumps_bytes(arguments).decode('utf-8'))
 
         result = await self.send_request("tools/call", {
             "name": name,
             "arguments": arguments
         })
 
-        # Print result
-        print(f"[MCP] Tool '{name}' completed")
-
-        return result.get("result", {})
+        logger.debug("[MCP] Tool '%s' completed", name)
+
+        # JSON-RPC 错误与工具执行错误（isError）都抛出异常，与 FastMCPClient.call_tool 一致，
+        # 失败不会作为空结果返回（也不会被缓存）
+        if "error" in result:
+            error = result["error"]
+            message = error.get("message") if isinstance(error, dict) else error
+            raise Exception(f"调用工具 '{name}' 失败: {message}")
+        tool_result = result.get("result")
+        if not isinstance(tool_result, dict):
+            raise Exception(f"调用工具 '{name}' 失败: 响应中缺少 result")
+        if tool_result.get("isError"):
+            text = next(
+                (block.get("text") for block in tool_result.get("content") or [] if isinstance(block, dict)), None
+            )
+            raise ToolError(text or f"工具 '{name}' 执行失败")
+        return tool_result
 
     async def get_resources(self) -> List[Dict[str, Any]]:
         """获取可用资源"""
@@ -191,10 +683,124 @@ class ModelscopeMCPClient(MCPClient):
         return result
 
 
+def _format_result(result):
+    """
+    格式化结果，将 CallToolResult、TextContent 等对象转换为可序列化的格式
+
+    Args:
+        result: 原始结果
+
+    Returns:
+        格式化后的结果
+    """
+    if isinstance(result, _PRIM):
+        return result
+
+    if HAS_MCP_TYPES and isinstance(result, CallToolResult):
+        # FastMCPClient.call_tool 通过 call_tool_mcp 取得的就是该类型，走 Pydantic 序列化
+        return _CALL_RESULT_ADAPTER.dump_python(
+            result, mode='json', by_alias=True, exclude_none=True, include=_CALL_RESULT_FIELDS
+        )
+
+    # 用显式栈代替递归：每帧为 (父容器, 键或下标, 待处理的值)，处理结果写回父容器
+    root = [None]
+    stack = deque([(root, 0, result)])
+    while stack:
+        parent, key, value = stack.pop()
+        if isinstance(value, _PRIM):
+            parent[key] = value
+            continue
+
+        kind, attrs = _classify_result_type(value)
+
+        if kind == "list":
+            out = list(value)
+            for index, item in enumerate(out):
+                if not isinstance(item, _PRIM):
+                    stack.append((out, index, item))
+        elif kind == "dict":
+            out = dict(value)
+            for item_key, item in out.items():
+                if not isinstance(item, _PRIM):
+                    stack.append((out, item_key, item))
+        elif kind == "vars":
+            # 跳过下划线开头的私有属性（内部缓存等），只输出公开属性
+            out = {}
+            for item_key, item in vars(value).items():
+                if item_key[:1] == '_':
+                    continue
+                out[item_key] = item
+                if not isinstance(item, _PRIM):
+                    stack.append((out, item_key, item))
+        elif kind == "content":
+            # CallToolResult 对象；fastmcp 2.10+ Client.call_tool 返回的同名 dataclass 字段为 is_error
+            out = {"content": None, "isError": bool(getattr(value, 'isError', getattr(value, 'is_error', False)))}
+            stack.append((out, "content", value.content))
+            # _meta（Pydantic 字段名为 meta）携带 cache_hint 等客户端信息，由 cached_tool 处理后去掉
+            meta = getattr(value, 'meta', None)
+            if isinstance(meta, dict):
+                out["_meta"] = meta
+        elif kind == "text":
+            # TextContent 对象
+            out = {"type": "text", "text": getattr(value, 'text', str(value))}
+        elif kind == "model":
+            out = value.model_dump(mode='json')
+        elif kind == "attrs":
+            out = {}
+            for attr in attrs:
+                out[attr] = None
+                stack.append((out, attr, getattr(value, attr)))
+        else:
+            out = str(value)
+
+        parent[key] = out
+
+    return root[0]
+
+
+def extract_response_data(formatted_result):
+    """
+    从 FastMCP 返回的格式化结果中提取实际的响应数据
+
+    Args:
+        formatted_result: 格式化结果
+
+    Returns:
+        提取的响应数据
+    """
+    if not isinstance(formatted_result, dict):
+        return formatted_result
+
+    # 如果直接包含 status，说明已经是解析后的数据
+    if "status" in formatted_result:
+        return formatted_result
+
+    # 尝试从 content 中提取
+    if "content" in formatted_result:
+        content = formatted_result["content"]
+        if isinstance(content, list) and len(content) > 0:
+            first_item = content[0]
+            if isinstance(first_item, dict) and "text" in first_item:
+                text = first_item["text"]
+                # 尝试解析 JSON 字符串
+                try:
+                    return json_loads(text)
+                except (JSONDecodeError, TypeError):
+                    pass
+
+    # 如果无法提取，返回原始格式
+    return formatted_result
+
+
 class FastMCPClient:
     """
     通用 MCP 客户端 - 基于 fastmcp 库
     可以连接任何 MCP 服务器并调用工具
+
+    call_tool 结果缓存（见 cached_tool）可从两处关闭：
+      - 服务器端：在 CallToolResult 中返回 _meta: {"cache_hint": "no-cache"}，
+        有状态或非确定性的工具用它避免结果被缓存；_meta 只供客户端使用，不会传给 LLM
+      - 调用方：call_tool(..., cache=False)，本次调用既不读也不写缓存
     """
 
     def __init__(self, server_url: str, service_token: Optional[str] = None):
@@ -213,6 +819,8 @@ class FastMCPClient:
         self.server_url = server_url
         self.service_token = service_token
         self._client = None
+        # 连接后一直处于 Client 上下文中（会话已 initialize），断开时统一退出
+        self._stack: Optional[AsyncExitStack] = None
         # 强制使用旧 API，避免上下文管理器问题
         self.USE_NEW_API = False
 
@@ -226,7 +834,7 @@ class FastMCPClient:
         await self.disconnect()
 
     async def connect(self):
-        """连接到 MCP 服务器"""
+        """连接到 MCP 服务器，并进入 Client 上下文完成一次握手，之后的调用都复用该会话"""
         try:
             # 旧的 API：使用 Client + StreamableHttpTransport
             from fastmcp import Client
@@ -240,13 +848,27 @@ class FastMCPClient:
             transport = StreamableHttpTransport(url=url)
             # 注意：Client 对象本身是上下文管理器
             self._client = Client(transport)
+
+            stack = AsyncExitStack()
+            await stack.enter_async_context(self._client)
+            self._stack = stack
         except Exception as e:
             raise Exception(f"连接 MCP 服务器失败: {str(e)}")
 
+    async def open(self):
+        """
+        连接并保持会话打开（长连接），已连接时不做任何事
+
+        之后的 list_tools / call_tool 复用同一会话，不再每次重新握手和 initialize
+        """
+        if self._stack is None:
+            await self.connect()
+
     async def disconnect(self):
         """断开与 MCP 服务器的连接"""
-        if hasattr(self, '_client') and self._client:
-            await self._client.close()
+        stack, self._stack = self._stack, None
+        if stack is not None:
+            await stack.aclose()
 
     @property
     def client(self):
@@ -255,62 +877,8 @@ class FastMCPClient:
             raise RuntimeError("客户端未连接。请使用 'async with client:' 上下文管理器")
         return self._client
 
-    def _format_result(self, result):
-        """
-        格式化结果，将 CallToolResult、TextContent 等对象转换为可序列化的格式
-
-        Args:
-            result: 原始结果
-
-        Returns:
-            格式化后的结果
-        """
-        # 处理 None
-        if result is None:
-            return None
-
-        # 处理基本类型
-        if isinstance(result, (str, int, float, bool)):
-            return result
-
-        # 处理列表
-        if isinstance(result, list):
-            return [self._format_result(item) for item in result]
-
-        # 处理字典
-        if isinstance(result, dict):
-            return {key: self._format_result(value) for key, value in result.items()}
-
-        # 处理 CallToolResult 对象
-        if hasattr(result, 'content'):
-            formatted_content = self._format_result(result.content)
-            return {
-                "content": formatted_content,
-                "isError": getattr(result, 'isError', False),
-            }
-
-        # 处理 TextContent 对象
-        if hasattr(result, 'text'):
-            return {
-                "type": "text",
-                "text": getattr(result, 'text', str(result)),
-            }
-
-        # 处理其他有 __dict__ 的对象
-        if hasattr(result, '__dict__'):
-            return {key: self._format_result(value) for key, value in result.__dict__.items()}
-
-        # 处理其他对象，尝试获取常见属性
-        if hasattr(result, '__class__'):
-            obj_dict = {}
-            for attr in ['text', 'content', 'data', 'value', 'message', 'error']:
-                if hasattr(result, attr):
-                    obj_dict[attr] = self._format_result(getattr(result, attr))
-            if obj_dict:
-                return obj_dict
-
-        # 最后尝试转换为字符串
-        return str(result)
+    # 保留为静态方法，兼容通过类或实例调用的代码
+    _format_result = staticmethod(_format_result)
 
     async def list_tools(self) -> List[Dict[str, Any]]:
         """
@@ -323,13 +891,11 @@ class FastMCPClient:
             raise Exception("MCP 客户端未连接。请使用 'async with client:' 上下文管理器")
 
         try:
-            # 直接在客户端的上下文中调用
-            async with self._client:
-                tools = await self._client.list_tools()
-                return tools
+            return await self._client.list_tools()
         except Exception as e:
             raise Exception(f"列出工具失败: {str(e)}")
 
+    @cached_tool
     async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """
         调用 MCP 工具
@@ -345,12 +911,17 @@ class FastMCPClient:
             raise Exception("MCP 客户端未连接。请使用 'async with client:' 上下文管理器")
 
         try:
-            # 直接在客户端的上下文中调用
-            async with self._client:
-                result = await self._client.call_tool(name, arguments)
-                return self._format_result(result)
+            # call_tool_mcp 返回 MCP 协议层的 CallToolResult（含 _meta 与 isError），不做 fastmcp 的二次解析
+            result = await self._client.call_tool_mcp(name, arguments)
+            if result.isError:
+                text = next((getattr(block, 'text', None) for block in result.content), None)
+                raise ToolError(text or f"工具 '{name}' 执行失败")
+            formatted_result = _format_result(result)
+            # 设置了 TOOL_RESULT_OFFLOAD_BYTES 时，大体积结果转存到对象存储，只返回引用（需要全文时用
+            # tool_result_cache.resolve_ref 取回）；默认关闭，原样返回
+            return await offload_large_result(name, formatted_result)
         except Exception as e:
-            raise Exception(f"调用工具 '{name}' 失败: {str(e)}")
+            raise Exception(f"调用工具 '{name}' 失败: {str(e)}") from e
 
     @staticmethod
     def format_tools_for_llm(tool) -> str:
@@ -363,23 +934,24 @@ class FastMCPClient:
         Returns:
             格式化的工具描述
         """
-        args_desc = []
-
-        # FastMCP 工具对象可能使用 inputSchema 或 input_schema
-        schema = None
-        for attr_name in ['inputSchema', 'input_schema', 'schema', 'parameters']:
-            schema = getattr(tool, attr_name, None)
-            if schema is not None:
-                break
+        tool_name = getattr(tool, 'name', 'unknown')
+        tool_desc = getattr(tool, 'description', '')
 
-        # 如果 schema 是对象而非字典，尝试转换
-        if schema is not None and hasattr(schema, '__dict__'):
-            schema = vars(schema) if not isinstance(schema, dict) else schema
+        if HAS_MCP_TYPES and isinstance(tool, MCPTool):
+            # MCP SDK 的 Tool：inputSchema 本身就是字典
+            schema = tool.inputSchema
+        else:
+            # FastMCP 工具对象可能使用 inputSchema 或 input_schema
+            schema = next(filter(lambda s: s is not None, (getattr(tool, attr, None) for attr in _SCHEMA_ATTRS)), None)
 
-        # 如果 schema 有 model_dump 方法（Pydantic 模型）
-        if schema is not None and hasattr(schema, 'model_dump'):
-            schema = schema.model_dump()
+        if schema is not None and not isinstance(schema, dict):
+            if hasattr(schema, 'model_dump'):
+                # Pydantic 模型
+                schema = schema.model_dump()
+            elif hasattr(schema, '__dict__'):
+                schema = vars(schema)
 
+        args_desc = []
         if isinstance(schema, dict) and "properties" in schema:
             properties = schema["properties"]
             required = schema.get("required", [])
@@ -393,40 +965,11 @@ class FastMCPClient:
                     arg_desc += " (required)"
                 args_desc.append(arg_desc)
 
-        tool_name = getattr(tool, 'name', 'unknown')
-        tool_desc = getattr(tool, 'description', '')
         return f"Tool: {tool_name}\nDescription: {tool_desc}\nArguments:\n{chr(10).join(args_desc)}"
 
     @staticmethod
-    def extract_response_data(formatted_result):
-        """
-        从 FastMCP 返回的格式化结果中提取实际的响应数据
-
-        Args:
-            formatted_result: 格式化结果
-
-        Returns:
-            提取的响应数据
-        """
-        if not isinstance(formatted_result, dict):
-            return formatted_result
-
-        # 如果直接包含 status，说明已经是解析后的数据
-        if "status" in formatted_result:
-            return formatted_result
-
-        # 尝试从 content 中提取
-        if "content" in formatted_result:
-            content = formatted_result["content"]
-            if isinstance(content, list) and len(content) > 0:
-                first_item = content[0]
-                if isinstance(first_item, dict) and "text" in first_item:
-                    text = first_item["text"]
-                    # 尝试解析 JSON 字符串
-                    try:
-                        return json.loads(text)
-                    except (json.JSONDecodeError, TypeError):
-                        pass
+    def is_ref(obj) -> bool:
+        """判断 call_tool 的返回值是否为大体积结果的转存引用"""
+        return is_result_ref(obj)
 
-        # 如果无法提取，返回原始格式
-        return formatted_result
\ No newline at end of file
+    extract_response_data = staticmethod(extract_response_data)
\ No newline at end of file
@@ -5,9 +5,18 @@
 """
 import asyncio
 import json
+import logging
 from typing import Dict, Any, List, Optional
 from config import settings
 
+try:
+    from .fast_json import json_dumps
+    from .mcp_client import FastMCPClient, HAS_MCP_TYPES, MCPTool, extract_response_data
+except ImportError:
+    # 直接运行时的备选方案
+    from fast_json import json_dumps
+    from mcp_client import FastMCPClient, HAS_MCP_TYPES, MCPTool, extract_response_data
+
 # 尝试导入 fastmcp
 try:
     from fastmcp import streamable_http_client
@@ -22,6 +31,85 @@ except ImportError:
         print("   请运行: pip install fastmcp>=2.8.0,<2.12.0")
         exit(1)
 
+# 传输层 / 连接失效类异常：只有这类失败才丢弃长连接，工具自身报错（ToolError 等）不影响连接
+_CONNECTION_ERRORS = (ConnectionError, OSError, EOFError, asyncio.TimeoutError)
+try:
+    import httpx
+    _CONNECTION_ERRORS += (httpx.TransportError,)
+except ImportError:
+    pass
+try:
+    import anyio
+    _CONNECTION_ERRORS += (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+except ImportError:
+    pass
+try:
+    from mcp.shared.exceptions import McpError
+    from mcp.types import CONNECTION_CLOSED
+except ImportError:
+    McpError = None
+    CONNECTION_CLOSED = None
+
+logger = logging.getLogger(__name__)
+
+# 工具对象上可能存放参数模式的属性名
+_SCHEMA_ATTRS = ('inputSchema', 'input_schema', 'schema', 'parameters')
+
+
+def _read_only_hint(annotations) -> bool:
+    """MCP 工具注解中的 readOnlyHint（注解可能是 ToolAnnotations 对象或字典），未声明时为 False"""
+    if isinstance(annotations, dict):
+        return annotations.get('readOnlyHint') is True
+    return getattr(annotations, 'readOnlyHint', None) is True
+
+
+def _normalize_tool(tool) -> Dict[str, Any]:
+    """把不同形态的工具对象（MCP SDK Tool、字典、其他对象）统一为 {name, description, schema, read_only}"""
+    if HAS_MCP_TYPES and isinstance(tool, MCPTool):
+        # MCP SDK 的 Tool：字段固定，直接读取，无需逐个探测
+        return {
+            'name': tool.name,
+            'description': tool.description or '',
+            'schema': tool.inputSchema,
+            'read_only': _read_only_hint(tool.annotations),
+        }
+
+    if isinstance(tool, dict):
+        return {
+            'name': tool.get('name', 'unknown'),
+            'description': tool.get('description', ''),
+            'schema': tool.get('inputSchema') or tool.get('input_schema') or tool.get('schema'),
+            'read_only': _read_only_hint(tool.get('annotations')),
+        }
+
+    if hasattr(tool, 'name'):
+        name_attr = tool.name
+        return {
+            'name': name_attr() if callable(name_attr) else str(name_attr),
+            'description': getattr(tool, 'description', ''),
+            'schema': next(filter(lambda s: s is not None, (getattr(tool, attr, None) for attr in _SCHEMA_ATTRS)), None),
+            'read_only': _read_only_hint(getattr(tool, 'annotations', None)),
+        }
+
+    if hasattr(tool, '__name__'):
+        return {'name': str(tool.__name__), 'description': '', 'schema': None, 'read_only': False}
+
+    return {'name': 'unknown', 'description': '', 'schema': None, 'read_only': False}
+
+
+def _is_connection_error(exc: BaseException) -> bool:
+    """判断异常（含 __cause__ / __context__ 链）是否由连接失效引起"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, _CONNECTION_ERRORS):
+            return True
+        if McpError is not None and isinstance(exc, McpError) and \
+                getattr(getattr(exc, 'error', None), 'code', None) == CONNECTION_CLOSED:
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
 
 class MultiMCPClient:
     """
@@ -35,6 +123,11 @@ class MultiMCPClient:
         self.servers = {}
         self.tools_index = {}  # 工具名称到服务器 URL 的映射
         self.tools_info = {}  # 工具名称到完整工具信息的映射（包含参数模式）
+        self._clients = {}  # 服务器名称到长连接 FastMCPClient 的映射
+        self._client_locks = {}  # 服务器名称到建立连接时使用的锁
+        self._ping_task = None  # 保活任务
+        self.ping_interval = 60  # 保活间隔（秒）
+        self.list_tools_timeout = 10  # 单个服务器列出工具的超时（秒）
 
         # 初始化 MCP 服务器
         self._init_servers()
@@ -59,6 +152,10 @@ class MultiMCPClient:
                 "description": "测试 MCP 服务器（联系人、文件、日程管理）"
             }
 
+        # 服务器地址和令牌初始化后不再变化，预先拼好带认证的 URL
+        for server in self.servers.values():
+            server['auth_url'] = self._build_url(server['url'], server['service_token'])
+
         print(f"[MultiMCP] 初始化了 {len(self.servers)} 个 MCP 服务器:")
         for name, server in self.servers.items():
             print(f"  - {name}: {server['url']}")
@@ -80,78 +177,115 @@ class MultiMCPClient:
         """
         all_tools = {}
 
-        for server_name, server_info in self.servers.items():
-            print(f"\n📋 列出 {server_name} ({server_info['description']}) 的工具...")
-            try:
-                url = self._build_url(server_info['url'], server_info['service_token'])
-                tools = await self._list_tools_from_server(url)
-                all_tools[server_name] = tools
+        # 各服务器并发列出工具，总耗时取决于最慢的服务器而非所有服务器之和
+        server_items = list(self.servers.items())
+        for server_name, server_info in server_items:
+            logger.info("列出 %s (%s) 的工具...", server_name, server_info['description'])
+        results = await asyncio.gather(
+            *[
+                asyncio.wait_for(
+                    self._list_tools_from_server(server_info['auth_url']),
+                    timeout=self.list_tools_timeout
+                )
+                for _, server_info in server_items
+            ],
+            return_exceptions=True
+        )
+
+        for (server_name, server_info), tools in zip(server_items, results):
+            if isinstance(tools, BaseException):
+                if isinstance(tools, asyncio.TimeoutError):
+                    logger.warning("列出 %s 工具超时（%ss）", server_name, self.list_tools_timeout)
+                else:
+                    logger.warning("列出 %s 工具失败: %s", server_name, tools)
+                all_tools[server_name] = []
+                continue
 
-                # 打印工具列表并保存完整工具信息
+            all_tools[server_name] = tools
+            if logger.isEnabledFor(logging.DEBUG):
                 for tool in tools:
-                    tool_name = "unknown"
-                    tool_desc = ""
-                    tool_schema = None
-
-                    # 添加调试信息
-                    print(f"  [DEBUG] Processing tool: {type(tool)} - {tool}")
-
-                    # 提取工具名称
-                    if isinstance(tool, dict):
-                        tool_name = tool.get('name', 'unknown')
-                        tool_desc = tool.get('description', '')
-                        tool_schema = tool.get('inputSchema') or tool.get('input_schema') or tool.get('schema')
-                    elif hasattr(tool, 'name'):
-                        name_attr = tool.name
-                        tool_name = name_attr() if callable(name_attr) else str(name_attr)
-                        tool_desc = getattr(tool, 'description', '')
-                        # 尝试获取参数模式
-                        for attr_name in ['inputSchema', 'input_schema', 'schema', 'parameters']:
-                            tool_schema = getattr(tool, attr_name, None)
-                            if tool_schema is not None:
-                                break
-                    elif hasattr(tool, '__name__'):
-                        tool_name = str(tool.__name__)
-
-                    print(f"  - {tool_name}")
-                    # 建立工具索引
-                    if tool_name != "unknown":
-                        self.tools_index[tool_name] = server_name
-                        # 保存完整的工具信息（包含参数模式）
-                        self.tools_info[tool_name] = {
-                            'name': tool_name,
-                            'description': tool_desc,
-                            'schema': tool_schema,
-                            'server': server_name
-                        }
-
-            except Exception as e:
-                print(f"⚠️  列出 {server_name} 工具失败: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                all_tools[server_name] = []
+                    logger.debug("Processing tool: %s - %s", type(tool), tool)
+
+            # 先统一工具形态，再一次性建立工具索引和完整工具信息（包含参数模式）
+            normalized = [(tool, _normalize_tool(tool)) for tool in tools]
+            normalized = [(tool, info) for tool, info in normalized if info['name'] != "unknown"]
+            self.tools_index.update({info['name']: server_name for _, info in normalized})
+            self.tools_info.update({
+                info['name']: {**info, 'server': server_name}
+                for _, info in normalized
+            })
+
+            logger.info("%s 的工具 (%d): %s", server_name, len(normalized), [info['name'] for _, info in normalized])
 
         return all_tools
 
     async def _list_tools_from_server(self, url: str) -> List[Dict[str, Any]]:
         """从单个服务器列出工具"""
-        # 使用 FastMCPClient 包装器以确保一致性
-        try:
-            from .mcp_client import FastMCPClient
-        except ImportError:
-            # 直接运行时的备选方案
-            from mcp_client import FastMCPClient
-
         async with FastMCPClient(url) as client:
             return await client.list_tools()
 
-    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    async def _get_client(self, server_name: str):
+        """获取服务器的长连接客户端，首次调用时建立连接（同一服务器只连接一次）"""
+        client = self._clients.get(server_name)
+        if client is not None:
+            return client
+
+        lock = self._client_locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            client = self._clients.get(server_name)
+            if client is None:
+                server_info = self.servers[server_name]
+                client = FastMCPClient(server_info['auth_url'])
+                await client.open()
+                self._clients[server_name] = client
+                logger.info("[MultiMCP] 已建立到 %s 的长连接", server_name)
+
+                if self._ping_task is None or self._ping_task.done():
+                    self._ping_task = asyncio.create_task(self._ping_loop())
+        return client
+
+    async def _drop_client(self, server_name: str):
+        """丢弃（可能已失效的）长连接，下次调用时重新连接"""
+        client = self._clients.pop(server_name, None)
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    async def _ping_loop(self):
+        """定期在长连接上请求 tools/list，避免连接被 NAT / 服务端空闲超时断开"""
+        while self._clients:
+            await asyncio.sleep(self.ping_interval)
+            for server_name, client in list(self._clients.items()):
+                try:
+                    await client.client.list_tools()
+                except Exception as e:
+                    logger.warning("[MultiMCP] %s 保活失败，下次调用时重连: %s", server_name, e)
+                    await self._drop_client(server_name)
+
+    async def aclose(self):
+        """关闭所有长连接和保活任务"""
+        if self._ping_task is not None:
+            self._ping_task.cancel()
+            self._ping_task = None
+        for server_name in list(self._clients):
+            await self._drop_client(server_name)
+
+    async def call_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        cache: Optional[bool] = None
+    ) -> Dict[str, Any]:
         """
         调用指定工具
 
         Args:
             tool_name: 工具名称
             arguments: 工具参数
+            cache: 传 False 时本次调用跳过工具结果缓存（不读也不写），
+                一次性或非确定性的调用可用它避免污染缓存
 
         Returns:
             工具执行结果
@@ -166,76 +300,38 @@ class MultiMCPClient:
                 "arguments": arguments
             }
 
-        server_info = self.servers[server_name]
-        print(f"\n🧪 在 {server_name} ({server_info['description']}) 调用工具: {tool_name}")
-        print(f"   参数: {json.dumps(arguments, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("在 %s 调用工具: %s 参数: %s", server_name, tool_name, json_dumps(arguments))
 
         try:
-            url = self._build_url(server_info['url'], server_info['service_token'])
-
-            if USE_NEW_API:
-                async with streamable_http_client(url) as client:
-                    result = await client.call_tool(tool_name, arguments)
-                    # 格式化结果
-                    try:
-                        from .mcp_client import FastMCPClient
-                    except ImportError:
-                        from mcp_client import FastMCPClient
-                    client_instance = FastMCPClient(url)
-                    formatted_result = client_instance._format_result(result)
-                    extracted_data = client_instance.extract_response_data(formatted_result)
-
-                    # 检查是否包含错误状态码
-                    success = True
-                    error_message = None
-                    if isinstance(extracted_data, dict) and extracted_data.get("status") == 500:
-                        success = False
-                        error_message = extracted_data.get("message", "Internal Server Error")
-                        print(f"[MultiMCP ERROR] 工具 '{tool_name}' 返回 500 错误: {error_message}")
-
-                    return {
-                        "success": success,
-                        "result": extracted_data,
-                        "tool_name": tool_name,
-                        "arguments": arguments,
-                        "server": server_name,
-                        "raw_result": formatted_result,
-                        "error": error_message
-                    }
-            else:
-                transport = StreamableHttpTransport(url=url)
-                async with Client(transport) as client:
-                    result = await client.call_tool(tool_name, arguments)
-                    # 格式化结果
-                    try:
-                        from .mcp_client import FastMCPClient
-                    except ImportError:
-                        from mcp_client import FastMCPClient
-                    client_instance = FastMCPClient(url)
-                    formatted_result = client_instance._format_result(result)
-                    extracted_data = client_instance.extract_response_data(formatted_result)
-
-                    # 检查是否包含错误状态码
-                    success = True
-                    error_message = None
-                    if isinstance(extracted_data, dict) and extracted_data.get("status") == 500:
-                        success = False
-                        error_message = extracted_data.get("message", "Internal Server Error")
-                        print(f"[MultiMCP ERROR] 工具 '{tool_name}' 返回 500 错误: {error_message}")
-
-                    return {
-                        "success": success,
-                        "result": extracted_data,
-                        "tool_name": tool_name,
-                        "arguments": arguments,
-                        "server": server_name,
-                        "raw_result": formatted_result,
-                        "error": error_message
-                    }
+            client = await self._get_client(server_name)
+            formatted_result = await client.call_tool(tool_name, arguments, cache=cache)
+            extracted_data = extract_response_data(formatted_result)
+
+            # 检查是否包含错误状态码
+            success = True
+            error_message = None
+            if isinstance(extracted_data, dict) and extracted_data.get("status") == 500:
+                success = False
+                error_message = extracted_data.get("message", "Internal Server Error")
+                logger.error("[MultiMCP] 工具 '%s' 返回 500 错误: %s", tool_name, error_message)
+
+            return {
+                "success": success,
+                "result": extracted_data,
+                "tool_name": tool_name,
+                "arguments": arguments,
+                "server": server_name,
+                "raw_result": formatted_result,
+                "error": error_message
+            }
 
         except Exception as e:
+            if _is_connection_error(e):
+                # 连接已失效，丢弃后下次调用重新连接；工具自身的错误不影响长连接
+                await self._drop_client(server_name)
             error_msg = f"在 {server_name} 调用工具 '{tool_name}' 失败: {str(e)}"
-            print(f"[MultiMCP ERROR] {error_msg}")
+            logger.error("[MultiMCP] %s", error_msg)
             return {
                 "success": False,
                 "error": error_msg,
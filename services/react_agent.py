@@ -4,11 +4,80 @@ Implements the ReAct pattern: Reason -> Act -> Observe -> Repeat
 """
 
 import asyncio
+import hashlib
 import json
-from typing import List, Dict, Any, Optional, Callable, Union
-from datetime import datetime
+import logging
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple, Union
+from datetime import datetime, timezone
 import uuid
 
+from services.fast_json import json_loads, json_dumps_canonical, JSONDecodeError
+from services.skill_cache import Skill, SkillCache
+
+logger = logging.getLogger(__name__)
+
+# Optional: Aho-Corasick automaton for keyword routing (pip install pyahocorasick)
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+
+# Keyword categories used by the rule-based action selection
+_KEYWORD_CATEGORIES = {
+    "weather": ["天气", "weather", "气温", "下雨", "晴天", "多云"],
+    "time": ["时间", "time"],
+    "image": ["image", "图片"],
+    "image_search": ["search"],
+    "greeting": ["你好", "hello", "hi", "你是谁", "who are you"],
+    # Topics that turn a greeting-looking query into a real question
+    "topic": ["fastmcp", "mcp", "介绍", "introduce", "解释", "explain", "时间", "time", "天气", "weather"],
+}
+_CITIES = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", "西安", "重庆"]
+
+
+def _build_keyword_index() -> Dict[str, tuple]:
+    """Map each keyword to all of its tags (a keyword may belong to several categories)"""
+    index: Dict[str, list] = {}
+    for category, words in _KEYWORD_CATEGORIES.items():
+        for word in words:
+            index.setdefault(word, []).append(category)
+    for city in _CITIES:
+        index.setdefault(city, []).append(f"city:{city}")
+    return {word: tuple(tags) for word, tags in index.items()}
+
+
+_KEYWORD_INDEX = _build_keyword_index()
+
+if HAS_AHOCORASICK:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _word, _tags in _KEYWORD_INDEX.items():
+        _KEYWORD_AUTOMATON.add_word(_word, _tags)
+    _KEYWORD_AUTOMATON.make_automaton()
+else:
+    # Without pyahocorasick: one compiled alternation, scanned by the C regex engine.
+    # The lookahead lets matches overlap (e.g. "hi" inside "this" next to "time")
+    _KEYWORD_RE = re.compile(
+        "(?=(" + "|".join(re.escape(word) for word in sorted(_KEYWORD_INDEX, key=len, reverse=True)) + "))"
+    )
+
+
+def _match_keyword_tags(text: str) -> set:
+    """Return every tag whose keyword occurs in text (one pass with Aho-Corasick)"""
+    if HAS_AHOCORASICK:
+        return {tag for _, tags in _KEYWORD_AUTOMATON.iter(text) for tag in tags}
+    return {tag for word in set(_KEYWORD_RE.findall(text)) for tag in _KEYWORD_INDEX[word]}
+
+
+def _action_key(action: Dict[str, Any]) -> tuple:
+    """Identity of a tool call: tool name plus canonically serialised arguments"""
+    return action["tool"], json_dumps_canonical(action.get("arguments") or {})
+
 
 class Tool:
     """Tool definition for ReAct agent"""
@@ -26,6 +95,42 @@ class Tool:
         self.function = function
 
 
+class _LLMResponseCache:
+    """
+    Exact-match LRU + TTL cache for LLM completions
+
+    Keys are SHA-1 digests of (method, normalized query, extra context), so repeated
+    queries like "北京天气" / "你是谁" skip the Azure round trip entirely.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @staticmethod
+    def make_key(method: str, query: str, extra: str = "") -> str:
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha1(f"{method}\0{normalized}\0{extra}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
 class ReActAgent:
     """
     ReAct Agent that combines reasoning and acting in a loop
@@ -37,30 +142,122 @@ class ReActAgent:
         self.tools = tools or []
         self.tool_registry = {tool.name: tool for tool in self.tools}
         self.max_iterations = 10
+        # Azure OpenAI service shared by think / _decide_action / _generate_final_answer,
+        # created on first use (keeps its HTTP session and pooled connections across calls)
+        self._azure = None
+        # Pools concurrent completions from all runs into short dispatch windows
+        self._dispatcher = None
+        # Cache for think / _decide_action completions (the tool registry is fixed, so
+        # the same query always produces the same prompt)
+        self._llm_cache = _LLMResponseCache()
+        # Background tool calls still running after the acknowledgement timeout, by task_id
+        from config import settings
+        self.tool_ack_timeout = settings.react_tool_ack_timeout
+        self._pending: Dict[str, asyncio.Task] = {}
+        # task_id of the background call still running for each (tool, arguments), so the same
+        # call is never started twice while its ticket is outstanding
+        self._pending_calls: Dict[tuple, str] = {}
+        # Compiled query-pattern -> tool routes that bypass LLM reasoning
+        self._skills = SkillCache(settings.react_skill_cache_path)
+        if self.tool_ack_timeout > 0:
+            self.tool_registry["check_task"] = Tool(
+                name="check_task",
+                description="Check the status / result of a tool call that is still running (by task_id)",
+                parameters={"type": "object", "properties": {"task_id": {"type": "string"}}},
+                function=self._check_task
+            )
+        # Tool catalog JSON embedded in the reasoning prompts, rebuilt only when tools change
+        self._refresh_tool_catalog()
 
-        # Print all registered tools
-        print(f"\n=== ReAct Agent initialized with {len(self.tools)} tools ===")
-        for tool in self.tools:
-            print(f"  - {tool.name}: {tool.description}")
-        print("==========================================\n")
+        # Log all registered tools (debug only)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("ReAct Agent initialized with %d tools", len(self.tools))
+            for tool in self.tools:
+                logger.debug("  - %s: %s", tool.name, tool.description)
 
     def add_tool(self, tool: Tool):
         """Add a tool to the agent"""
         self.tool_registry[tool.name] = tool
+        self._refresh_tool_catalog()
+
+    def _refresh_tool_catalog(self):
+        """Re-serialize the tool catalog used by think / _think_and_decide prompts"""
+        self._tool_catalog_json = json.dumps(
+            [{"name": name, "description": tool.description} for name, tool in self.tool_registry.items()],
+            indent=2,
+            ensure_ascii=False
+        )
+
+    def _get_azure_service(self):
+        """Return the shared Azure OpenAI service, creating it on first use"""
+        if self._azure is None:
+            # Imported lazily to avoid an import cycle at module load
+            from services.azure_openai_service import AzureOpenAIService
+            from config import settings
+
+            self._azure = AzureOpenAIService(
+                endpoint=settings.azure_endpoint,
+                api_key=settings.azure_api_key,
+                api_version=settings.azure_api_version,
+                deployment_name=settings.azure_deployment_name
+            )
+        return self._azure
+
+    def _get_dispatcher(self):
+        """Return the LLM dispatcher that windows completions onto the shared Azure service"""
+        if self._dispatcher is None:
+            from services.llm_dispatcher import LLMDispatcher
+            from config import settings
+
+            self._dispatcher = LLMDispatcher(
+                self._get_azure_service,
+                batch_window_ms=settings.llm_batch_window_ms,
+                batch_max_size=settings.llm_batch_max_size
+            )
+        return self._dispatcher
+
+    async def _cached_completion(
+        self,
+        method: str,
+        query: str,
+        messages: List[Dict[str, Any]],
+        extra: str = "",
+        **kwargs
+    ) -> str:
+        """Run a chat completion through the exact-match cache and return the message content"""
+        key = self._llm_cache.make_key(method, query, extra)
+        cached = self._llm_cache.get(key)
+        if cached is not None:
+            logger.debug("[%s] Cache hit for query: %r", method.upper(), query)
+            return cached
+
+        response = await self._get_dispatcher().submit(messages, **kwargs)
+        content = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+        # Only cache real model output; empty responses fall through to the callers' fallbacks
+        if content:
+            self._llm_cache.set(key, content)
+        return content
+
+    async def aclose(self):
+        """Cancel background tool calls and close the LLM dispatcher, Azure service and MCP clients"""
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        self._pending_calls.clear()
+        await close_mcp_clients()
+        if self._dispatcher is not None:
+            await self._dispatcher.close()
+            self._dispatcher = None
+        if self._azure is not None:
+            await self._azure.aclose()
+            self._azure = None
 
     async def think(self, query: str, context: Optional[List[Dict]] = None) -> str:
         """
         Generate reasoning based on query and context
         Uses Azure OpenAI to generate thoughts
         """
-        from services.azure_openai_service import AzureOpenAIService
-        from config import settings
-
-        # Print available tools for debugging
-        print(f"\n[THINK] Available tools for query '{query}':")
-        for name, tool in self.tool_registry.items():
-            print(f"  - {name}: {tool.description}")
-        print()
+        logger.debug("[THINK] Reasoning for query %r over tools: %s", query, list(self.tool_registry))
 
         # Use Azure OpenAI to generate detailed reasoning and tool selection
         prompt = f"""分析以下用户查询，确定需要采取的行动:
@@ -68,7 +265,7 @@ class ReActAgent:
 用户查询: {query}
 
 可用工具:
-{json.dumps([{"name": name, "description": tool.description} for name, tool in self.tool_registry.items()], indent=2, ensure_ascii=False)}
+{self._tool_catalog_json}
 
 请分析查询内容，思考需要使用哪个工具，并给出详细的推理过程。
 特别关注：
@@ -87,26 +284,93 @@ class ReActAgent:
         ]
 
         try:
-            azure_service = AzureOpenAIService(
-                endpoint=settings.azure_endpoint,
-                api_key=settings.azure_api_key,
-                api_version=settings.azure_api_version,
-                deployment_name=settings.azure_deployment_name
-            )
-            response = await azure_service.chat_completion(messages, max_tokens=300)
-            thought = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+            thought = await self._cached_completion("think", query, messages, max_tokens=300)
             return thought or f"需要查询: {query}"
         except Exception:
             # Fallback to simple reasoning
             return f"用户询问: {query}。需要分析查询内容并确定合适的行动。"
 
+    async def _dispatch(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Start a tool call in the background and return its ticket (the existing one if the same call is still running)"""
+        call_key = _action_key({"tool": tool_name, "arguments": arguments})
+        task_id = self._pending_calls.get(call_key)
+        if task_id is not None and task_id in self._pending:
+            return {"task_id": task_id}
+
+        task_id = uuid.uuid4().hex
+        task = self._pending[task_id] = asyncio.ensure_future(self.act(tool_name, arguments))
+        self._pending_calls[call_key] = task_id
+        task.add_done_callback(lambda _: self._expire_pending(call_key, task_id))
+        return {"task_id": task_id}
+
+    def _expire_pending(self, call_key: tuple, task_id: str):
+        """Forget a finished background call after _PENDING_RESULT_TTL if check_task never collected it"""
+        if self._pending_calls.get(call_key) == task_id:
+            del self._pending_calls[call_key]
+        asyncio.get_running_loop().call_later(_PENDING_RESULT_TTL, self._pending.pop, task_id, None)
+
+    async def _await_ticket(self, task_id: str) -> Dict[str, Any]:
+        """Wait for an outstanding background call, then collect it through check_task"""
+        task = self._pending.get(task_id)
+        if task is not None:
+            await asyncio.wait({task})
+        return await self.act("check_task", {"task_id": task_id})
+
+    @staticmethod
+    def _running_ticket(observation: Any) -> Optional[str]:
+        """task_id of an acknowledgement whose tool call is still running, else None"""
+        result = observation.get("result") if isinstance(observation, dict) else None
+        if isinstance(result, dict) and result.get("status") == "running":
+            return result.get("task_id")
+        return None
+
+    async def _check_task(self, task_id: str) -> Dict[str, Any]:
+        """check_task tool: report a background tool call's status, and its observation once done"""
+        task = self._pending.get(task_id)
+        if task is None:
+            return {"task_id": task_id, "status": "unknown"}
+        if not task.done():
+            return {"task_id": task_id, "status": "running"}
+
+        del self._pending[task_id]
+        if task.cancelled():
+            return {"task_id": task_id, "status": "cancelled"}
+        if task.exception() is not None:
+            return {"task_id": task_id, "status": "failed", "error": str(task.exception())}
+        return {"task_id": task_id, "status": "done", "observation": task.result()}
+
+    async def _act_with_ack(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Execute a tool, but if it hasn't finished within tool_ack_timeout return an
+        acknowledgement (task_id) instead of blocking; the result stays available via check_task
+        """
+        if self.tool_ack_timeout <= 0 or tool_name in ("no_tool_needed", "check_task"):
+            return await self.act(tool_name, arguments)
+
+        task_id = (await self._dispatch(tool_name, arguments))["task_id"]
+        task = self._pending[task_id]
+        done, _ = await asyncio.wait({task}, timeout=self.tool_ack_timeout)
+        if done:
+            self._pending.pop(task_id, None)
+            return task.result()
+
+        logger.debug("[ACT] Tool %s still running, continuing with task_id %s", tool_name, task_id)
+        return {
+            "tool": tool_name,
+            "result": {
+                "message": "工具仍在执行，可通过 check_task 查询结果",
+                "task_id": task_id,
+                "status": "running"
+            }
+        }
+
     async def act(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """
         Execute the specified tool with given arguments
         """
         # Handle special case: no tool needed
         if tool_name == "no_tool_needed":
-            print(f"[ACT] Executing: no_tool_needed")
+            logger.debug("[ACT] Executing: no_tool_needed")
             return {
                 "tool": tool_name,
                 "result": {
@@ -121,13 +385,11 @@ class ReActAgent:
         tool = self.tool_registry[tool_name]
 
         # Print tool execution
-        print(f"\n[ACT] Executing tool: {tool_name}")
-        print(f"[ACT] Description: {tool.description}")
-        print(f"[ACT] Arguments: {arguments}")
+        logger.debug("[ACT] Executing tool %s args=%s", tool_name, arguments)
 
         result = await tool.function(**arguments)
 
-        print(f"[ACT] Completed tool: {tool_name}")
+        logger.debug("[ACT] Completed tool: %s", tool_name)
 
         return {
             "tool": tool_name,
@@ -137,7 +399,8 @@ class ReActAgent:
     async def run(
         self,
         query: str,
-        max_iterations: Optional[int] = None
+        max_iterations: Optional[int] = None,
+        stream: bool = False
     ) -> Dict[str, Any]:
         """
         Main ReAct loop: Think -> Act -> Observe -> (repeat)
@@ -145,6 +408,9 @@ class ReActAgent:
         Args:
             query: User query
             max_iterations: Maximum number of reasoning-acting iterations
+            stream: If True, "answer" is an async iterator of answer fragments
+                (see StreamingService.generate_answer_stream) instead of a string.
+                Library API only: no app endpoint serves ReActAgent (main.py uses TrueReActAgent)
 
         Returns:
             Dict containing the final answer and trace of reasoning
@@ -153,19 +419,67 @@ class ReActAgent:
         trace = []
         context = []
 
+        # Unambiguous queries (weather in a known city / time / greeting) are routed
+        # straight to their tool, with no LLM reasoning call
+        # Lowercased once per run and threaded through the routing / fallback helpers
+        query_lower = query.casefold()
+        # Compiled skills first, then the built-in rule routes
+        skill: Optional[Skill] = None
+        skill_match = self._skills.match(query)
+        if skill_match is not None:
+            skill, fast_action = skill_match
+            logger.debug("[ROUTE] Skill %s matched query: %r", skill.name, query)
+        else:
+            fast_action = self._fast_route(query, query_lower)
+
+        # Ticket of an acknowledged call that is still running: later iterations wait for it
+        # (via check_task) instead of asking the model again and restarting the same tool
+        outstanding_ticket: Optional[str] = None
+
         for iteration in range(max_iterations):
-            # Step 1: Think (Reasoning)
-            thought = await self.think(query, context)
+            # Other high-confidence queries: speculatively run the predicted tool
+            # while the LLM is still reasoning
+            predicted = self._predict_action(query, query_lower) if iteration == 0 and fast_action is None else None
+            speculative_observation = None
+
+            # Step 1 + 2: Think (Reasoning) and Decide Action in a single LLM call
+            if outstanding_ticket is not None:
+                thought = f"工具仍在执行，等待任务 {outstanding_ticket} 的结果"
+                action = {"tool": "check_task", "arguments": {"task_id": outstanding_ticket}}
+            elif iteration == 0 and fast_action is not None:
+                if skill is not None:
+                    thought = f"技能路由: 查询匹配技能 {skill.name}，直接调用工具 {fast_action['tool']}"
+                else:
+                    thought = f"规则路由: 查询明确对应工具 {fast_action['tool']}，无需推理"
+                action = fast_action
+            elif predicted is not None:
+                speculation = asyncio.ensure_future(self.act(predicted["tool"], predicted["arguments"]))
+                try:
+                    thought, action = await self._think_and_decide(query, context, query_lower)
+                except asyncio.CancelledError:
+                    speculation.cancel()
+                    raise
+                except Exception as e:
+                    logger.warning("[SPECULATE] Reasoning failed, keeping predicted action: %s", e)
+                    thought, action = f"用户询问: {query}。需要分析查询内容并确定合适的行动。", predicted
+                if _action_key(action) == _action_key(predicted):
+                    # Prediction confirmed (same tool and arguments): reuse the tool call already running
+                    action = predicted
+                    try:
+                        speculative_observation = await speculation
+                    except Exception as e:
+                        speculative_observation = e
+                else:
+                    # Different tool or arguments (e.g. another city): the speculative result is not valid
+                    speculation.cancel()
+                    logger.debug("[SPECULATE] LLM chose %s over predicted %s, running sequentially", action, predicted)
+            else:
+                thought, action = await self._think_and_decide(query, context, query_lower)
             trace.append({
                 "iteration": iteration + 1,
                 "type": "thought",
                 "content": thought
             })
-
-            # Step 2: Decide Action
-            # Simple heuristic: if query contains "search", use search tool
-            # In production, this would be more sophisticated (LLM-based)
-            action = await self._decide_action(query, context, thought)
             trace.append({
                 "iteration": iteration + 1,
                 "type": "action",
@@ -174,13 +488,27 @@ class ReActAgent:
 
             # Step 3: Act (Execute tool)
             try:
-                observation = await self.act(action["tool"], action["arguments"])
+                if speculative_observation is not None:
+                    if isinstance(speculative_observation, BaseException):
+                        raise speculative_observation
+                    observation = speculative_observation
+                elif outstanding_ticket is not None:
+                    observation = await self._await_ticket(outstanding_ticket)
+                else:
+                    observation = await self._act_with_ack(action["tool"], action["arguments"])
+                outstanding_ticket = self._running_ticket(observation)
                 trace.append({
                     "iteration": iteration + 1,
                     "type": "observation",
                     "content": observation
                 })
                 context.append(observation)
+                if iteration == 0:
+                    # Speculative results are not learned: the route was predicted, not decided from scratch
+                    self._update_skills(
+                        query, skill, action, observation,
+                        from_llm=fast_action is None and speculative_observation is None
+                    )
 
                 # Check if we have enough information to answer
                 if self._should_finish(query, context, observation):
@@ -192,10 +520,14 @@ class ReActAgent:
                     "type": "error",
                     "content": str(e)
                 })
+                if iteration == 0 and skill is not None:
+                    self._skills.record(skill, False)
                 break
 
+        await self._skills.save()
+
         # Step 4: Generate Final Answer
-        final_answer = await self._generate_final_answer(query, context, trace)
+        final_answer = await self._generate_final_answer(query, context, trace, stream=stream, query_lower=query_lower)
 
         return {
             "answer": final_answer,
@@ -204,22 +536,38 @@ class ReActAgent:
             "success": True
         }
 
+    def _update_skills(
+        self,
+        query: str,
+        skill: Optional[Skill],
+        action: Dict[str, Any],
+        observation: Dict[str, Any],
+        from_llm: bool
+    ):
+        """Count the matched skill's outcome, or learn a successful LLM-decided route as a skill"""
+        result = observation.get("result") if isinstance(observation, dict) else None
+        if isinstance(result, dict) and result.get("status") == "running":
+            # Acknowledged but still running: outcome unknown
+            return
+        ok = not (isinstance(result, dict) and result.get("error"))
+        if skill is not None:
+            self._skills.record(skill, ok)
+        elif from_llm and ok and action["tool"] != "check_task":
+            self._skills.learn(query, action)
+
     async def _decide_action(
         self,
         query: str,
         context: List[Dict],
-        thought: str
+        thought: str,
+        query_lower: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Decide which action to take based on query and thought
         Uses Azure OpenAI to analyze the thought and determine the best tool
         """
-        from services.azure_openai_service import AzureOpenAIService
-        from config import settings
-
         # Print decision process
-        print(f"\n[ACTION] Deciding action for query: '{query}'")
-        print(f"[ACTION] Thought: {thought[:200]}...")
+        logger.debug("[ACTION] Deciding action for query %r, thought: %.200s", query, thought)
 
         # Use Azure OpenAI to analyze the thought and decide the best tool
         decision_prompt = f"""基于以下思考过程，决定最佳的工具选择:
@@ -258,59 +606,153 @@ class ReActAgent:
         ]
 
         try:
-            azure_service = AzureOpenAIService(
-                endpoint=settings.azure_endpoint,
-                api_key=settings.azure_api_key,
-                api_version=settings.azure_api_version,
-                deployment_name=settings.azure_deployment_name
+            decision_text = await self._cached_completion(
+                "decide", query, messages, extra=thought, max_tokens=200
             )
-            response = await azure_service.chat_completion(messages, max_tokens=200)
-            decision_text = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+            decision = self._parse_decision(decision_text)
+            if decision is not None:
+                return self._action_from_decision(decision)
+        except Exception as e:
+            logger.warning("[ACTION] AI decision failed: %s", e)
 
-            # Try to parse the JSON decision
-            try:
-                # Extract JSON from the response (in case there's extra text)
-                import re
-                json_match = re.search(r'\{.*\}', decision_text, re.DOTALL)
-                if json_match:
-                    decision_json = json.loads(json_match.group())
-
-                    tool_name = decision_json.get("tool", "web_search")
-                    arguments = decision_json.get("arguments", {})
-
-                    # Special handling for weather queries
-                    if tool_name == "mcp_call_tool" and "weather" in arguments.get("tool_name", "").lower():
-                        print(f"[ACTION] Selected tool: mcp_call_tool (weather query via MCP)")
-                        return {
-                            "tool": "mcp_call_tool",
-                            "arguments": arguments
-                        }
+        return self._rule_based_action(query, query_lower)
 
-                    print(f"[ACTION] Selected tool: {tool_name} (AI decision)")
-                    return {
-                        "tool": tool_name,
-                        "arguments": arguments
-                    }
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"[ACTION] Failed to parse AI decision, using fallback: {e}")
+    async def _think_and_decide(
+        self,
+        query: str,
+        context: List[Dict],
+        query_lower: Optional[str] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Fused think + decide: one LLM call returns both the reasoning and the
+        tool choice as {"thought", "tool", "arguments", "reason"}.
+        Falls back to rule-based action selection if the JSON can't be parsed.
+        """
+        logger.debug("[THINK+ACTION] Reasoning and deciding for query: %r", query)
+
+        prompt = f"""分析以下用户查询，给出推理过程并选择最合适的工具:
+
+用户查询: {query}
+
+可用工具:
+{self._tool_catalog_json}
+- no_tool_needed: 简单对话，不需要工具
+
+特别关注：
+1. 如果查询涉及天气信息，应使用 mcp_call_tool 调用天气工具
+2. 如果查询需要搜索网络信息，使用 web_search
+3. 如果查询涉及图像，使用 analyze_image 或 search_image
+4. 如果查询询问时间，使用 get_current_time
+5. 如果是简单对话，选择 no_tool_needed
 
+请只返回以下JSON格式的结果，不要额外的解释：
+{{
+    "thought": "思考过程：需要使用哪个工具以及原因",
+    "tool": "工具名称",
+    "arguments": {{
+        "query": "搜索关键词或查询内容",
+        "location": "位置信息（如适用）"
+    }},
+    "reason": "选择此工具的原因"
+}}
+"""
+
+        messages = [
+            {"role": "system", "content": "你是一个ReAct智能体，需要分析用户查询并选择合适的工具。请只返回JSON格式的结果。"},
+            {"role": "user", "content": prompt}
+        ]
+
+        try:
+            decision_text = await self._cached_completion(
+                "think_decide", query, messages, max_tokens=400
+            )
+            decision = self._parse_decision(decision_text)
+            if decision is not None:
+                thought = decision.get("thought") or decision.get("reason") or f"需要查询: {query}"
+                return thought, self._action_from_decision(decision)
         except Exception as e:
-            print(f"[ACTION] AI decision failed: {e}")
+            logger.warning("[THINK+ACTION] AI decision failed: %s", e)
 
-        # Fallback to rule-based decision
-        query_lower = query.lower()
+        thought = f"用户询问: {query}。需要分析查询内容并确定合适的行动。"
+        return thought, self._rule_based_action(query, query_lower)
+
+    def _parse_decision(self, decision_text: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Extract the JSON decision object from an LLM response (None if absent/invalid)"""
+        if not decision_text:
+            return None
+        try:
+            # Extract JSON from the response (in case there's extra text):
+            # outermost braces, same span the old r'\{.*\}' DOTALL regex matched
+            start = decision_text.find('{')
+            end = decision_text.rfind('}')
+            if start != -1 and end > start:
+                decision_json = json_loads(decision_text[start:end + 1])
+                if isinstance(decision_json, dict):
+                    return decision_json
+        except (JSONDecodeError, KeyError) as e:
+            logger.warning("[ACTION] Failed to parse AI decision, using fallback: %s", e)
+        return None
+
+    def _action_from_decision(self, decision: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a parsed LLM decision into an action dict"""
+        tool_name = decision.get("tool", "web_search")
+        arguments = decision.get("arguments", {})
+
+        # Special handling for weather queries
+        if tool_name == "mcp_call_tool" and "weather" in arguments.get("tool_name", "").lower():
+            logger.debug("[ACTION] Selected tool: mcp_call_tool (weather query via MCP)")
+            return {
+                "tool": "mcp_call_tool",
+                "arguments": arguments
+            }
+
+        logger.debug("[ACTION] Selected tool: %s (AI decision)", tool_name)
+        return {
+            "tool": tool_name,
+            "arguments": arguments
+        }
+
+    def _fast_route(self, query: str, query_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the rule-based action when the query unambiguously maps to a tool
+        (weather with a known city, plain time question, simple greeting); None otherwise
+        """
+        if query_lower is None:
+            query_lower = query.casefold()
+        tags = _match_keyword_tags(query_lower)
+        if "weather" in tags:
+            confident = any(tag.startswith("city:") for tag in tags)
+        elif "time" in tags:
+            confident = "image" not in tags
+        else:
+            confident = "greeting" in tags and "topic" not in tags and "image" not in tags
+        if not confident:
+            return None
+        logger.debug("[ROUTE] Fast route for query: %r", query)
+        return self._rule_based_action(query, query_lower)
+
+    def _predict_action(self, query: str, query_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Predict the action for high-confidence queries (weather / time / greeting)
+        so it can be dispatched before the LLM decision arrives; None otherwise
+        """
+        action = self._rule_based_action(query, query_lower)
+        if action["tool"] in ("mcp_call_tool", "get_current_time", "no_tool_needed"):
+            return action
+        return None
+
+    def _rule_based_action(self, query: str, query_lower: Optional[str] = None) -> Dict[str, Any]:
+        """Fallback rule-based action selection"""
+        if query_lower is None:
+            query_lower = query.casefold()
+        tags = _match_keyword_tags(query_lower)
 
         # Check if query asks for weather information
-        if any(word in query_lower for word in ["天气", "weather", "气温", "下雨", "晴天", "多云"]):
-            print(f"[ACTION] Selected tool: mcp_call_tool (weather query - fallback)")
+        if "weather" in tags:
+            logger.debug("[ACTION] Selected tool: mcp_call_tool (weather query - fallback)")
 
             # Extract location from query
-            location = "北京"  # Default location
-            cities = ["北京", "上海", "广州", "深圳", "杭州", "南京", "成都", "武汉", "西安", "重庆"]
-            for city in cities:
-                if city in query:
-                    location = city
-                    break
+            location = next((city for city in _CITIES if f"city:{city}" in tags), "北京")  # Default location
 
             return {
                 "tool": "mcp_call_tool",
@@ -324,44 +766,38 @@ class ReActAgent:
             }
 
         # Check if query asks for current time
-        if "时间" in query_lower or "time" in query_lower:
-            print(f"[ACTION] Selected tool: get_current_time (time query)")
+        if "time" in tags:
+            logger.debug("[ACTION] Selected tool: get_current_time (time query)")
             return {
                 "tool": "get_current_time",
                 "arguments": {}
             }
 
         # Check if query asks for an image
-        if "image" in query_lower or "图片" in query_lower:
-            if "search" in query_lower:
-                print(f"[ACTION] Selected tool: search_image (image search)")
+        if "image" in tags:
+            if "image_search" in tags:
+                logger.debug("[ACTION] Selected tool: search_image (image search)")
                 return {
                     "tool": "search_image",
                     "arguments": {"query": query}
                 }
             else:
-                print(f"[ACTION] Selected tool: analyze_image (image analysis)")
+                logger.debug("[ACTION] Selected tool: analyze_image (image analysis)")
                 return {
                     "tool": "analyze_image",
                     "arguments": {"query": query}
                 }
 
         # Check if query is a simple greeting
-        if any(word in query_lower for word in [
-            "你好", "hello", "hi",
-            "你是谁", "who are you"
-        ]) and not any(topic_word in query_lower for topic_word in [
-            "fastmcp", "mcp", "介绍", "introduce", "解释", "explain",
-            "时间", "time", "天气", "weather"
-        ]):
-            print(f"[ACTION] Selected tool: no_tool_needed (simple conversation)")
+        if "greeting" in tags and "topic" not in tags:
+            logger.debug("[ACTION] Selected tool: no_tool_needed (simple conversation)")
             return {
                 "tool": "no_tool_needed",
                 "arguments": {"query": query, "reason": "simple_conversation"}
             }
 
         # Default: search for information
-        print(f"[ACTION] Selected tool: web_search (default for information query)")
+        logger.debug("[ACTION] Selected tool: web_search (default for information query)")
         return {
             "tool": "web_search",
             "arguments": {"query": query}
@@ -376,81 +812,48 @@ class ReActAgent:
         """
         Determine if we have enough information to provide a final answer
         """
+        # An acknowledged call that is still running has no result yet: keep iterating (check_task)
+        if self._running_ticket(observation) is not None:
+            return False
         # Simple heuristic: if we have at least one successful observation, we can finish
         return len(context) >= 1
 
-    async def _generate_final_answer(
+    def _final_answer_messages(
         self,
         query: str,
-        context: List[Dict],
         trace: List[Dict]
-    ) -> str:
-        """
-        Generate the final answer based on all observations
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any], bool]:
         """
-        from services.azure_openai_service import AzureOpenAIService
-        from config import settings
+        Build the final-answer prompt
 
+        Returns:
+            (messages, completion kwargs, is_simple_conversation)
+        """
         # Check if we have a "no_tool_needed" observation
         for obs in trace:
             if obs['type'] == 'observation':
                 content = obs['content']
                 if isinstance(content, dict) and content.get('tool') == 'no_tool_needed':
                     # This is a simple conversation, call model to generate response
-                    try:
-                        messages = [
-                            {
-                                "role": "system",
-                                "content": "你是一个智能的AI助手。请根据用户的问题，提供准确、有帮助的回答。如果问题是关于你的身份或能力，请简洁地介绍自己。"
-                            },
-                            {
-                                "role": "user",
-                                "content": query
-                            }
-                        ]
-
-                        azure_service = AzureOpenAIService(
-                            endpoint=settings.azure_endpoint,
-                            api_key=settings.azure_api_key,
-                            api_version=settings.azure_api_version,
-                            deployment_name=settings.azure_deployment_name
-                        )
-                        response = await azure_service.chat_completion(
-                            messages,
-                            max_tokens=500,
-                            temperature=0.7
-                        )
-                        answer = response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-
-                        if answer:
-                            return answer
-                        else:
-                            return "抱歉，我暂时无法生成回答。"
-
-                    except Exception as e:
-                        print(f"调用模型生成答案时出错: {e}")
-                        # 降级策略：简单回答
-                        query_lower = query.lower()
-                        if any(word in query_lower for word in ["你好", "hello", "hi", "介绍", "introduce"]):
-                            return "你好！我是Claude Code，一个AI编程助手，专门帮助开发者完成各种编程任务。"
-                        elif any(word in query_lower for word in ["你是谁", "who are you"]):
-                            return "我是Claude Code，Anthropic开发的AI助手，专门为软件开发者提供编程支持。"
-                        else:
-                            return "我是Claude Code，一个AI编程助手。"
+                    messages = [
+                        {
+                            "role": "system",
+                            "content": "你是一个智能的AI助手。请根据用户的问题，提供准确、有帮助的回答。如果问题是关于你的身份或能力，请简洁地介绍自己。"
+                        },
+                        {
+                            "role": "user",
+                            "content": query
+                        }
+                    ]
+                    return messages, {"max_tokens": 500, "temperature": 0.7}, True
 
         # Compile all observations for queries that need tools
-        observations_text = "\n".join([
-            f"- {obs['content']}"
-            for obs in trace
-            if obs['type'] == 'observation'
-        ])
-
         prompt = f"""基于以下信息回答用户查询:
 
 用户查询: {query}
 
 收集到的信息:
-{observations_text}
+{self._observations_text(trace)}
 
 请提供准确、简洁的最终答案。
 """
@@ -459,36 +862,135 @@ class ReActAgent:
             {"role": "system", "content": "你是一个有用的AI助手，基于收集到的信息回答用户问题。"},
             {"role": "user", "content": prompt}
         ]
+        return messages, {"max_tokens": 500}, False
 
+    @staticmethod
+    def _observations_text(trace: List[Dict]) -> str:
+        return "\n".join([
+            f"- {obs['content']}"
+            for obs in trace
+            if obs['type'] == 'observation'
+        ])
+
+    def _fallback_final_answer(
+        self,
+        query: str,
+        trace: List[Dict],
+        is_conversation: bool,
+        query_lower: Optional[str] = None
+    ) -> str:
+        """Answer used when the model call fails"""
+        if query_lower is None:
+            query_lower = query.casefold()
+        if is_conversation:
+            # 降级策略：简单回答
+            if any(word in query_lower for word in ["你好", "hello", "hi", "介绍", "introduce"]):
+                return "你好！我是Claude Code，一个AI编程助手，专门帮助开发者完成各种编程任务。"
+            elif any(word in query_lower for word in ["你是谁", "who are you"]):
+                return "我是Claude Code，Anthropic开发的AI助手，专门为软件开发者提供编程支持。"
+            else:
+                return "我是Claude Code，一个AI编程助手。"
+
+        # Better fallback: try to generate a simple answer based on query type
+        if "搜索" in query_lower or "search" in query_lower:
+            return f"根据搜索结果，我找到了一些关于'{query}'的信息。搜索完成。"
+
+        # Default fallback
+        return f"基于收集到的信息: {self._observations_text(trace)[:200]}..."
+
+    async def _generate_final_answer(
+        self,
+        query: str,
+        context: List[Dict],
+        trace: List[Dict],
+        stream: bool = False,
+        query_lower: Optional[str] = None
+    ) -> Union[str, AsyncIterator[str]]:
+        """
+        Generate the final answer based on all observations
+
+        With stream=True, returns an async iterator of answer fragments as the model produces them
+        """
+        if stream:
+            return self._stream_final_answer(query, trace, query_lower)
+
+        messages, kwargs, is_conversation = self._final_answer_messages(query, trace)
         try:
-            azure_service = AzureOpenAIService(
-                endpoint=settings.azure_endpoint,
-                api_key=settings.azure_api_key,
-                api_version=settings.azure_api_version,
-                deployment_name=settings.azure_deployment_name
-            )
-            response = await azure_service.chat_completion(messages, max_tokens=500)
+            response = await self._get_dispatcher().submit(messages, **kwargs)
             answer = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+            if is_conversation:
+                answer = answer.strip()
+                return answer or "抱歉，我暂时无法生成回答。"
             return answer or "基于收集到的信息，我无法提供确切的答案。"
         except Exception as e:
-            # Better fallback: try to generate a simple answer based on query type
-            query_lower = query.lower()
-            if "搜索" in query_lower or "search" in query_lower:
-                return f"根据搜索结果，我找到了一些关于'{query}'的信息。搜索完成。"
+            if is_conversation:
+                logger.warning("调用模型生成答案时出错: %s", e)
+            return self._fallback_final_answer(query, trace, is_conversation, query_lower)
+
+    async def _stream_final_answer(
+        self,
+        query: str,
+        trace: List[Dict],
+        query_lower: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream final answer fragments straight from the Azure SSE response"""
+        messages, kwargs, is_conversation = self._final_answer_messages(query, trace)
+        emitted = False
+        try:
+            async for chunk in self._get_azure_service().chat_completion_stream(messages, **kwargs):
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    emitted = True
+                    yield delta
+        except Exception as e:
+            logger.warning("调用模型生成答案时出错: %s", e)
+            if emitted:
+                return
+            yield self._fallback_final_answer(query, trace, is_conversation, query_lower)
+            return
 
-            # Default fallback
-            return f"基于收集到的信息: {observations_text[:200]}..."
+        if not emitted:
+            yield "抱歉，我暂时无法生成回答。" if is_conversation else "基于收集到的信息，我无法提供确切的答案。"
 
 
 # Built-in Tools for ReAct Agent
 
+def _now_iso() -> str:
+    """Current UTC time as ISO 8601 with a Z suffix (replaces deprecated datetime.utcnow())"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+# In-flight tool calls keyed by (tool function, canonical arguments)
+_IN_FLIGHT: Dict[tuple, "asyncio.Future"] = {}
+
+
+def _single_flight(func: Callable) -> Callable:
+    """
+    Coalesce concurrent identical calls: the first caller runs the tool, callers with the
+    same arguments arriving while it is in flight await the same result
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = (func.__name__, json_dumps_canonical([args, kwargs]))
+        task = _IN_FLIGHT.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            _IN_FLIGHT[key] = task
+            task.add_done_callback(lambda _: _IN_FLIGHT.pop(key, None))
+        # shield: one caller being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+    return wrapper
+
+
+@_single_flight
 async def search_web(query: str) -> Dict[str, Any]:
     """Search the web for information"""
     # Placeholder for web search
     return {
         "query": query,
         "results": f"搜索结果模拟: 关于'{query}'的信息",
-        "timestamp": datetime.utcnow().isoformat() + "Z"
+        "timestamp": _now_iso()
     }
 
 
@@ -498,28 +1000,57 @@ async def analyze_image(image_url: str, query: str) -> Dict[str, Any]:
     return {
         "image_url": image_url,
         "analysis": f"图像分析模拟: 检测到图像内容，查询: {query}",
-        "timestamp": datetime.utcnow().isoformat() + "Z"
+        "timestamp": _now_iso()
     }
 
 
+@_single_flight
 async def search_image(query: str) -> Dict[str, Any]:
     """Search for images"""
     # Placeholder for image search
     return {
         "query": query,
         "images": f"图像搜索结果模拟: 找到与'{query}'相关的图像",
-        "timestamp": datetime.utcnow().isoformat() + "Z"
+        "timestamp": _now_iso()
     }
 
 
 async def get_current_time() -> Dict[str, Any]:
     """Get current time"""
+    now = _now_iso()
     return {
-        "current_time": datetime.utcnow().isoformat() + "Z",
-        "timestamp": datetime.utcnow().isoformat() + "Z"
+        "current_time": now,
+        "timestamp": now
     }
 
 
+# How long (seconds) a finished background tool call stays available to check_task
+_PENDING_RESULT_TTL = 600
+
+# Connected MCP clients keyed by server URL, reused across call_mcp_tool invocations
+_MCP_CLIENTS: Dict[str, Any] = {}
+
+
+async def _get_mcp_client(server_url: str):
+    """Return the shared MCPClient for server_url, (re)connecting it if needed"""
+    from services.mcp_client import MCPClient
+
+    client = _MCP_CLIENTS.get(server_url)
+    if client is None:
+        client = _MCP_CLIENTS[server_url] = MCPClient(server_url)
+    if client.session is None or client.session.closed:
+        await client.__aenter__()
+    return client
+
+
+async def close_mcp_clients():
+    """Release the shared MCP clients (call on shutdown)"""
+    for client in _MCP_CLIENTS.values():
+        await client.__aexit__(None, None, None)
+    _MCP_CLIENTS.clear()
+
+
+@_single_flight
 async def call_mcp_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """
     Call a tool on the MCP server
@@ -531,22 +1062,21 @@ async def call_mcp_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str,
     Returns:
         Tool execution result
     """
-    from services.mcp_client import MCPClient
     from config import settings
 
     mcp_server_url = getattr(settings, 'mcp_server_url', 'http://localhost:3000')
 
-    async with MCPClient(mcp_server_url) as client:
-        try:
-            result = await client.call_tool(tool_name, arguments)
-            return result
-        except Exception as e:
-            return {
-                "tool": tool_name,
-                "result": f"MCP工具调用失败: {str(e)}",
-                "error": True,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            }
+    try:
+        client = await _get_mcp_client(mcp_server_url)
+        result = await client.call_tool(tool_name, arguments)
+        return result
+    except Exception as e:
+        return {
+            "tool": tool_name,
+            "result": f"MCP工具调用失败: {str(e)}",
+            "error": True,
+            "timestamp": _now_iso()
+        }
 
 
 # Default ReAct Agent with built-in tools
@@ -595,4 +1125,15 @@ default_tools = [
     )
 ]
 
-react_agent = ReActAgent(tools=default_tools)
+
+@lru_cache(maxsize=None)
+def get_default_agent() -> ReActAgent:
+    """Return the shared ReActAgent with the built-in tools, created on first use"""
+    return ReActAgent(tools=default_tools)
+
+
+def __getattr__(name: str):
+    # Backward compatibility: `from services.react_agent import react_agent` still works
+    if name == "react_agent":
+        return get_default_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,242 @@
+"""
+ReAct 技能缓存（查询模式 → 工具 + 参数）
+把反复出现、结果确定的路由（如 "X天气" → weather.get_weather(location=X)）编译为技能，
+命中时直接执行工具，跳过 LLM 推理。每次使用后更新成功 / 失败计数，失败率过高的技能自动停用。
+启动时预置天气、时间、问候三类技能；LLM 决策成功执行后，按规范化查询原文学习为精确匹配技能。
+配置了 REACT_SKILL_CACHE_PATH 时技能持久化为 JSON 文件
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .fast_json import json_loads, json_dumps_bytes
+except ImportError:
+    # 直接运行时的备选方案
+    from fast_json import json_loads, json_dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+# 技能停用阈值：失败次数达到该值且多于成功次数
+_MAX_FAILURES = 3
+# 学习得到的技能数量上限（预置技能不计入），超出时淘汰成功次数最少的
+_MAX_LEARNED_SKILLS = 500
+# 学习得到的技能名前缀，其后为规范化查询
+_LEARNED_PREFIX = "learned:"
+# 参数模板中的占位符，如 "{location}"、"{query}"
+_PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+_CITY_PATTERN = "北京|上海|广州|深圳|杭州|南京|成都|武汉|西安|重庆"
+
+# 预置技能：与 ReActAgent 规则路由中可以确定工具的分支一致
+SEED_SKILLS: List[Dict[str, Any]] = [
+    {
+        "name": "weather",
+        "pattern": rf"^(?=.*(?:天气|weather|气温|下雨|晴天|多云))(?=.*?(?P<location>{_CITY_PATTERN}))",
+        "tool": "mcp_call_tool",
+        "args_template": {
+            "tool_name": "weather.get_weather",
+            "arguments": {"location": "{location}", "query": "{query}"}
+        },
+    },
+    {
+        "name": "time",
+        "pattern": r"^(?!.*(?:天气|weather|气温|下雨|晴天|多云|image|图片))(?=.*(?:时间|time))",
+        "tool": "get_current_time",
+        "args_template": {},
+    },
+    {
+        "name": "greeting",
+        "pattern": r"^\s*(?:你好|hello|hi|你是谁|who are you)[\s!！?？。.,，~]*$",
+        "tool": "no_tool_needed",
+        "args_template": {"query": "{query}", "reason": "simple_conversation"},
+    },
+]
+
+
+def normalize_query(query: str) -> str:
+    """技能匹配使用的规范化查询：casefold 并合并空白"""
+    return " ".join(query.casefold().split())
+
+
+class Skill:
+    """单个技能：正则模式 + 工具 + 参数模板，附带使用计数"""
+
+    __slots__ = ("name", "pattern", "tool", "args_template", "success_count", "fail_count", "learned", "_regex")
+
+    def __init__(
+        self,
+        name: str,
+        pattern: str,
+        tool: str,
+        args_template: Dict[str, Any],
+        success_count: int = 0,
+        fail_count: int = 0,
+        learned: bool = False
+    ):
+        self.name = name
+        self.pattern = pattern
+        self.tool = tool
+        self.args_template = args_template
+        self.success_count = success_count
+        self.fail_count = fail_count
+        self.learned = learned
+        self._regex = re.compile(pattern, re.S)
+
+    @property
+    def enabled(self) -> bool:
+        return not (self.fail_count >= _MAX_FAILURES and self.fail_count > self.success_count)
+
+    @property
+    def success_rate(self) -> float:
+        total = self.success_count + self.fail_count
+        return self.success_count / total if total else 0.5
+
+    def match(self, normalized: str, query: str) -> Optional[Dict[str, Any]]:
+        """匹配成功时返回代入参数后的动作 {"tool", "arguments"}，否则返回 None"""
+        m = self._regex.search(normalized)
+        if m is None:
+            return None
+        values = {name: value for name, value in m.groupdict().items() if value is not None}
+        values["query"] = query
+        return {"tool": self.tool, "arguments": _substitute(self.args_template, values)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "pattern": self.pattern,
+            "tool": self.tool,
+            "args_template": self.args_template,
+            "success_count": self.success_count,
+            "fail_count": self.fail_count,
+            "learned": self.learned,
+        }
+
+
+def _substitute(template: Any, values: Dict[str, str]) -> Any:
+    """递归代入参数模板中的 {name} 占位符；未知占位符原样保留"""
+    if isinstance(template, str):
+        return _PLACEHOLDER_RE.sub(lambda m: values.get(m.group(1), m.group(0)), template)
+    if isinstance(template, dict):
+        return {key: _substitute(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [_substitute(value, values) for value in template]
+    return template
+
+
+class SkillCache:
+    """
+    技能缓存
+
+    match 先按规范化查询查找学习得到的精确匹配技能（字典查找），再按成功率从高到低尝试已启用的
+    模式技能；record 更新计数；learn 把一次成功的 LLM 决策记为精确匹配技能。path 为空时只保存在内存中
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        # 模式技能（预置技能等），按名称索引
+        self._skills: Dict[str, Skill] = {}
+        # 学习得到的精确匹配技能，按规范化查询索引
+        self._learned: Dict[str, Skill] = {}
+        self._dirty = False
+        for seed in SEED_SKILLS:
+            self._skills[seed["name"]] = Skill(**seed)
+        if path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                entries = json_loads(f.read())
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("读取技能缓存失败，使用预置技能: %s", e)
+            return
+        for entry in entries:
+            try:
+                # 持久化的计数覆盖预置技能的初始值
+                skill = Skill(**entry)
+                if skill.learned and skill.name.startswith(_LEARNED_PREFIX):
+                    self._learned[skill.name[len(_LEARNED_PREFIX):]] = skill
+                else:
+                    self._skills[skill.name] = skill
+            except (KeyError, TypeError, re.error) as e:
+                logger.warning("跳过无效的技能 %r: %s", entry.get("name"), e)
+
+    def match(self, query: str) -> Optional[Tuple[Skill, Dict[str, Any]]]:
+        """返回 (技能, 动作)；没有可用技能匹配时返回 None"""
+        normalized = normalize_query(query)
+        skill = self._learned.get(normalized)
+        if skill is not None and skill.enabled:
+            return skill, skill.match(normalized, query)
+
+        skills = sorted(
+            (skill for skill in self._skills.values() if skill.enabled),
+            key=lambda skill: (skill.success_rate, skill.success_count),
+            reverse=True
+        )
+        for skill in skills:
+            action = skill.match(normalized, query)
+            if action is not None:
+                return skill, action
+        return None
+
+    def record(self, skill: Skill, success: bool):
+        """记录一次技能执行结果"""
+        if success:
+            skill.success_count += 1
+        else:
+            skill.fail_count += 1
+            if not skill.enabled:
+                logger.info("技能 %s 失败率过高，已停用", skill.name)
+        self._dirty = True
+
+    def learn(self, query: str, action: Dict[str, Any]):
+        """把一次成功执行的 LLM 决策学习为精确匹配该查询的技能"""
+        normalized = normalize_query(query)
+        skill = self._learned.get(normalized)
+        if skill is not None:
+            skill.success_count += 1
+        else:
+            self._learned[normalized] = Skill(
+                name=f"{_LEARNED_PREFIX}{normalized}",
+                pattern=f"^{re.escape(normalized)}$",
+                tool=action["tool"],
+                args_template=action.get("arguments", {}),
+                success_count=1,
+                learned=True
+            )
+            self._evict()
+        self._dirty = True
+
+    def _evict(self):
+        if len(self._learned) <= _MAX_LEARNED_SKILLS:
+            return
+        learned = sorted(self._learned.items(), key=lambda item: (item[1].success_count, -item[1].fail_count))
+        for normalized, _ in learned[:len(learned) - _MAX_LEARNED_SKILLS]:
+            del self._learned[normalized]
+
+    def _write(self, data: bytes):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再替换，避免其他进程读到写了一半的文件
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    async def save(self):
+        """有改动且配置了路径时写回技能文件"""
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        skills = [*self._skills.values(), *self._learned.values()]
+        data = json_dumps_bytes([skill.to_dict() for skill in skills])
+        try:
+            await asyncio.to_thread(self._write, data)
+        except Exception as e:
+            logger.warning("写入技能缓存失败: %s", e)
@@ -1,14 +1,16 @@
-import json
 import uuid
-from typing import Dict, Any, AsyncGenerator
-import asyncio
+from typing import Dict, Any, AsyncGenerator, AsyncIterator
 from datetime import datetime
 
+from services.fast_json import json_dumps
+
 class StreamingService:
     """流式输出服务"""
 
     def __init__(self, request_id: str):
         self.request_id = request_id
+        # chunk 事件中 data 之前的固定部分，每个流只序列化一次
+        self._chunk_prefix = f'data: {{"event":"chunk","requestId":{json_dumps(request_id)},"data":'
 
     async def generate_stream(self, response_data: Dict[str, Any]) -> AsyncGenerator[str, None]:
         """
@@ -21,7 +23,7 @@ class StreamingService:
             JSON 字符串片段
         """
         # 将响应数据转换为 JSON 字符串
-        response_json = json.dumps(response_data, ensure_ascii=False, separators=(',', ':'))
+        response_json = json_dumps(response_data)
 
         # 模拟流式输出，每次发送一部分数据
         chunk_size = 100  # 每次发送 100 个字符
@@ -33,37 +35,82 @@ class StreamingService:
             "timestamp": response_data.get("timestamp", "")
         }
         try:
-            yield f"data: {json.dumps(start_marker, ensure_ascii=False)}\n\n"
-            await asyncio.sleep(0.01)  # 短暂延迟
+            yield f"data: {json_dumps(start_marker)}\n\n"
         except Exception:
             # 客户端已断开连接，退出
             return
 
-        # 分块发送数据
-        for i in range(0, len(response_json), chunk_size):
-            chunk = response_json[i:i + chunk_size]
+        # 分块发送数据：只序列化每块的 data 字符串，其余部分直接拼接
+        # （按字符而非字节切分，避免拆开多字节字符）
+        chunk_prefix = self._chunk_prefix
+        for sequence, i in enumerate(range(0, len(response_json), chunk_size)):
+            try:
+                yield f'{chunk_prefix}{json_dumps(response_json[i:i + chunk_size])},"sequence":{sequence}}}\n\n'
+            except Exception:
+                # 客户端已断开连接，退出
+                return
+
+        # 发送结束标记
+        end_marker = {
+            "event": "end",
+            "requestId": self.request_id,
+            "totalLength": len(response_json)
+        }
+        try:
+            yield f"data: {json_dumps(end_marker)}\n\n"
+        except Exception:
+            # 客户端已断开连接，忽略
+            pass
+
+    async def generate_answer_stream(self, answer: AsyncIterator[str], timestamp: str = "") -> AsyncGenerator[str, None]:
+        """
+        将模型逐步生成的答案片段直接转为流式事件，不等待完整答案
+
+        供直接使用 ReActAgent 的调用方使用；应用中目前没有提供 ReActAgent 的接口（main.py 只使用
+        TrueReActAgent，以 NDJSON 逐步输出），因此该路径尚未接入任何 HTTP 接口
+
+        Args:
+            answer: 答案片段的异步迭代器（如 ReActAgent.run(..., stream=True) 的 answer）
+            timestamp: 开始标记中的时间戳
 
+        Yields:
+            JSON 字符串片段
+        """
+        start_marker = {
+            "event": "start",
+            "requestId": self.request_id,
+            "timestamp": timestamp
+        }
+        try:
+            yield f"data: {json_dumps(start_marker)}\n\n"
+        except Exception:
+            # 客户端已断开连接，退出
+            return
+
+        sequence = 0
+        total_length = 0
+        async for token in answer:
             chunk_event = {
                 "event": "chunk",
                 "requestId": self.request_id,
-                "data": chunk,
-                "sequence": i // chunk_size
+                "data": token,
+                "sequence": sequence
             }
+            sequence += 1
+            total_length += len(token)
             try:
-                yield f"data: {json.dumps(chunk_event, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.01)  # 短暂延迟
+                yield f"data: {json_dumps(chunk_event)}\n\n"
             except Exception:
                 # 客户端已断开连接，退出
                 return
 
-        # 发送结束标记
         end_marker = {
             "event": "end",
             "requestId": self.request_id,
-            "totalLength": len(response_json)
+            "totalLength": total_length
         }
         try:
-            yield f"data: {json.dumps(end_marker, ensure_ascii=False)}\n\n"
+            yield f"data: {json_dumps(end_marker)}\n\n"
         except Exception:
             # 客户端已断开连接，忽略
             pass
@@ -87,8 +134,7 @@ class StreamingService:
                 "stepData": step
             }
             try:
-                yield f"data: {json.dumps(step_event, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)  # 步骤间延迟
+                yield f"data: {json_dumps(step_event)}\n\n"
             except Exception:
                 # 客户端已断开连接，退出
                 return
@@ -100,12 +146,18 @@ class StreamingService:
             "totalSteps": len(steps_data)
         }
         try:
-            yield f"data: {json.dumps(completion_event, ensure_ascii=False)}\n\n"
+            yield f"data: {json_dumps(completion_event)}\n\n"
         except Exception:
             # 客户端已断开连接，忽略
             pass
 
-    async def generate_step_by_step_stream(self, steps_data: list, code: int = 200, message: str = "成功") -> AsyncGenerator[str, None]:
+    async def generate_step_by_step_stream(
+        self,
+        steps_data: list,
+        code: int = 200,
+        message: str = "成功",
+        mode: str = "full"
+    ) -> AsyncGenerator[str, None]:
         """
         逐个输出步骤，每次只输出当前步骤，不累积输出
 
@@ -113,10 +165,17 @@ class StreamingService:
             steps_data: 步骤数据列表
             code: 响应代码
             message: 响应消息
+            mode: "full" 每行都是完整响应格式；"patch" 首行输出一次响应信封（code / message / requestId），
+                之后每行只是追加一个步骤的增量 {"op": "append", "path": "/data/steps/-", "value": 步骤, "seq": 序号}
 
         Yields:
-            完整的 JSON 响应字符串，每次只包含当前步骤
+            完整的 JSON 响应字符串（mode="full"）或 NDJSON 增量（mode="patch"）
         """
+        if mode == "patch":
+            async for line in self._generate_step_patches(steps_data, code, message):
+                yield line
+            return
+
         for i, step in enumerate(steps_data):
             # 每次只输出当前步骤
             current_step = step if not isinstance(step, list) else step[0] if step else step
@@ -137,8 +196,35 @@ class StreamingService:
 
             # 输出完整的响应
             try:
-                yield json.dumps(response_data, ensure_ascii=False, separators=(',', ':')) + '\n'
-                await asyncio.sleep(0.1)  # 步骤间延迟
+                yield json_dumps(response_data) + '\n'
             except Exception:
                 # 客户端已断开连接，退出
-                return
\ No newline at end of file
+                return
+
+    async def _generate_step_patches(self, steps_data: list, code: int, message: str) -> AsyncGenerator[str, None]:
+        """generate_step_by_step_stream 的增量模式：信封只发一次，每个步骤作为一条追加操作"""
+        envelope = {
+            "code": code,
+            "message": message,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "requestId": self.request_id,
+            "data": {"steps": []}
+        }
+        try:
+            yield json_dumps(envelope) + '\n'
+        except Exception:
+            # 客户端已断开连接，退出
+            return
+
+        seq = 0
+        for step in steps_data:
+            # 与完整模式相同的步骤归一化
+            current_step = step if not isinstance(step, list) else step[0] if step else step
+            for value in ([current_step] if not isinstance(current_step, list) else current_step):
+                patch = {"op": "append", "path": "/data/steps/-", "value": value, "seq": seq}
+                seq += 1
+                try:
+                    yield json_dumps(patch) + '\n'
+                except Exception:
+                    # 客户端已断开连接，退出
+                    return
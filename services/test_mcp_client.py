@@ -3,123 +3,52 @@ MCP 接口测试脚本 - 使用 FastMCP Client（推荐方式）
 需要安装: pip install fastmcp>=2.8.0,<2.12.0
 """
 import asyncio
-import json
+import logging
 import os
+import sys
+from functools import lru_cache
+from types import SimpleNamespace
 from uuid import uuid4
 
 try:
-    # 尝试使用新的 API
-    try:
-        from fastmcp import streamable_http_client
-        USE_NEW_API = True
-    except ImportError:
-        USE_NEW_API = False
-        from fastmcp import Client
-        from fastmcp.client.transports import StreamableHttpTransport
+    from ._mcp_test_utils import (
+        _Pretty,
+        _tools,
+        check_mcp_server,
+        format_result,
+        format_tools_for_llm,
+        log,
+        open_client,
+    )
 except ImportError:
-    print("❌ 错误: 未安装 fastmcp")
-    print("   请运行: pip install fastmcp>=2.8.0,<2.12.0")
-    exit(1)
+    # 直接运行脚本时的备选方案
+    from _mcp_test_utils import (
+        _Pretty,
+        _tools,
+        check_mcp_server,
+        format_result,
+        format_tools_for_llm,
+        log,
+        open_client,
+    )
 
-# 测试配置
-# FastAPI 服务器地址
-API_BASE_URL = os.getenv("TEST_BASE_URL", "http://192.168.106.108:8000")
-# MCP 服务器地址（独立端口）
-# MCP_BASE_URL_RAW = os.getenv("TEST_MCP_BASE_URL", "http://192.168.106.108:8001")
-MCP_BASE_URL_RAW = os.getenv("TEST_MCP_BASE_URL", "http://192.168.106.108:8001")
-SERVICE_TOKEN = os.getenv("MCP_SERVICE_TOKEN", "test-service-token")
-# 将 key 放到 URL 参数中
-MCP_BASE_URL = f"{MCP_BASE_URL_RAW}?key={SERVICE_TOKEN}"
-TEST_USER_ID = str(uuid4())
 
-print(f"API_BASE_URL: {API_BASE_URL}")
-print(f"MCP_BASE_URL: {MCP_BASE_URL}")
-print(f"TEST_USER_ID: {TEST_USER_ID}")
+# 测试配置：首次使用时读取环境变量并缓存（导入本模块时不读取）
+@lru_cache(maxsize=1)
+def _config() -> SimpleNamespace:
+    # FastAPI 服务器地址
+    api = os.getenv("TEST_BASE_URL", "http://192.168.106.108:8000")
+    # MCP 服务器地址（独立端口）
+    # mcp_raw = os.getenv("TEST_MCP_BASE_URL", "http://192.168.106.108:8001")
+    mcp_raw = os.getenv("TEST_MCP_BASE_URL", "http://192.168.106.108:8001")
+    token = os.getenv("MCP_SERVICE_TOKEN", "test-service-token")
+    # 将 key 放到 URL 参数中
+    return SimpleNamespace(api=api, mcp_raw=mcp_raw, token=token, url=f"{mcp_raw}?key={token}")
 
-def format_result(result):
-    """格式化结果，将 CallToolResult、TextContent 等对象转换为可序列化的格式"""
-    # 处理 None
-    if result is None:
-        return None
-    
-    # 处理基本类型
-    if isinstance(result, (str, int, float, bool)):
-        return result
-    
-    # 处理列表
-    if isinstance(result, list):
-        return [format_result(item) for item in result]
-    
-    # 处理字典
-    if isinstance(result, dict):
-        return {key: format_result(value) for key, value in result.items()}
-    
-    # 处理 CallToolResult 对象
-    if hasattr(result, 'content'):
-        formatted_content = format_result(result.content)
-        return {
-            "content": formatted_content,
-            "isError": getattr(result, 'isError', False),
-        }
-    
-    # 处理 TextContent 对象
-    if hasattr(result, 'text'):
-        return {
-            "type": "text",
-            "text": getattr(result, 'text', str(result)),
-        }
-    
-    # 处理其他有 __dict__ 的对象
-    if hasattr(result, '__dict__'):
-        return {key: format_result(value) for key, value in result.__dict__.items()}
-    
-    # 处理其他对象，尝试获取常见属性
-    if hasattr(result, '__class__'):
-        # 尝试获取对象的常见属性
-        obj_dict = {}
-        for attr in ['text', 'content', 'data', 'value', 'message', 'error']:
-            if hasattr(result, attr):
-                obj_dict[attr] = format_result(getattr(result, attr))
-        if obj_dict:
-            return obj_dict
-    
-    # 最后尝试转换为字符串
-    return str(result)
 
-def format_tools_for_llm(tool) -> str:
-    args_desc = []
-    
-    # FastMCP 工具对象可能使用 inputSchema 或 input_schema
-    schema = None
-    for attr_name in ['inputSchema', 'input_schema', 'schema', 'parameters']:
-        schema = getattr(tool, attr_name, None)
-        if schema is not None:
-            break
-    
-    # 如果 schema 是对象而非字典，尝试转换
-    if schema is not None and hasattr(schema, '__dict__'):
-        schema = vars(schema) if not isinstance(schema, dict) else schema
-    
-    # 如果 schema 有 model_dump 方法（Pydantic 模型）
-    if schema is not None and hasattr(schema, 'model_dump'):
-        schema = schema.model_dump()
-    
-    if isinstance(schema, dict) and "properties" in schema:
-        properties = schema["properties"]
-        required = schema.get("required", [])
-        for param_name, param_info in properties.items():
-            if isinstance(param_info, dict):
-                desc = param_info.get('description', 'No description')
-            else:
-                desc = getattr(param_info, 'description', 'No description')
-            arg_desc = f"- {param_name}: {desc}"
-            if param_name in required:
-                arg_desc += " (required)"
-            args_desc.append(arg_desc)
-    
-    tool_name = getattr(tool, 'name', 'unknown')
-    tool_desc = getattr(tool, 'description', '')
-    return f"Tool: {tool_name}\nDescription: {tool_desc}\nArguments:\n{chr(10).join(args_desc)}"
+# 测试用户 ID 在 main() 中按每次运行生成，导入本模块时不生成
+TEST_USER_ID = None
+
 
 async def run_tests(client):
     """运行测试用例"""
@@ -127,8 +56,9 @@ async def run_tests(client):
         # 列出所有可用工具
         print("\n📋 列出所有可用工具...")
         try:
-            tools = await client.list_tools()
-            print(f"✅ 可用工具数量: {len(tools) if tools else 0}")
+            tools_index = await _tools(client)
+            tools = list(tools_index.values())
+            print(f"✅ 可用工具数量: {len(tools)}")
             if tools:
                 # 调试：打印第一个工具的属性结构
                 first_tool = tools[0]
@@ -139,8 +69,7 @@ async def run_tests(client):
                 if hasattr(first_tool, 'input_schema'):
                     print(f"🔍 调试 - input_schema: {first_tool.input_schema}")
                 
-                for tool in tools:
-                    tool_name = tool.get('name', 'unknown') if isinstance(tool, dict) else getattr(tool, 'name', 'unknown')
+                for tool_name in tools_index:
                     print(f"   - {tool_name}")
                 tools_description = "\n".join([format_tools_for_llm(tool) for tool in tools])
                 print(f"工具描述:\n{tools_description}")
@@ -159,7 +88,7 @@ async def run_tests(client):
             "relationship_type": "client",
         })
         formatted_result = format_result(result)
-        print(f"✅ 创建结果: {json.dumps(formatted_result, indent=2, ensure_ascii=False)}")
+        log.info("✅ 创建结果: %s", _Pretty(formatted_result))
         
         # 提取联系人ID（如果返回的是标准格式）
         contact_id = None
@@ -174,17 +103,37 @@ async def run_tests(client):
             elif "id" in result.content:
                 contact_id = result.content["id"]
         
-        # 测试列表查询
-        print("\n📋 测试列表查询联系人...")
-        result = await client.call_tool("contacts_list", {
-            "user_id": TEST_USER_ID,
-            "page": 1,
-            "page_size": 20,
-        })
-        formatted_result = format_result(result)
-        print(f"✅ 查询结果: {json.dumps(formatted_result, indent=2, ensure_ascii=False)}")
+        # 列表查询、创建文件记录、创建日程互不依赖，并发执行（TaskGroup 中任一失败会取消其余任务）
+        print("\n📋 测试列表查询联系人 / 📄 创建文件记录 / 📅 创建日程（并发）...")
+        async with asyncio.TaskGroup() as tg:
+            list_task = tg.create_task(client.call_tool("contacts_list", {
+                "user_id": TEST_USER_ID,
+                "page": 1,
+                "page_size": 20,
+            }))
+            files_task = tg.create_task(client.call_tool("files_create", {
+                "user_id": TEST_USER_ID,
+                "file_name": "test_file.pdf",
+                "file_url": "https://example.com/files/test.pdf",
+                "file_type": "application/pdf",
+                "file_size": 1024,
+            }))
+            schedules_task = tg.create_task(client.call_tool("schedules_create", {
+                "user_id": TEST_USER_ID,
+                "title": "测试日程",
+                "start_time": "2024-01-15T10:00:00",
+                "end_time": "2024-01-15T12:00:00",
+                "category": "meeting",
+            }))
         
-        # 如果创建成功，测试读取和删除
+        formatted_result = format_result(list_task.result())
+        log.info("✅ 查询结果: %s", _Pretty(formatted_result))
+        formatted_result = format_result(files_task.result())
+        log.info("✅ 创建文件结果: %s", _Pretty(formatted_result))
+        formatted_result = format_result(schedules_task.result())
+        log.info("✅ 创建日程结果: %s", _Pretty(formatted_result))
+        
+        # 如果创建成功，测试读取和删除（依赖 contact_id，在并发组之后执行）
         if contact_id:
             print(f"\n📖 测试读取联系人: {contact_id}...")
             result = await client.call_tool("contacts_read", {
@@ -192,7 +141,7 @@ async def run_tests(client):
                 "id": contact_id,
             })
             formatted_result = format_result(result)
-            print(f"✅ 读取结果: {json.dumps(formatted_result, indent=2, ensure_ascii=False)}")
+            log.info("✅ 读取结果: %s", _Pretty(formatted_result))
             
             print(f"\n🗑️  测试删除联系人: {contact_id}...")
             result = await client.call_tool("contacts_delete", {
@@ -200,30 +149,7 @@ async def run_tests(client):
                 "id": contact_id,
             })
             formatted_result = format_result(result)
-            print(f"✅ 删除结果: {json.dumps(formatted_result, indent=2, ensure_ascii=False)}")
-        
-        # 测试其他资源
-        print("\n📄 测试创建文件记录...")
-        result = await client.call_tool("files_create", {
-            "user_id": TEST_USER_ID,
-            "file_name": "test_file.pdf",
-            "file_url": "https://example.com/files/test.pdf",
-            "file_type": "application/pdf",
-            "file_size": 1024,
-        })
-        formatted_result = format_result(result)
-        print(f"✅ 创建结果: {json.dumps(formatted_result, indent=2, ensure_ascii=False)}")
-        
-        print("\n📅 测试创建日程...")
-        result = await client.call_tool("schedules_create", {
-            "user_id": TEST_USER_ID,
-            "title": "测试日程",
-            "start_time": "2024-01-15T10:00:00",
-            "end_time": "2024-01-15T12:00:00",
-            "category": "meeting",
-        })
-        formatted_result = format_result(result)
-        print(f"✅ 创建结果: {json.dumps(formatted_result, indent=2, ensure_ascii=False)}")
+            log.info("✅ 删除结果: %s", _Pretty(formatted_result))
         
     except Exception as e:
         print(f"\n❌ 测试失败: {str(e)}")
@@ -231,61 +157,55 @@ async def run_tests(client):
         traceback.print_exc()
 
 
-async def test_with_client():
+async def test_with_client(client):
     """使用 FastMCP Client 测试"""
-    print("=" * 60)
-    print("MCP 接口测试 - 使用 FastMCP Client")
-    print("=" * 60)
-    print(f"Base URL: {MCP_BASE_URL}")
-    print(f"User ID: {TEST_USER_ID}")
-    print(f"Service Token: {SERVICE_TOKEN[:10]}...")
-    print("=" * 60)
-    
-    # 使用新的 API 或旧的 API
-    # 注意：service_token 已经包含在 MCP_BASE_URL 中
-    if USE_NEW_API:
-        # 使用新的 streamable_http_client API
-        print("使用新的 streamable_http_client API")
-        async with streamable_http_client(MCP_BASE_URL) as client:
-            await run_tests(client)
-    else:
-        # 使用旧的 API
-        print("使用 StreamableHttpTransport API")
-        transport = StreamableHttpTransport(url=MCP_BASE_URL)
-        async with Client(transport) as client:
-            await run_tests(client)
+    config = _config()
+    separator = "=" * 60
+    sys.stdout.write("\n".join([
+        separator,
+        "MCP 接口测试 - 使用 FastMCP Client",
+        separator,
+        f"Base URL: {config.url}",
+        f"User ID: {TEST_USER_ID}",
+        f"Service Token: {config.token[:10]}...",
+        separator,
+        "",
+    ]))
+    
+    await run_tests(client)
     
     print("\n" + "=" * 60)
     print("测试完成")
     print("=" * 60)
 
 
-async def check_mcp_server():
-    """检查 MCP 服务器是否运行"""
-    import httpx
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            # 尝试连接 MCP 服务器（带认证）
-            response = await client.get(f"{MCP_BASE_URL}")
-            # MCP 服务器可能返回各种状态码，只要不是连接错误就认为服务器在运行
-            return True
-    except Exception as e:
-        print(f"   连接错误: {str(e)}")
-        return False
-
-
 async def main():
     """主测试流程"""
+    global TEST_USER_ID
+    config = _config()
+    TEST_USER_ID = str(uuid4())
+    print(f"API_BASE_URL: {config.api}")
+    print(f"MCP_BASE_URL: {config.url}")
+    print(f"TEST_USER_ID: {TEST_USER_ID}")
+    
     print("检查 MCP 服务器状态...")
-    if not await check_mcp_server():
-        print(f"❌ MCP 服务器未运行，请先启动服务: {MCP_BASE_URL_RAW}")
+    try:
+        async with open_client(config.url) as client:
+            if not await check_mcp_server(client):
+                print(f"❌ MCP 服务器未运行，请先启动服务: {config.mcp_raw}")
+                print("   启动命令: python run_mcp.py")
+                return
+            
+            print(f"✅ MCP 服务器运行正常: {config.mcp_raw}\n")
+            
+            await test_with_client(client)
+    except Exception as e:
+        # 建立会话（连接 / initialize）失败
+        print(f"   连接错误: {str(e)}")
+        print(f"❌ MCP 服务器未运行，请先启动服务: {config.mcp_raw}")
         print("   启动命令: python run_mcp.py")
-        return
-    
-    print(f"✅ MCP 服务器运行正常: {MCP_BASE_URL_RAW}\n")
-    
-    await test_with_client()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s", stream=sys.stdout)
     asyncio.run(main())
@@ -0,0 +1,321 @@
+"""
+MCP 工具结果持久化缓存
+在进程内 LRU（mcp_client.cached_tool）之外，为确定性的 modelscope.* 工具提供跨进程、跨重启共享的缓存。
+后端可选本地磁盘目录或 S3 对象存储；值为 gzip 压缩的 JSON，并附带 {"ttl", "created"} 元数据。
+同一后端也用于转存体积过大的工具结果（offload_large_result / resolve_ref）
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+
+try:
+    from .fast_json import json_loads, json_dumps_bytes, json_dumps_canonical
+except ImportError:
+    # 直接运行时的备选方案
+    from fast_json import json_loads, json_dumps_bytes, json_dumps_canonical
+
+# 尝试导入 aioboto3（S3 后端需要）
+try:
+    import aioboto3
+    HAS_AIOBOTO3 = True
+except ImportError:
+    HAS_AIOBOTO3 = False
+
+logger = logging.getLogger(__name__)
+
+# 各工具结果的持久化 TTL（秒）：-1 表示永不过期（结果只由参数决定），0 表示不缓存
+TOOL_TTL = {
+    "modelscope.get_model_info": 86400,
+    "modelscope.download_dataset": -1,
+    "modelscope.search_model": 600,
+}
+
+
+def tool_cache_key(tool: str, arguments: Dict[str, Any], server_url: str = "") -> str:
+    """
+    工具结果缓存键：blake2b(服务器 \0 工具名 \0 规范化参数 JSON)
+
+    参数按键排序序列化，与字典插入顺序无关；128 位摘要用于缓存索引足够。
+    持久化缓存不带 server_url，同一工具的结果在不同部署之间共享
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(server_url.encode('utf-8'))
+    h.update(b"\x00")
+    h.update(tool.encode('utf-8'))
+    h.update(b"\x00")
+    h.update(json_dumps_canonical(arguments))
+    return h.hexdigest()
+
+
+def _is_successful_result(value: Any) -> bool:
+    """是否为可以持久化的成功结果：失败的调用（空结果、isError、顶层 error 字段）不能被永久缓存"""
+    if value is None or value == {}:
+        return False
+    return not (isinstance(value, dict) and (value.get("isError") is True or "error" in value))
+
+
+class DiskCacheBackend:
+    """本地目录后端：每个键一个文件，首行为元数据 JSON，其后为 gzip 数据"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def ref_for(self, key: str) -> str:
+        """转存结果的引用地址"""
+        return f"file://{os.path.abspath(self._file(key))}"
+
+    def _read(self, key: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        try:
+            with open(self._file(key), 'rb') as f:
+                meta = json_loads(f.readline())
+                return meta, f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, meta: Dict[str, Any], data: bytes):
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # 先写唯一的临时文件再替换，避免读到写了一半的文件（同进程内的并发写入也各用各的临时文件）
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json_dumps_bytes(meta) + b"\n")
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _delete(self, key: str):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    async def get(self, key: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, meta: Dict[str, Any], data: bytes):
+        await asyncio.to_thread(self._write, key, meta, data)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    async def close(self):
+        pass
+
+
+class S3Backend:
+    """S3 后端：对象内容为 gzip 数据，ttl / created 存放在对象元数据中"""
+
+    def __init__(self, bucket: str, prefix: str = "mcp-tool-cache/"):
+        if not HAS_AIOBOTO3:
+            raise RuntimeError("S3 缓存后端需要 aioboto3，请运行: pip install aioboto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self._session = aioboto3.Session()
+        self._client_cm = None
+        self._client = None
+        self._lock = asyncio.Lock()
+
+    def ref_for(self, key: str) -> str:
+        """转存结果的引用地址"""
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+    async def _get_client(self):
+        """复用同一个 S3 客户端（及其连接池）"""
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    self._client_cm = self._session.client("s3")
+                    self._client = await self._client_cm.__aenter__()
+        return self._client
+
+    async def get(self, key: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        s3 = await self._get_client()
+        try:
+            response = await s3.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except s3.exceptions.NoSuchKey:
+            return None
+        async with response["Body"] as body:
+            data = await body.read()
+        return response.get("Metadata", {}), data
+
+    async def set(self, key: str, meta: Dict[str, Any], data: bytes):
+        s3 = await self._get_client()
+        await s3.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            ContentEncoding="gzip",
+            ContentType="application/json",
+            Metadata={name: str(value) for name, value in meta.items()}
+        )
+
+    async def delete(self, key: str):
+        s3 = await self._get_client()
+        await s3.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    async def close(self):
+        if self._client_cm is not None:
+            await self._client_cm.__aexit__(None, None, None)
+        self._client_cm = None
+        self._client = None
+
+
+class PersistentToolCache:
+    """
+    持久化工具结果缓存
+
+    读写失败只记录警告并按未命中处理，不影响工具调用本身。只持久化成功的结果
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def get(self, key: str) -> Optional[Any]:
+        """读取未过期的缓存结果，未命中返回 None"""
+        try:
+            entry = await self.backend.get(key)
+            if entry is None:
+                return None
+            meta, data = entry
+            ttl = int(meta.get("ttl", 0))
+            if ttl >= 0 and time.time() - float(meta.get("created", 0)) > ttl:
+                await self.backend.delete(key)
+                return None
+            return json_loads(gzip.decompress(data))
+        except Exception as e:
+            logger.warning("读取工具结果持久化缓存失败: %s", e)
+            return None
+
+    async def set(self, key: str, value: Any, ttl: int):
+        """写入缓存；ttl=-1 永不过期，ttl=0 不写入；失败的结果（空、isError、含 error 字段）不写入"""
+        if ttl == 0 or not _is_successful_result(value):
+            return
+        try:
+            meta = {"ttl": ttl, "created": int(time.time())}
+            await self.backend.set(key, meta, gzip.compress(json_dumps_bytes(value)))
+        except Exception as e:
+            logger.warning("写入工具结果持久化缓存失败: %s", e)
+
+    async def put_ref(self, key: str, data: bytes, tool: str) -> str:
+        """写入转存数据（gzip 后的 JSON，不过期），返回引用地址"""
+        meta = {"ttl": -1, "created": int(time.time()), "tool": tool}
+        await self.backend.set(key, meta, data)
+        return self.backend.ref_for(key)
+
+    async def close(self):
+        await self.backend.close()
+
+
+_PERSISTENT_CACHE: Optional[PersistentToolCache] = None
+_PERSISTENT_CACHE_INITIALIZED = False
+
+
+def get_persistent_cache() -> Optional[PersistentToolCache]:
+    """按配置（TOOL_CACHE_BACKEND）创建全局持久化缓存；未启用或不可用时返回 None"""
+    global _PERSISTENT_CACHE, _PERSISTENT_CACHE_INITIALIZED
+    if _PERSISTENT_CACHE_INITIALIZED:
+        return _PERSISTENT_CACHE
+    _PERSISTENT_CACHE_INITIALIZED = True
+
+    backend_name = settings.tool_cache_backend
+    if backend_name == "disk":
+        _PERSISTENT_CACHE = PersistentToolCache(DiskCacheBackend(settings.tool_cache_dir))
+    elif backend_name == "s3":
+        if not HAS_AIOBOTO3:
+            logger.warning("TOOL_CACHE_BACKEND=s3 但未安装 aioboto3，持久化缓存已禁用")
+        elif not settings.tool_cache_s3_bucket:
+            logger.warning("TOOL_CACHE_BACKEND=s3 但未设置 TOOL_CACHE_S3_BUCKET，持久化缓存已禁用")
+        else:
+            _PERSISTENT_CACHE = PersistentToolCache(
+                S3Backend(settings.tool_cache_s3_bucket, settings.tool_cache_s3_prefix)
+            )
+    return _PERSISTENT_CACHE
+
+
+async def close_persistent_cache():
+    """关闭全局持久化缓存（应用关闭时调用）"""
+    global _PERSISTENT_CACHE, _PERSISTENT_CACHE_INITIALIZED
+    if _PERSISTENT_CACHE is not None:
+        await _PERSISTENT_CACHE.close()
+    _PERSISTENT_CACHE = None
+    _PERSISTENT_CACHE_INITIALIZED = False
+
+
+# 转存引用中附带的结果预览长度（字符），让 LLM 在不取回全文时也能了解大致内容
+_REF_PREVIEW_CHARS = 2000
+
+
+def is_result_ref(obj: Any) -> bool:
+    """判断是否为 offload_large_result 返回的转存引用"""
+    return isinstance(obj, dict) and "_ref" in obj
+
+
+async def offload_large_result(tool: str, result: Any) -> Any:
+    """
+    体积超过 TOOL_RESULT_OFFLOAD_BYTES 的工具结果转存到缓存后端，返回
+    {"_ref", "size", "tool", "preview"} 引用；未启用后端、结果较小或转存失败时原样返回
+    """
+    threshold = settings.tool_result_offload_bytes
+    if threshold <= 0 or isinstance(result, (str, int, float, bool)) or result is None:
+        return result
+    cache = get_persistent_cache()
+    if cache is None:
+        return result
+
+    try:
+        body = json_dumps_bytes(result)
+    except TypeError:
+        return result
+    size = len(body)
+    if size <= threshold:
+        return result
+
+    # 按内容寻址：相同结果只存一份
+    key = hashlib.blake2b(body).hexdigest()
+    try:
+        ref = await cache.put_ref(key, gzip.compress(body), tool)
+    except Exception as e:
+        logger.warning("转存大体积工具结果失败，按原样返回: %s", e)
+        return result
+
+    ref_result = {
+        "_ref": ref,
+        "size": size,
+        "tool": tool,
+        "preview": body[:_REF_PREVIEW_CHARS * 4].decode('utf-8', errors='ignore')[:_REF_PREVIEW_CHARS],
+    }
+    # 保留 _meta（cache_hint），缓存层还要据此判断是否缓存
+    if isinstance(result, dict) and "_meta" in result:
+        ref_result["_meta"] = result["_meta"]
+    return ref_result
+
+
+async def resolve_ref(ref: Any) -> Any:
+    """取回转存引用对应的完整结果；传入的不是引用时原样返回"""
+    if not is_result_ref(ref):
+        return ref
+    cache = get_persistent_cache()
+    if cache is None:
+        raise RuntimeError(f"未启用工具结果缓存后端，无法取回 {ref['_ref']}")
+
+    key = ref["_ref"].rsplit("/", 1)[-1]
+    entry = await cache.backend.get(key)
+    if entry is None:
+        raise KeyError(f"转存的工具结果不存在: {ref['_ref']}")
+    return json_loads(gzip.decompress(entry[1]))
@@ -8,20 +8,116 @@
 3. 模型决定是否继续循环
 """
 
+import asyncio
+import hashlib
 import json
 import calendar
 import aiohttp
 import base64
 import re
+import sys
 import time
+import types
+from collections import Counter, OrderedDict, defaultdict
 from typing import List, Dict, Any, Optional, AsyncGenerator
 from datetime import datetime, timedelta, timezone
 
-from services.azure_openai_service import OpenAIService, AzureOpenAIService, DoubaoService
+from services.azure_openai_service import OpenAIService, AzureOpenAIService, DoubaoService, _get_shared_connector
 from services.multi_mcp_client import MultiMCPClient
+from services.fast_json import json_loads, json_dumps, json_dumps_canonical, json_dumps_pretty, JSONDecodeError
 from config import settings
 
 
+_ANSWER_CACHE_MAXSIZE = 256
+# 输出格式提醒：放在用户问题和每条工具结果之后（而不是每轮临时追加到末尾），保持消息只追加
+_JSON_REMINDER = "你的输出必须严格符合json格式"
+# 工具调用转移频率表：上一个调用最多记录的条数，以及预测执行所需的最少出现次数
+_TRANSITIONS_MAXSIZE = 1024
+_SPECULATION_MIN_COUNT = 2
+
+
+# 流式输出中 action 对象的起始位置（不匹配 "actions"）
+_ACTION_KEY_RE = re.compile(r'"action"\s*:\s*\{')
+# 从任意位置开始解析一个 JSON 值（C 实现的扫描器，忽略其后的多余文本）
+_JSON_DECODER = json.JSONDecoder()
+# 模型动作对象至少包含其中一个字段；不含这些字段的对象（如示例、参数片段）不视为动作
+_ACTION_FIELDS = ('action', 'actions', 'show_content')
+
+
+def _is_action_object(parsed: Any) -> bool:
+    return isinstance(parsed, dict) and any(field in parsed for field in _ACTION_FIELDS)
+
+
+def _extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    从模型输出中取出 JSON 对象
+
+    先整体解析（绝大多数输出就是纯 JSON）；失败时从每个 "{" 处尝试解析出一个完整对象，
+    跳过前后的说明文字和 markdown 代码块标记。只接受含 action / actions / show_content 的对象，
+    没有这样的对象时返回 None（由调用方重试）
+    """
+    try:
+        parsed = json_loads(text)
+        if isinstance(parsed, dict):
+            return parsed if _is_action_object(parsed) else None
+    except JSONDecodeError:
+        pass
+
+    start = text.find('{')
+    while start != -1:
+        try:
+            parsed, _ = _JSON_DECODER.raw_decode(text, start)
+            if _is_action_object(parsed):
+                return parsed
+        except JSONDecodeError:
+            pass
+        start = text.find('{', start + 1)
+    return None
+
+
+def _action_key(tool_name: str, args: Any) -> tuple:
+    """工具调用的比较键：(工具名称, 规范化序列化的参数)"""
+    return tool_name, json_dumps_canonical(args or {})
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数（无需分词器）
+
+    按 UTF-8 字节数 / 3 估算：中文字符约 1 token，英文约 3~4 个字符 1 token
+    """
+    return len(text.encode('utf-8')) // 3
+
+
+def create_llm_service():
+    """根据配置动态选择并创建模型服务（进程内只需创建一次并复用）"""
+    if settings.use_model.lower() == "gemini":
+        print(f"🤖 初始化模型: Gemini-3-Flash-Preview")
+        return OpenAIService(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            model=settings.openai_model
+        )
+    elif settings.use_model.lower() == "gpt4.1":
+        print(f"🤖 初始化模型: Azure GPT-4.1")
+        return AzureOpenAIService(
+            endpoint=settings.azure_endpoint,
+            api_key=settings.azure_api_key,
+            api_version=settings.azure_api_version,
+            deployment_name=settings.azure_deployment_name
+        )
+    elif settings.use_model.lower() == "doubao":
+        print(f"🤖 初始化模型: ByteDance Doubao ({settings.doubao_model})")
+        return DoubaoService(
+            api_key=settings.doubao_api_key,
+            base_url=settings.doubao_base_url,
+            model=settings.doubao_model,
+            timeout=settings.doubao_timeout
+        )
+    else:
+        raise ValueError(f"不支持的模型类型: {settings.use_model}")
+
+
 class ReActStep:
     """ReAct推理步骤"""
 
@@ -69,43 +165,50 @@ class TrueReActAgent:
 
     def __init__(self):
         self.openai_service = None
-        self.tools = {}  # 工具注册表
+        self.tools = {}  # 工具注册表（初始化后为只读映射）
+        self._tool_names = frozenset()  # 工具名称集合，用于快速判断工具是否存在
+        self._tools_desc = ""  # 系统提示词中的工具列表，注册工具时生成
         self.max_iterations = 20
         self.multi_mcp_client = None  # 多 MCP 客户端
+        self._http_session: Optional[aiohttp.ClientSession] = None  # 聊天历史接口复用的会话
+        # 答案缓存：key -> (写入时间, 缓存的最终结果)，按最近使用排序（LRU）
+        self._answer_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # 工具调用转移频率：上一个调用的 _action_key -> Counter(下一个调用的 _action_key)
+        self._transitions: Dict[tuple, Counter] = defaultdict(Counter)
+        self._text_extract_fallbacks = 0  # 模型输出无法解析为 JSON、以完整输出作为答案的次数
+
+    async def initialize(self, llm_service=None):
+        """
+        初始化服务
 
-    async def initialize(self):
-        """初始化服务"""
-        # 根据配置动态选择模型服务
-        if settings.use_model.lower() == "gemini":
-            print(f"🤖 初始化模型: Gemini-3-Flash-Preview")
-            self.openai_service = OpenAIService(
-                api_key=settings.openai_api_key,
-                base_url=settings.openai_base_url,
-                model=settings.openai_model
-            )
-        elif settings.use_model.lower() == "gpt4.1":
-            print(f"🤖 初始化模型: Azure GPT-4.1")
-            self.openai_service = AzureOpenAIService(
-                endpoint=settings.azure_endpoint,
-                api_key=settings.azure_api_key,
-                api_version=settings.azure_api_version,
-                deployment_name=settings.azure_deployment_name
-            )
-        elif settings.use_model.lower() == "doubao":
-            print(f"🤖 初始化模型: ByteDance Doubao ({settings.doubao_model})")
-            self.openai_service = DoubaoService(
-                api_key=settings.doubao_api_key,
-                base_url=settings.doubao_base_url,
-                model=settings.doubao_model,
-                timeout=settings.doubao_timeout
-            )
-        else:
-            raise ValueError(f"不支持的模型类型: {settings.use_model}")
+        Args:
+            llm_service: 进程内共享的模型服务实例（由应用启动时创建并预热），
+                         未提供时按配置自行创建
+        """
+        self.openai_service = llm_service or create_llm_service()
 
         # 初始化多 MCP 客户端
         await self._init_multi_mcp_client()
         self._register_tools()
 
+    async def _get_http_session(self) -> aiohttp.ClientSession:
+        """获取聊天历史接口复用的会话（keep-alive），首次使用或已关闭时重新创建"""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=_get_shared_connector(),
+                connector_owner=False,
+                json_serialize=json_dumps
+            )
+        return self._http_session
+
+    async def aclose(self):
+        """关闭复用的 HTTP 会话"""
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        self._http_session = None
+
     async def _init_multi_mcp_client(self):
         """初始化多 MCP 客户端"""
         try:
@@ -128,7 +231,9 @@ class TrueReActAgent:
 
     def _register_tools(self):
         """注册可用工具 - 从 MultiMCPClient 获取具体工具信息"""
-        self.tools = {}
+        tools = {}
+        # 只读工具白名单（REACT_READ_ONLY_TOOLS），与服务器的 readOnlyHint 注解共同决定 read_only
+        read_only_tools = {name.strip() for name in settings.react_read_only_tools.split(",") if name.strip()}
 
         # 获取 MultiMCP 客户端中的所有工具
         if self.multi_mcp_client:
@@ -190,15 +295,17 @@ class TrueReActAgent:
                     # 使用工具描述或默认描述
                     description = tool_info.get('description') or f"调用 {tool_name} 工具"
 
-                    self.tools[tool_name] = {
+                    tools[tool_name] = {
                         "description": description,
                         "parameters": params,
                         "server": tool_info.get('server', 'unknown'),
-                        "hidden_params": hidden_params  # 记录隐藏参数列表
+                        "hidden_params": hidden_params,  # 记录隐藏参数列表
+                        # 只读工具才允许提前执行，调用后仍可写入答案缓存
+                        "read_only": bool(tool_info.get('read_only')) or tool_name in read_only_tools
                     }
 
         # 添加 finish 工具（特殊处理，不需要调用服务器）
-        self.tools["finish"] = {
+        tools["finish"] = {
             "description": "完成任务并返回最终答案。当你已经有足够信息回答问题时使用。",
             "parameters": {
                 "answer": "最终答案（必需）"
@@ -206,6 +313,21 @@ class TrueReActAgent:
             "server": "internal"  # 标记为内部工具
         }
 
+        # batch_execute 为虚拟工具（仅用于提示词说明）：一次给出多个互不依赖的工具调用，
+        # 由 run 展开后并发执行，不会作为单独的工具被调用
+        tools["batch_execute"] = {
+            "description": "一次并发执行多个互不依赖的工具调用（不能包含 finish）。等价于在输出中使用 actions 列表。",
+            "parameters": {
+                "actions": "工具调用列表，每项为 {\"tool\": 工具名称, \"args\": {工具参数}}（必需）"
+            },
+            "server": "internal"
+        }
+
+        # 注册完成后冻结为只读映射：键名驻留（intern），运行期只读不写
+        self.tools = types.MappingProxyType({sys.intern(name): info for name, info in tools.items()})
+        self._tool_names = frozenset(self.tools)
+        self._tools_desc = self._build_tools_desc()
+
     # ============== 聊天历史 HTTP 接口 ==============
 
     async def fetch_chat_history(self, user_id: str, page: int = 1, page_size: int = 10) -> List[Dict[str, Any]]:
@@ -228,59 +350,54 @@ class TrueReActAgent:
                 "page_size": page_size
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    json=request_data,
-                    headers={"Content-Type": "application/json"},
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if isinstance(result, dict) and "data" in result:
-                            messages = result.get("data", {}).get("messages", [])
-                            print(f"[ChatHistory] 获取到 {len(messages)} 条历史消息")
-
-                            # 打印获取到的数据详情
-                            print(f"[ChatHistory] 原始响应数据:")
-                            print(json.dumps(result, indent=2, ensure_ascii=False))
-
-                            if messages:
-                                print(f"\n[ChatHistory] 消息详情:")
-                                for i, msg in enumerate(messages, 1):
-                                    print(f"\n  消息 {i}:")
-                                    print(f"    类型: {type(msg)}")
-                                    if isinstance(msg, dict):
-                                        print(f"    键: {list(msg.keys())}")
-
-                                        # 打印所有字段的详细信息
-                                        for key, value in msg.items():
-                                            print(f"    {key}: {type(value)} = {value}")
-
-                                            # 如果是content字段，显示详细内容
-                                            if key == "content" and isinstance(value, list):
-                                                print(f"      content 列表长度: {len(value)}")
-                                                for j, item in enumerate(value):
-                                                    print(f"        项 {j}: {type(item)} = {item}")
-
-                                            # 如果是steps字段，显示详细信息
-                                            elif key == "steps" and isinstance(value, (dict, list)):
-                                                print(f"      steps 类型: {type(value)}")
-                                                if isinstance(value, dict):
-                                                    print(f"        steps 键: {list(value.keys())}")
-                                                    for step_key, step_value in value.items():
-                                                        print(f"          {step_key}: {step_value}")
-                                                elif isinstance(value, list):
-                                                    print(f"        steps 列表长度: {len(value)}")
-                                                    for k, step_item in enumerate(value):
-                                                        print(f"          项 {k}: {type(step_item)} = {step_item}")
-                                    else:
-                                        print(f"    值: {msg}")
-
-                            return messages
-                    else:
-                        print(f"[ChatHistory] 获取失败，状态码: {response.status}")
-                        return []
+            session = await self._get_http_session()
+            async with session.post(url, json=request_data) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    if isinstance(result, dict) and "data" in result:
+                        messages = result.get("data", {}).get("messages", [])
+                        print(f"[ChatHistory] 获取到 {len(messages)} 条历史消息")
+
+                        # 打印获取到的数据详情
+                        print(f"[ChatHistory] 原始响应数据:")
+                        print(json_dumps_pretty(result))
+
+                        if messages:
+                            print(f"\n[ChatHistory] 消息详情:")
+                            for i, msg in enumerate(messages, 1):
+                                print(f"\n  消息 {i}:")
+                                print(f"    类型: {type(msg)}")
+                                if isinstance(msg, dict):
+                                    print(f"    键: {list(msg.keys())}")
+
+                                    # 打印所有字段的详细信息
+                                    for key, value in msg.items():
+                                        print(f"    {key}: {type(value)} = {value}")
+
+                                        # 如果是content字段，显示详细内容
+                                        if key == "content" and isinstance(value, list):
+                                            print(f"      content 列表长度: {len(value)}")
+                                            for j, item in enumerate(value):
+                                                print(f"        项 {j}: {type(item)} = {item}")
+
+                                        # 如果是steps字段，显示详细信息
+                                        elif key == "steps" and isinstance(value, (dict, list)):
+                                            print(f"      steps 类型: {type(value)}")
+                                            if isinstance(value, dict):
+                                                print(f"        steps 键: {list(value.keys())}")
+                                                for step_key, step_value in value.items():
+                                                    print(f"          {step_key}: {step_value}")
+                                            elif isinstance(value, list):
+                                                print(f"        steps 列表长度: {len(value)}")
+                                                for k, step_item in enumerate(value):
+                                                    print(f"          项 {k}: {type(step_item)} = {step_item}")
+                                else:
+                                    print(f"    值: {msg}")
+
+                        return messages
+                else:
+                    print(f"[ChatHistory] 获取失败，状态码: {response.status}")
+                    return []
         except Exception as e:
             print(f"[ChatHistory] 获取历史消息异常: {str(e)}")
             return []
@@ -317,22 +434,17 @@ class TrueReActAgent:
                 "steps": steps or {}
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    url,
-                    json=request_data,
-                    headers={"Content-Type": "application/json"},
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if isinstance(result, dict) and "data" in result:
-                            message_id = result.get("data", {}).get("id")
-                            print(f"[ChatHistory] 创建消息成功，ID: {message_id}")
-                            return message_id
-                    else:
-                        print(f"[ChatHistory] 创建消息失败，状态码: {response.status}")
-                        return None
+            session = await self._get_http_session()
+            async with session.post(url, json=request_data) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    if isinstance(result, dict) and "data" in result:
+                        message_id = result.get("data", {}).get("id")
+                        print(f"[ChatHistory] 创建消息成功，ID: {message_id}")
+                        return message_id
+                else:
+                    print(f"[ChatHistory] 创建消息失败，状态码: {response.status}")
+                    return None
         except Exception as e:
             print(f"[ChatHistory] 创建消息异常: {str(e)}")
             return None
@@ -408,7 +520,7 @@ class TrueReActAgent:
                 content = msg.get("content", [])
                 if isinstance(content, str):
                     try:
-                        content = json.loads(content)
+                        content = json_loads(content)
                     except:
                         answer = content[:200]
                         if answer:
@@ -498,8 +610,8 @@ class TrueReActAgent:
 
         return calendar_info
 
-    def _build_system_prompt(self, image_urls: List[str] = None, user_metadata: Optional[Dict[str, Any]] = None) -> str:
-        """构建系统提示词"""
+    def _build_tools_desc(self) -> str:
+        """生成系统提示词中的工具列表（OpenAI function calling 格式），工具注册后不变"""
         # 生成 OpenAI function calling 格式的工具列表
         tools_list = []
         for name, info in self.tools.items():
@@ -559,7 +671,12 @@ class TrueReActAgent:
                 }
             })
 
-        tools_desc = "可用工具列表:\n" + json.dumps(tools_list, ensure_ascii=False, indent=2)
+        return "可用工具列表:\n" + json_dumps_pretty(tools_list)
+
+    def _build_system_prompt(self, image_urls: List[str] = None, user_metadata: Optional[Dict[str, Any]] = None) -> str:
+        """构建系统提示词"""
+        # 工具列表在 _register_tools 中生成一次
+        tools_desc = self._tools_desc
 
         # 构建用户信息部分
         user_info = ""
@@ -604,12 +721,10 @@ class TrueReActAgent:
         # 获取日历信息
         calendar_info = self._get_calendar_info()
 
+        # 不随请求变化的部分（工具列表、输出格式、规则）在前，时间与用户信息在末尾，
+        # 使各请求的系统提示词共享尽可能长的相同前缀，便于模型服务端的前缀缓存命中
         return f"""你是一个ReAct智能体。你需要通过"思考-行动-观察"循环来解决问题。
 
-{calendar_info}
-
-{user_info}
-
 ## 可用工具
 {tools_desc}
 
@@ -624,8 +739,18 @@ class TrueReActAgent:
     }}
 }}
 
+如果本步骤需要多个互不依赖的工具调用（后一个调用不需要用到前一个调用的结果），可以用 actions 列表代替 action 一次给出，这些调用会并发执行：
+
+{{
+    "show_content": "本步骤展示给用户看的文本",
+    "actions": [
+        {{"tool": "工具名称", "args": {{工具参数}}}},
+        {{"tool": "工具名称", "args": {{工具参数}}}}
+    ]
+}}
+
 ## 重要规则 严格遵守
-1. 每次迭代只能选择一个工具
+1. 每次迭代只能选择一个工具，或用 actions 一次给出多个互不依赖的工具调用；finish 只能单独使用
 2. 当你认为已经可以回答问题时，使用 finish 工具并提供完整答案
 3. 如果工具执行失败，考虑其他方案
 4. 不要重复使用相同的工具和参数
@@ -651,19 +776,29 @@ class TrueReActAgent:
 严格要求
 1. 优先考虑最末尾的对话消息
 2. 只输出接下来一个步骤
-"""
+
+{calendar_info}
+
+{user_info}"""
   
-    def _build_conversation(
+    def _build_base_messages(
         self,
         query: str,
-        steps: List[ReActStep],
         image_urls: List[str] = None,
         user_metadata: Optional[Dict[str, Any]] = None,
-        chat_history: List[Dict[str, Any]] = None
+        chat_history: List[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None
     ) -> List[Dict]:
-        """构建对话历史"""
+        """
+        构建对话的固定前缀：系统提示词、历史聊天消息和当前用户问题（一次运行内不变）
+
+        Args:
+            system_prompt: 本次运行已构建的系统提示词，未提供时重新构建
+        """
+        if system_prompt is None:
+            system_prompt = self._build_system_prompt(image_urls, user_metadata)
         messages = [
-            {"role": "system", "content": self._build_system_prompt(image_urls, user_metadata)},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": "以下是历史聊天记录"},
         ]
 
@@ -732,38 +867,136 @@ class TrueReActAgent:
         else:
             messages.append({"role": "user", "content": f"用户问题：{query}"})
 
-        # 添加当前轮次的ReAct历史步骤
-        for step in steps:
-            if step.type == "thought":
-                # 思考和行动是一起的，跳过单独的thought
-                continue
-            elif step.type == "action":
-                # 模型的行动输出
-                action_output = {
-                    "thought": step.content.get("show_content", ""),
-                    "action": {
-                        "tool": step.tool_name,
-                        "args": step.tool_args
-                    }
+        messages.append({"role": "user", "content": _JSON_REMINDER})
+        return messages
+
+    @staticmethod
+    def _step_messages(step: ReActStep) -> List[Dict]:
+        """单个 ReAct 步骤对应的对话消息（每个步骤只在记录时序列化一次）"""
+        if step.type == "action":
+            # 模型的行动输出
+            action_output = {
+                "thought": step.content.get("show_content", ""),
+                "action": {
+                    "tool": step.tool_name,
+                    "args": step.tool_args
                 }
-                messages.append({
-                    "role": "assistant",
-                    "content": json.dumps(action_output, ensure_ascii=False)
-                })
+            }
+            return [{
+                "role": "assistant",
+                "content": json_dumps(action_output)
+            }]
+        if step.type == "observation":
+            # 工具执行结果（单独的 user 消息，附带输出格式提醒，之后不再修改）
+            return [{
+                "role": "user",
+                "content": f"工具执行结果：{json_dumps(step.tool_result)}\n\n{_JSON_REMINDER}"
+            }]
+        # 思考和行动是一起的，跳过单独的thought
+        return []
+
+    async def _maybe_summarize_history(
+        self,
+        query: str,
+        steps: List[ReActStep],
+        observation_tokens: List[tuple],
+        history_summary: str,
+        summarized_upto: int
+    ) -> tuple:
+        """
+        观察结果累计超出 token 预算时，把较早的步骤压缩为一段摘要
+
+        保留最近 react_history_keep_recent 次观察原文，其余步骤（连同已有摘要）
+        交给模型生成新摘要，避免提示词随迭代次数无限增长
+
+        Args:
+            steps: 全部步骤
+            observation_tokens: (观察步骤下标, 估算 token 数) 列表
+            history_summary: 当前摘要
+            summarized_upto: steps[:summarized_upto] 已包含在摘要中
+
+        Returns:
+            (新摘要, 新的 summarized_upto)
+        """
+        keep_recent = max(settings.react_history_keep_recent, 0)
+        live = [(index, tokens) for index, tokens in observation_tokens if index >= summarized_upto]
+        if len(live) <= keep_recent or sum(tokens for _, tokens in live) <= settings.react_history_token_budget:
+            return history_summary, summarized_upto
+
+        # 在保留的最近观察之前切分（切在观察步骤之后，保证 action/observation 成对）
+        cut = live[len(live) - keep_recent - 1][0] + 1
+        summary = await self._summarize_steps(query, steps[summarized_upto:cut], history_summary)
+        print(f"[ReAct] 历史步骤超出 token 预算，已将前 {cut} 个步骤压缩为摘要")
+        return summary, cut
+
+    async def _summarize_steps(self, query: str, steps: List[ReActStep], previous_summary: str = "") -> str:
+        """调用模型把一段工具调用过程压缩为摘要，失败时退化为截断拼接"""
+        lines = []
+        for step in steps:
+            if step.type == "action":
+                lines.append(f"调用工具 {step.tool_name}，参数：{json_dumps(step.tool_args)}")
             elif step.type == "observation":
-                # 工具执行结果
-                messages.append({
-                    "role": "user",
-                    "content": f"工具执行结果：{json.dumps(step.tool_result, ensure_ascii=False)}"
-                })
+                lines.append(f"结果：{json_dumps(step.tool_result)}")
+        process_text = "\n".join(lines)
 
-        messages.append(
-            {"role": "user", "content": "你的输出必须严格符合json格式"}
-        )
-        return messages
+        messages = [
+            {
+                "role": "system",
+                "content": "你负责压缩智能体的工具调用记录。请保留与用户问题相关的关键事实、数据、ID 和时间，删除冗余字段，输出简洁的纯文本摘要。"
+            },
+            {
+                "role": "user",
+                "content": f"用户问题：{query}\n\n已有摘要：{previous_summary or '无'}\n\n新的工具调用记录：\n{process_text}"
+            }
+        ]
+        try:
+            response = await self.openai_service.chat_completion(messages, max_tokens=800, temperature=0.1)
+            summary = response.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+            if summary:
+                return summary
+        except Exception as e:
+            print(f"[ReAct] 生成历史摘要失败，使用截断结果: {e}")
+
+        truncated = "\n".join(line[:200] for line in lines)
+        return f"{previous_summary}\n{truncated}".strip()
+
+    async def _stream_model_content(self, messages: List[Dict], on_action) -> str:
+        """
+        流式调用模型并返回完整输出
+
+        输出中的 "action" 对象一完整（含 tool）就调用 on_action(action)，此时模型通常只剩结尾的括号未生成
+        """
+        parts = []
+        notified = False
+        async for chunk in self.openai_service.chat_completion_stream(messages, max_tokens=3000, temperature=0.1):
+            choices = chunk.get("choices") or []
+            delta = (choices[0].get("delta") or {}).get("content") if choices else None
+            if not delta:
+                continue
+            parts.append(delta)
+            # action 对象只可能在出现 "}" 的片段结束
+            if notified or '}' not in delta:
+                continue
+            text = "".join(parts)
+            match = _ACTION_KEY_RE.search(text)
+            if match is None:
+                continue
+            try:
+                action, _ = _JSON_DECODER.raw_decode(text, match.end() - 1)
+            except JSONDecodeError:
+                continue
+            if isinstance(action, dict) and "tool" in action:
+                notified = True
+                on_action(action)
+        return "".join(parts)
+
+    async def _call_model(self, messages: List[Dict], on_action=None) -> Dict[str, Any]:
+        """
+        调用模型并解析输出（最多重试3次）
 
-    async def _call_model(self, messages: List[Dict]) -> Dict[str, Any]:
-        """调用模型并解析输出（最多重试3次）"""
+        Args:
+            on_action: 提供时流式读取模型输出，action 对象完整时立即回调（见 _stream_model_content）
+        """
         max_retries = 3
         retry_count = 0
         content = ""  # 初始化content变量
@@ -771,16 +1004,19 @@ class TrueReActAgent:
         while retry_count < max_retries:
             try:
                 s_t = time.time()
-                response = await self.openai_service.chat_completion(
-                    messages,
-                    max_tokens=3000,
-                    temperature=0.1
-                )
-
-                content = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+                if on_action is not None:
+                    content = await self._stream_model_content(messages, on_action)
+                else:
+                    response = await self.openai_service.chat_completion(
+                        messages,
+                        max_tokens=3000,
+                        temperature=0.1
+                    )
+
+                    content = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+                    print("response:",response)
+                    print("")
                 e_t = time.time()
-                print("response:",response)
-                print("")
 
                 print(f"模型耗时:{e_t-s_t}")
                 print(f"\n{'='*80}")
@@ -789,28 +1025,26 @@ class TrueReActAgent:
                 print(f"{content}")
                 print(f"{'='*80}\n")
 
-                # 尝试解析JSON
-                # 处理可能的markdown代码块
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0]
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0]
-
+                # 解析JSON（兼容 markdown 代码块和前后的说明文字）
                 content = content.strip()
-
-                parsed = json.loads(content)
+                parsed = _extract_json_object(content)
+                if parsed is None:
+                    raise JSONDecodeError("模型输出中没有包含 action / actions / show_content 的 JSON 对象", content, 0)
 
                 return {
                     "success": True,
                     "thought": parsed.get("show_content", ""),
-                    "action": parsed.get("action", {})
+                    "action": parsed.get("action", {}),
+                    "actions": parsed.get("actions")
                 }
             except json.JSONDecodeError as e:
                 print(f"[JSON解析失败] 第 {retry_count + 1} 次尝试: {e}")
                 print(f"[原始内容]: {content}")
                 retry_count += 1
                 if retry_count >= max_retries:
-                    # 尝试从非JSON响应中提取信息
+                    # 多次解析失败：把模型的完整输出作为最终答案（不猜测工具调用，避免误执行有副作用的工具）
+                    self._text_extract_fallbacks += 1
+                    print(f"[JSON解析失败] 以完整输出作为答案（累计 {self._text_extract_fallbacks} 次）")
                     return {
                         "success": False,
                         "thought": content,
@@ -865,9 +1099,32 @@ class TrueReActAgent:
             }
         }
 
+    def _expand_actions(self, model_output: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        把模型输出展开为本轮要执行的工具调用列表（按模型给出的顺序）
+
+        支持单个 action、actions 列表、action 为列表以及 batch_execute 虚拟工具四种写法；
+        多个调用中的 finish 会被忽略（finish 只能单独使用），全部为 finish 时返回单个 finish
+        """
+        action = model_output.get("action") or {}
+        actions = model_output.get("actions")
+        if isinstance(action, list):
+            actions = action
+        elif isinstance(action, dict) and action.get("tool") == "batch_execute":
+            actions = (action.get("args") or {}).get("actions")
+
+        if not isinstance(actions, list) or not actions:
+            return [action if isinstance(action, dict) else {}]
+
+        calls = [call for call in actions if isinstance(call, dict)]
+        if len(calls) > 1:
+            tool_calls = [call for call in calls if call.get("tool", "finish") != "finish"]
+            calls = tool_calls or calls[:1]
+        return calls or [{}]
+
     async def _execute_tool(self, tool_name: str, args: Dict, user_id: Optional[str] = None) -> Dict[str, Any]:
         """执行工具"""
-        if tool_name not in self.tools:
+        if tool_name not in self._tool_names:
             return {"success": False, "error": f"未知工具: {tool_name}"}
 
         tool = self.tools[tool_name]
@@ -884,6 +1141,31 @@ class TrueReActAgent:
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    async def _execute_tools(self, calls: List[tuple], user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        并发执行多个互不依赖的工具调用，并发数不超过 react_max_concurrent_tools
+
+        Args:
+            calls: (工具名称, 工具参数) 列表
+
+        Returns:
+            与 calls 顺序一一对应的工具结果
+        """
+        if len(calls) == 1:
+            tool_name, tool_args = calls[0]
+            return [await self._execute_tool(tool_name, tool_args, user_id)]
+
+        semaphore = asyncio.Semaphore(max(settings.react_max_concurrent_tools, 1))
+
+        async def execute(tool_name: str, tool_args: Dict) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self._execute_tool(tool_name, tool_args, user_id)
+                except Exception as e:
+                    return {"success": False, "error": str(e)}
+
+        return await asyncio.gather(*(execute(tool_name, tool_args) for tool_name, tool_args in calls))
+
     # ============== 工具实现 ==============
 
     async def _tool_mcp_call_tool(self, tool_name: str, arguments: Dict[str, Any], user_id: Optional[str] = None) -> Dict[str, Any]:
@@ -949,6 +1231,97 @@ class TrueReActAgent:
                 "arguments": arguments
             }
 
+    # ============== 答案缓存 ==============
+
+    @staticmethod
+    def _answer_cache_key(
+        query: str, image_urls: List[str], user_id: Optional[str], chat_history: List[Dict[str, Any]]
+    ) -> str:
+        """
+        答案缓存的键：用户ID + 规范化查询（去首尾空白、小写、合并空白）+ 图像URL + 聊天历史 + 当天日期的 SHA-256
+
+        聊天历史参与构建提示词（"它"、"那明天呢" 等指代依赖上文），历史不同时答案不能复用；
+        提示词中的日历信息按天变化（"今天的日程" 等），跨天的答案也不能复用
+        """
+        normalized = " ".join(query.strip().lower().split())
+        today = datetime.now().date().isoformat()
+        return hashlib.sha256(
+            json_dumps_canonical([user_id, normalized, image_urls, chat_history, today])
+        ).hexdigest()
+
+    def _get_cached_answer(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取未过期的缓存结果"""
+        entry = self._answer_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > settings.react_answer_cache_ttl:
+            del self._answer_cache[key]
+            return None
+        self._answer_cache.move_to_end(key)
+        return value
+
+    def _store_cached_answer(self, key: str, steps: List[ReActStep], value: Dict[str, Any]):
+        """
+        写入缓存；以下运行不缓存：
+          - 没有调用任何工具：答案可能直接来自提示词中精确到秒的当前时间（"现在几点"、"今天几号"）
+          - 调用过非只读工具（可能有副作用）或有工具调用失败
+        """
+        tool_steps = [step for step in steps if step.type == "action" and step.tool_name != "finish"]
+        if not tool_steps:
+            return
+        for step in tool_steps:
+            if not self._is_read_only(step.tool_name):
+                return
+            if not isinstance(step.tool_result, dict) or not step.tool_result.get("success"):
+                return
+        self._answer_cache[key] = (time.monotonic(), value)
+        self._answer_cache.move_to_end(key)
+        while len(self._answer_cache) > _ANSWER_CACHE_MAXSIZE:
+            self._answer_cache.popitem(last=False)
+
+    def _is_read_only(self, tool_name: Any) -> bool:
+        """是否为已注册的只读 MCP 工具（readOnlyHint 注解或 REACT_READ_ONLY_TOOLS 白名单）"""
+        return (
+            isinstance(tool_name, str)
+            and tool_name in self._tool_names
+            and self.tools[tool_name].get("server") != "internal"
+            and self.tools[tool_name].get("read_only", False)
+        )
+
+    # ============== 工具预测执行 ==============
+
+    def _can_prefetch(self, tool_name: Any) -> bool:
+        """工具调用能否在模型确认之前提前发起：只允许只读工具"""
+        return self._is_read_only(tool_name)
+
+    def _record_transition(self, prev_key: tuple, next_key: tuple):
+        """记录一次 上一个工具调用 -> 下一个工具调用 的转移"""
+        if prev_key not in self._transitions and len(self._transitions) >= _TRANSITIONS_MAXSIZE:
+            # 淘汰最早记录的条目
+            del self._transitions[next(iter(self._transitions))]
+        self._transitions[prev_key][next_key] += 1
+
+    def _speculate(self, prev_key: tuple, user_id: Optional[str]) -> tuple:
+        """
+        按转移频率预测下一个工具调用并提前发起
+
+        只预测出现次数足够多的只读工具；不满足条件时返回 (None, None)
+
+        Returns:
+            (预测调用的 _action_key, 执行该调用的任务)
+        """
+        counter = self._transitions.get(prev_key)
+        if not counter:
+            return None, None
+        next_key, count = counter.most_common(1)[0]
+        tool_name = next_key[0]
+        if count < _SPECULATION_MIN_COUNT or not self._can_prefetch(tool_name):
+            return None, None
+        print(f"[ReAct] 预测下一个工具调用: {tool_name}（出现 {count} 次）")
+        task = asyncio.create_task(self._execute_tool(tool_name, json_loads(next_key[1]), user_id))
+        return next_key, task
+
     # ============== 主循环 ==============
 
     async def run(self, query: str, image_urls: Optional[List[str]] = None, user_metadata: Optional[Dict[str, Any]] = None) -> AsyncGenerator[Dict[str, Any], None]:
@@ -1000,10 +1373,32 @@ class TrueReActAgent:
         chat_history_time = (chat_history_end_time - chat_history_start_time) * 1000
         # ========== 聊天历史处理 ==========
 
+        # ========== 答案缓存（键包含聊天历史，必须在获取历史之后查找）==========
+        answer_cache_key = None
+        if settings.react_answer_cache_ttl > 0:
+            answer_cache_key = self._answer_cache_key(query, image_urls or [], current_user_id, chat_history)
+            cached = self._get_cached_answer(answer_cache_key)
+            if cached is not None:
+                print(f"[ReAct] 命中答案缓存: {query[:100]}")
+                yield {"query": query, **cached}
+                return
+        # ========== 答案缓存 ==========
+
         steps: List[ReActStep] = []
         image_urls = image_urls or []
         final_answer = ""
 
+        # 工具预测执行：上一轮单个工具调用的比较键，以及提前发起的预测调用
+        prev_action_key = None
+        spec_key, spec_task = None, None
+        # 流式读取时提前发起的调用（每轮重置）
+        early_key, early_task = None, None
+
+        # 历史步骤摘要：观察结果超出 token 预算时，较早的步骤被压缩进 history_summary
+        history_summary = ""
+        summarized_upto = 0  # steps[:summarized_upto] 已包含在摘要中
+        observation_tokens = []  # (观察步骤下标, 估算 token 数)
+
         print(f"\n{'='*60}")
         print(f"[ReAct] 开始处理: {query}")
         if image_urls:
@@ -1012,110 +1407,260 @@ class TrueReActAgent:
 
         # 打印系统提示词（确保完整输出到server.log）
         system_prompt = self._build_system_prompt(image_urls, user_metadata)
+        # 对话前缀只构建一次；步骤消息在记录步骤时追加，不再每轮重新序列化全部历史步骤
+        base_messages = self._build_base_messages(query, image_urls, user_metadata, chat_history, system_prompt)
+        step_messages: List[Dict] = []  # steps[summarized_upto:] 对应的消息
         print(f"\n{'='*80}")
         print(f"[SYSTEM PROMPT]")
         print(f"{'='*80}")
         print(f"{system_prompt}")
         print(f"{'='*80}\n")
 
-        for iteration in range(1, self.max_iterations + 1):
-            print(f"\n--- 迭代 {iteration} ---", flush=True)
-            current_iteration = iteration
+        try:
+            for iteration in range(1, self.max_iterations + 1):
+                print(f"\n--- 迭代 {iteration} ---", flush=True)
+                current_iteration = iteration
+
+                # Step 1: 构建对话并调用模型
+                # 统计系统提示词构建时间（包含在构建对话过程中）
+                previous_summarized_upto = summarized_upto
+                history_summary, summarized_upto = await self._maybe_summarize_history(
+                    query, steps, observation_tokens, history_summary, summarized_upto
+                )
+                system_prompt_start_time = time.time()
+                # 消息只追加不修改：前缀（系统提示词、历史、问题、此前的行动与观察）在各轮之间逐字节相同，
+                # 模型服务端的前缀缓存可以复用；仅在历史被压缩为摘要时前缀会变化
+                if summarized_upto != previous_summarized_upto:
+                    # 较早步骤被压缩为摘要（很少发生）：只保留未被摘要的步骤消息
+                    step_messages = [message for step in steps[summarized_upto:] for message in self._step_messages(step)]
+                messages = list(base_messages)
+                # 较早步骤已被压缩为摘要
+                if history_summary:
+                    messages.append({"role": "user", "content": f"此前步骤摘要：{history_summary}"})
+                messages.extend(step_messages)
+                system_prompt_end_time = time.time()
+                system_prompt_times.append((system_prompt_end_time - system_prompt_start_time) * 1000)
+
+                print("message信息：\n", flush=True)
+
+                # 将完整message信息写入调试文件
+                try:
+                    with open('/home/libo/chatapi/debug_messages.log', 'a', encoding='utf-8') as f:
+                        f.write(f"\n{'='*80}\n")
+                        f.write(f"迭代 {iteration} - message信息\n")
+                        f.write(f"{'='*80}\n")
+                        f.write(json_dumps_pretty(messages))
+                        f.write("\n\n")
+                except Exception as e:
+                    print(f"写入message信息失败: {e}")
+
+                # 打印message信息到server.log（结构完整，content可截断）
+                try:
+                    # 深度复制messages以避免修改原始数据
+                    messages_to_print = json_loads(json_dumps(messages))
+
+                    # 对content字段进行截断处理（保留结构）
+                    for msg in messages_to_print:
+                        if 'content' in msg and isinstance(msg['content'], list):
+                            for content_item in msg['content']:
+                                if isinstance(content_item, dict) and 'text' in content_item:
+                                    text = content_item['text']
+                                    if isinstance(text, str) and len(text) > 2000:
+                                        content_item['text'] = text[:2000] + "...[内容已截断]"
+                                elif isinstance(content_item, dict) and 'image_url' in content_item:
+                                    # 图像URL也进行截断
+                                    image_url = content_item['image_url']
+                                    if isinstance(image_url, dict) and 'url' in image_url:
+                                        url = image_url['url']
+                                        if isinstance(url, str) and len(url) > 100:
+                                            image_url['url'] = url[:100] + "...[URL已截断]"
+
+                    # 打印处理后的messages（结构完整但内容可能截断）
+                    print(json_dumps_pretty(messages_to_print))
+                    print(f"\n... [message的content内容可以截断但message的结构不能省略] ...\n")
+                except Exception as e:
+                    print(f"打印message信息失败: {e}")
+
+                # ========== 模型调用 ==========
+                # 流式读取时，action 一完整就提前发起只读工具调用（与模型生成剩余内容重叠）
+                early_key, early_task = None, None
+
+                def on_action(action: Dict[str, Any]):
+                    nonlocal early_key, early_task
+                    tool_name = action.get("tool")
+                    if early_task is not None or not self._can_prefetch(tool_name):
+                        return
+                    tool_args = action.get("args", {})
+                    early_key = _action_key(tool_name, tool_args)
+                    early_task = asyncio.create_task(self._execute_tool(tool_name, tool_args or {}, current_user_id))
+                    print(f"[ReAct] 模型输出未结束，提前调用工具: {tool_name}")
+
+                model_call_start_time = time.time()
+                model_output = await self._call_model(messages, on_action if settings.react_stream_actions else None)
+                model_call_end_time = time.time()
+                model_call_duration = (model_call_end_time - model_call_start_time) * 1000
+                model_call_times.append(model_call_duration)
+                # ========== 模型调用 ==========
+
+                thought = model_output.get("thought", "")
+                print(f"[THOUGHT]: {thought[:200]}...", flush=True)
+
+                # 记录思考和行动步骤：模型一次给出多个工具调用时，每个调用对应一个行动步骤（保持模型给出的顺序）
+                action_steps = []
+                for action in self._expand_actions(model_output):
+                    tool_name = action.get("tool", "finish")
+                    tool_args = action.get("args", {})
+                    print(f"[ACTION]: {tool_name} -> {tool_args}", flush=True)
+                    action_steps.append(ReActStep(
+                        iteration=iteration,
+                        step_type="action",
+                        content={"thought": thought, "action": action},
+                        tool_name=tool_name,
+                        tool_args=tool_args
+                    ))
+
+                # 预测调用 / 流式提前发起的调用与模型最终给出的调用一致时复用其结果，其余取消
+                speculative_results = None
+                prefetched = [(key, task) for key, task in ((early_key, early_task), (spec_key, spec_task)) if task is not None]
+                if prefetched:
+                    final_key = _action_key(action_steps[0].tool_name, action_steps[0].tool_args) if len(action_steps) == 1 else None
+                    for key, task in prefetched:
+                        if speculative_results is None and key == final_key:
+                            print(f"[ReAct] 复用提前发起的工具调用: {key[0]}")
+                            speculative_results = [await task]
+                        else:
+                            task.cancel()
+                    spec_key, spec_task = None, None
+
+                # Step 2: 检查是否完成（finish 只会单独出现）
+                if action_steps[0].tool_name == "finish":
+                    action_step = action_steps[0]
+                    tool_name = action_step.tool_name
+                    tool_args = action_step.tool_args
+                    steps.append(action_step)
+                    final_answer = tool_args.get("answer", "")
+                    print(f"[FINISH]: {final_answer[:200]}...")
+
+                    # 为finish工具创建观察步骤（虽然内部工具不需要执行，但需要记录）
+                    tool_result = {"success": True, "result": {"answer": final_answer}}
+                    action_step.tool_result = tool_result
+
+                    # 记录观察步骤
+                    obs_step = ReActStep(
+                        iteration=iteration,
+                        step_type="observation",
+                        content=tool_result,
+                        tool_name=tool_name,
+                        tool_result=tool_result
+                    )
+                    steps.append(obs_step)
+
+                    # === 特殊处理：finish工具不输出start事件，直接输出final_answer ===
+                    # ========== 计算总时间并写入日志 ==========
+                    request_end_time = time.time()
+                    total_request_time = (request_end_time - request_start_time) * 1000
+                    total_model_time = sum(model_call_times)
+                    total_tool_time = sum(tool_execution_times)
+
+                    # 写入时间统计日志
+                    self._write_time_log({
+                        "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+                        "user_id": current_user_id or "unknown",
+                        "query": query[:100] + "..." if len(query) > 100 else query,
+                        "iterations": iteration,
+                        "chat_history_time_ms": round(chat_history_time, 2),
+                        "system_prompt_times_ms": [round(t, 2) for t in system_prompt_times],
+                        "model_call_times_ms": [round(t, 2) for t in model_call_times],
+                        "total_model_time_ms": round(total_model_time, 2),
+                        "tool_execution_times_ms": [round(t, 2) for t in tool_execution_times],
+                        "total_tool_time_ms": round(total_tool_time, 2),
+                        "total_request_time_ms": round(total_request_time, 2),
+                        "success": True
+                    }, pretty_format=True)
+                    # ========== 计算总时间并写入日志 ==========
+
+                    result = {
+                        "answer": final_answer,
+                        "steps": [s.to_dict() for s in steps],
+                        "iterations": iteration,
+                        "success": True,
+                        "type": "final_answer"
+                    }
+                    # 模型输出解析失败时的兜底答案不缓存
+                    if answer_cache_key is not None and model_output.get("success"):
+                        self._store_cached_answer(answer_cache_key, steps, result)
+
+                    yield {"query": query, **result}
+                    return
+
+                # === 对于非finish工具，在step开始时立即yield start事件 ===
+                for action_step in action_steps:
+                    yield {
+                        "iteration": iteration,
+                        "type": "start",
+                        "action": action_step.to_dict()
+                    }
 
-            # Step 1: 构建对话并调用模型
-            # 统计系统提示词构建时间（包含在构建对话过程中）
-            system_prompt_start_time = time.time()
-            messages = self._build_conversation(query, steps, image_urls, user_metadata, chat_history)
-            system_prompt_end_time = time.time()
-            system_prompt_times.append((system_prompt_end_time - system_prompt_start_time) * 1000)
+                # Step 3: 执行工具（多个工具调用并发执行，结果与调用一一对应）
+                # ========== 工具执行 ==========
+                tool_execution_start_time = time.time()
+                tool_results = speculative_results or await self._execute_tools(
+                    [(step.tool_name, step.tool_args) for step in action_steps], current_user_id
+                )
+                tool_execution_end_time = time.time()
+                tool_execution_duration = (tool_execution_end_time - tool_execution_start_time) * 1000
+                tool_execution_times.append(tool_execution_duration)
+                # ========== 工具执行 ==========
+
+                for action_step, tool_result in zip(action_steps, tool_results):
+                    observation_json = json_dumps(tool_result)
+                    print(f"[OBSERVATION]: {observation_json[:200]}...")
+
+                    # 将tool_result添加到action步骤中，这样main.py可以获取到
+                    action_step.tool_result = tool_result
+
+                    # 记录观察步骤（紧跟对应的行动步骤，保证 action/observation 成对）
+                    obs_step = ReActStep(
+                        iteration=iteration,
+                        step_type="observation",
+                        content=tool_result,
+                        tool_name=action_step.tool_name,
+                        tool_result=tool_result
+                    )
+                    steps.append(action_step)
+                    steps.append(obs_step)
+                    step_messages.extend(self._step_messages(action_step))
+                    step_messages.extend(self._step_messages(obs_step))
+                    observation_tokens.append((len(steps) - 1, _estimate_tokens(observation_json)))
+
+                    # === 工具执行结束时yield结果 ===
+                    yield {
+                        "iteration": iteration,
+                        "type": "result",
+                        "action": action_step.to_dict(),
+                        "observation": obs_step.to_dict()
+                    }
 
-            print("message信息：\n", flush=True)
+                # 更新转移频率，并在等待下一轮模型输出期间提前发起预测的工具调用（仅单个调用的轮次参与）
+                action_key = None
+                if len(action_steps) == 1:
+                    action_key = _action_key(action_steps[0].tool_name, action_steps[0].tool_args)
+                    if prev_action_key is not None:
+                        self._record_transition(prev_action_key, action_key)
+                    if settings.react_speculative_tools:
+                        spec_key, spec_task = self._speculate(action_key, current_user_id)
+                prev_action_key = action_key
 
-            # 将完整message信息写入调试文件
-            try:
-                with open('/home/libo/chatapi/debug_messages.log', 'a', encoding='utf-8') as f:
-                    f.write(f"\n{'='*80}\n")
-                    f.write(f"迭代 {iteration} - message信息\n")
-                    f.write(f"{'='*80}\n")
-                    f.write(json.dumps(messages, ensure_ascii=False, indent=2))
-                    f.write("\n\n")
-            except Exception as e:
-                print(f"写入message信息失败: {e}")
+            else:
+                # 达到最大迭代次数
+                final_answer = "抱歉，处理超时，无法完成任务。"
 
-            # 打印message信息到server.log（结构完整，content可截断）
-            try:
-                # 深度复制messages以避免修改原始数据
-                messages_to_print = json.loads(json.dumps(messages))
-
-                # 对content字段进行截断处理（保留结构）
-                for msg in messages_to_print:
-                    if 'content' in msg and isinstance(msg['content'], list):
-                        for content_item in msg['content']:
-                            if isinstance(content_item, dict) and 'text' in content_item:
-                                text = content_item['text']
-                                if isinstance(text, str) and len(text) > 2000:
-                                    content_item['text'] = text[:2000] + "...[内容已截断]"
-                            elif isinstance(content_item, dict) and 'image_url' in content_item:
-                                # 图像URL也进行截断
-                                image_url = content_item['image_url']
-                                if isinstance(image_url, dict) and 'url' in image_url:
-                                    url = image_url['url']
-                                    if isinstance(url, str) and len(url) > 100:
-                                        image_url['url'] = url[:100] + "...[URL已截断]"
-
-                # 打印处理后的messages（结构完整但内容可能截断）
-                print(json.dumps(messages_to_print, ensure_ascii=False, indent=2))
-                print(f"\n... [message的content内容可以截断但message的结构不能省略] ...\n")
-            except Exception as e:
-                print(f"打印message信息失败: {e}")
-
-            # ========== 模型调用 ==========
-            model_call_start_time = time.time()
-            model_output = await self._call_model(messages)
-            model_call_end_time = time.time()
-            model_call_duration = (model_call_end_time - model_call_start_time) * 1000
-            model_call_times.append(model_call_duration)
-            # ========== 模型调用 ==========
-
-            thought = model_output.get("thought", "")
-            action = model_output.get("action", {})
-            tool_name = action.get("tool", "finish")
-            tool_args = action.get("args", {})
-
-            print(f"[THOUGHT]: {thought[:200]}...", flush=True)
-            print(f"[ACTION]: {tool_name} -> {tool_args}", flush=True)
-
-            # 记录思考和行动步骤
-            action_step = ReActStep(
-                iteration=iteration,
-                step_type="action",
-                content={"thought": thought, "action": action},
-                tool_name=tool_name,
-                tool_args=tool_args
-            )
-            steps.append(action_step)
-
-            # Step 2: 检查是否完成
-            if tool_name == "finish":
-                final_answer = tool_args.get("answer", "")
-                print(f"[FINISH]: {final_answer[:200]}...")
-
-                # 为finish工具创建观察步骤（虽然内部工具不需要执行，但需要记录）
-                tool_result = {"success": True, "result": {"answer": final_answer}}
-                action_step.tool_result = tool_result
-
-                # 记录观察步骤
-                obs_step = ReActStep(
-                    iteration=iteration,
-                    step_type="observation",
-                    content=tool_result,
-                    tool_name=tool_name,
-                    tool_result=tool_result
-                )
-                steps.append(obs_step)
+                print(f"\n{'='*60}")
+                print(f"[ReAct] 完成，共 {iteration} 次迭代")
+                print(f"[最终答案]: {final_answer}")
+                print(f"{'='*60}\n")
 
-                # === 特殊处理：finish工具不输出start事件，直接输出final_answer ===
-                # ========== 计算总时间并写入日志 ==========
+                # ========== 计算总时间并写入日志（超时情况）==========
                 request_end_time = time.time()
                 total_request_time = (request_end_time - request_start_time) * 1000
                 total_model_time = sum(model_call_times)
@@ -1134,102 +1679,27 @@ class TrueReActAgent:
                     "tool_execution_times_ms": [round(t, 2) for t in tool_execution_times],
                     "total_tool_time_ms": round(total_tool_time, 2),
                     "total_request_time_ms": round(total_request_time, 2),
-                    "success": True
-                }, pretty_format=True)
-                # ========== 计算总时间并写入日志 ==========
+                    "success": False,
+                    "timeout": True
+                })
+                # ========== 计算总时间并写入日志（超时情况）==========
 
+                # 流式输出：超时结果
                 yield {
                     "query": query,
                     "answer": final_answer,
                     "steps": [s.to_dict() for s in steps],
                     "iterations": iteration,
-                    "success": True,
+                    "success": False,
                     "type": "final_answer"
                 }
                 return
-
-            # === 对于非finish工具，在step开始时立即yield start事件 ===
-            yield {
-                "iteration": iteration,
-                "type": "start",
-                "action": action_step.to_dict()
-            }
-
-            # Step 3: 执行工具
-            # ========== 工具执行 ==========
-            tool_execution_start_time = time.time()
-            tool_result = await self._execute_tool(tool_name, tool_args, current_user_id)
-            tool_execution_end_time = time.time()
-            tool_execution_duration = (tool_execution_end_time - tool_execution_start_time) * 1000
-            tool_execution_times.append(tool_execution_duration)
-            # ========== 工具执行 ==========
-
-            print(f"[OBSERVATION]: {json.dumps(tool_result, ensure_ascii=False)[:200]}...")
-
-            # 将tool_result添加到action步骤中，这样main.py可以获取到
-            action_step.tool_result = tool_result
-
-            # 记录观察步骤
-            obs_step = ReActStep(
-                iteration=iteration,
-                step_type="observation",
-                content=tool_result,
-                tool_name=tool_name,
-                tool_result=tool_result
-            )
-            steps.append(obs_step)
-
-            # === 工具执行结束时yield结果 ===
-            yield {
-                "iteration": iteration,
-                "type": "result",
-                "action": action_step.to_dict(),
-                "observation": obs_step.to_dict()
-            }
-
-        else:
-            # 达到最大迭代次数
-            final_answer = "抱歉，处理超时，无法完成任务。"
-
-            print(f"\n{'='*60}")
-            print(f"[ReAct] 完成，共 {iteration} 次迭代")
-            print(f"[最终答案]: {final_answer}")
-            print(f"{'='*60}\n")
-
-            # ========== 计算总时间并写入日志（超时情况）==========
-            request_end_time = time.time()
-            total_request_time = (request_end_time - request_start_time) * 1000
-            total_model_time = sum(model_call_times)
-            total_tool_time = sum(tool_execution_times)
-
-            # 写入时间统计日志
-            self._write_time_log({
-                "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
-                "user_id": current_user_id or "unknown",
-                "query": query[:100] + "..." if len(query) > 100 else query,
-                "iterations": iteration,
-                "chat_history_time_ms": round(chat_history_time, 2),
-                "system_prompt_times_ms": [round(t, 2) for t in system_prompt_times],
-                "model_call_times_ms": [round(t, 2) for t in model_call_times],
-                "total_model_time_ms": round(total_model_time, 2),
-                "tool_execution_times_ms": [round(t, 2) for t in tool_execution_times],
-                "total_tool_time_ms": round(total_tool_time, 2),
-                "total_request_time_ms": round(total_request_time, 2),
-                "success": False,
-                "timeout": True
-            })
-            # ========== 计算总时间并写入日志（超时情况）==========
-
-            # 流式输出：超时结果
-            yield {
-                "query": query,
-                "answer": final_answer,
-                "steps": [s.to_dict() for s in steps],
-                "iterations": iteration,
-                "success": False,
-                "type": "final_answer"
-            }
-            return
+        finally:
+            # 生成器被关闭（客户端断开）或中途抛出异常（如 _call_model 失败）时，
+            # 取消尚未使用的预测调用和提前发起的调用
+            for task in (spec_task, early_task):
+                if task is not None:
+                    task.cancel()
 
     def _write_time_log(self, time_stats: Dict[str, Any], pretty_format: bool = False):
         """
@@ -1247,13 +1717,13 @@ class TrueReActAgent:
                     f.write('{\n')
                     for i, (key, value) in enumerate(time_stats.items()):
                         if i == len(time_stats) - 1:
-                            f.write(f'  "{key}": {json.dumps(value, ensure_ascii=False)}\n')
+                            f.write(f'  "{key}": {json_dumps(value)}\n')
                         else:
-                            f.write(f'  "{key}": {json.dumps(value, ensure_ascii=False)},\n')
+                            f.write(f'  "{key}": {json_dumps(value)},\n')
                     f.write('}\n\n')
                 else:
                     # 紧凑格式：一行显示
-                    f.write(json.dumps(time_stats, ensure_ascii=False) + '\n\n')
+                    f.write(json_dumps(time_stats) + '\n\n')
         except Exception as e:
             print(f"写入时间统计日志失败: {e}")
 
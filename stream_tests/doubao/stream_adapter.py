@@ -65,12 +65,12 @@ class DoubaoStreamTester(BaseStreamTester):
                 # 处理SSE流
                 async for line in resp.content:
                     if line:
-                        line = line.decode('utf-8').strip()
-                        if line.startswith('data: '):
-                            data = line[6:]
-                            if data == '[DONE]':
+                        # 直接在字节上判断前缀，只解码 data 负载，其余行（event/id/keepalive）不做解码
+                        if line.startswith(b'data: '):
+                            data = line[6:].rstrip()
+                            if data == b'[DONE]':
                                 break
-                            yield data
+                            yield data.decode('utf-8')
 
     def extract_content_from_chunk(self, chunk: str) -> str:
         """从流式数据块中提取内容"""